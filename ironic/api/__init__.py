@@ -29,6 +29,20 @@ API_SERVICE_OPTS = [
                default=1000,
                help='The maximum number of items returned in a single '
                     'response from a collection resource'),
+    cfg.IntOpt('stream_min_limit',
+               default=0,
+               help='The number of items from which the nodes and ports '
+                    'requested from a collection resource are streamed to '
+                    'the client as they are read from the database, '
+                    'rather than serialized at once. They are read by '
+                    'one query per 100 items, since drivers such as '
+                    'MySQLdb buffer the whole result of a query. '
+                    'Streamed responses have no entity tag. 0 disables '
+                    'streaming'),
+    cfg.IntOpt('prefetch_status_timeout',
+               default=10,
+               help='Time, in seconds, to wait for the conductors to '
+                    'report the status of an image prefetch'),
     ]
 
 CONF = cfg.CONF
@@ -47,7 +47,9 @@ def setup_app(pecan_config=None, extra_hooks=None):
     app_hooks = [hooks.ConfigHook(),
                  hooks.DBHook(),
                  hooks.ContextHook(pecan_config.app.acl_public_routes),
-                 hooks.RPCHook()]
+                 hooks.RPCHook(),
+                 hooks.NotModifiedHook(),
+                 hooks.StreamHook()]
     if extra_hooks:
         app_hooks.extend(extra_hooks)
 
@@ -36,6 +36,7 @@ from ironic.api.controllers.v1 import driver
 from ironic.api.controllers.v1 import link
 from ironic.api.controllers.v1 import node
 from ironic.api.controllers.v1 import port
+from ironic.api.controllers.v1 import prefetch
 
 
 class MediaType(base.APIBase):
@@ -115,6 +116,7 @@ class Controller(rest.RestController):
     ports = port.PortsController()
     chassis = chassis.ChassisController()
     drivers = driver.DriversController()
+    prefetch = prefetch.PrefetchController()
 
     @wsme_pecan.wsexpose(V1)
     def get(self):
@@ -32,8 +32,9 @@ class APIBase(wtypes.Base):
         """Convert a RPC object to an API object."""
         obj_dict = m.as_dict()
         # Unset non-required fields so they do not appear
-        # in the message body
+        # in the message body; an object loaded with only some of its
+        # fields does not have the others in its dict.
         obj_dict.update(dict((k, wsme.Unset)
-                        for k in obj_dict.keys()
+                        for k in m.fields
                         if fields and k not in fields))
         return cls(**obj_dict)
@@ -0,0 +1,97 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pecan
+from wsme import types as wtypes
+
+from ironic.api.controllers.v1 import base
+from ironic.api.controllers.v1 import link
+from ironic.common import exception
+
+
+class BulkItem(base.APIBase):
+    """API representation of the outcome of one item of a bulk request."""
+
+    uuid = wtypes.text
+    "The UUID of the created resource"
+
+    error = wtypes.text
+    "Why the item could not be created"
+
+    links = [link.Link]
+    "A list containing a self link and a bookmark link to the resource"
+
+    @classmethod
+    def convert_with_links(cls, resource, result):
+        if isinstance(result, exception.IronicException):
+            return BulkItem(error=result.format_message())
+        return BulkItem(uuid=result.uuid,
+                        links=[link.Link.make_link('self',
+                                                   pecan.request.host_url,
+                                                   resource, result.uuid),
+                               link.Link.make_link('bookmark',
+                                                   pecan.request.host_url,
+                                                   resource, result.uuid,
+                                                   bookmark=True)])
+
+
+class BulkResult(base.APIBase):
+    """API representation of the outcome of a bulk create request.
+
+    Items are reported in the order they were submitted; an item either
+    has the uuid of the resource created for it, or an error.
+    """
+
+    created = int
+    "The number of resources created"
+
+    failed = int
+    "The number of items which could not be created"
+
+    items = [BulkItem]
+    "The outcome of each item"
+
+    @classmethod
+    def convert_with_links(cls, resource, results):
+        items = [BulkItem.convert_with_links(resource, r) for r in results]
+        failed = len([i for i in items if i.error])
+        return BulkResult(created=len(items) - failed, failed=failed,
+                          items=items)
+
+
+def create(values_list, check, create_many):
+    """Create the items of a bulk request which pass a check, in one batch.
+
+    :param values_list: A list of dicts, one for each item.
+    :param check: A callable raising Invalid for an item which must not
+                  be created.
+    :param create_many: The dbapi method creating the remaining items.
+    :returns: A list holding, for each item, the new object or the
+              exception which prevented its creation.
+    """
+    results = [None] * len(values_list)
+    pending = []
+    for i, values in enumerate(values_list):
+        try:
+            check(values)
+        except exception.Invalid as e:
+            results[i] = e
+            continue
+        pending.append(i)
+
+    created = create_many([values_list[i] for i in pending])
+    for i, result in zip(pending, created):
+        results[i] = result
+    return results
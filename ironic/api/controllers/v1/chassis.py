@@ -28,6 +28,7 @@ import wsmeext.pecan as wsme_pecan
 
 from ironic.api.controllers.v1 import base
 from ironic.api.controllers.v1 import collection
+from ironic.api.controllers.v1 import etag
 from ironic.api.controllers.v1 import link
 from ironic.api.controllers.v1 import node
 from ironic.api.controllers.v1 import utils
@@ -38,6 +39,9 @@ from ironic.openstack.common import log
 
 LOG = log.getLogger(__name__)
 
+# The attributes shown in the list of chassis without detail.
+MINIMUM_FIELDS = ['uuid', 'description']
+
 
 class Chassis(base.APIBase):
     """API representation of a chassis.
@@ -69,26 +73,33 @@ class Chassis(base.APIBase):
             setattr(self, k, kwargs.get(k))
 
     @classmethod
-    def convert_with_links(cls, rpc_chassis, expand=True):
-        fields = ['uuid', 'description'] if not expand else None
+    def convert_with_links(cls, rpc_chassis, expand=True, fields=None):
+        """Convert a chassis, with links.
+
+        :param fields: The attributes to show, instead of those chosen by
+                       expand.
+        """
+        if fields is None and not expand:
+            fields = MINIMUM_FIELDS + ['links']
         chassis = Chassis.from_rpc_object(rpc_chassis, fields)
-        chassis.links = [link.Link.make_link('self',
-                                             pecan.request.host_url,
-                                             'chassis', chassis.uuid),
-                         link.Link.make_link('bookmark',
-                                             pecan.request.host_url,
-                                             'chassis', chassis.uuid)
-                        ]
-
-        if expand:
+        if fields is None or 'links' in fields:
+            chassis.links = [link.Link.make_link('self',
+                                                 pecan.request.host_url,
+                                                 'chassis', rpc_chassis.uuid),
+                             link.Link.make_link('bookmark',
+                                                 pecan.request.host_url,
+                                                 'chassis', rpc_chassis.uuid)
+                            ]
+
+        if fields is None or 'nodes' in fields:
             chassis.nodes = [link.Link.make_link('self',
                                                  pecan.request.host_url,
                                                  'chassis',
-                                                 chassis.uuid + "/nodes"),
+                                                 rpc_chassis.uuid + "/nodes"),
                              link.Link.make_link('bookmark',
                                                  pecan.request.host_url,
                                                  'chassis',
-                                                 chassis.uuid + "/nodes",
+                                                 rpc_chassis.uuid + "/nodes",
                                                  bookmark=True)
                             ]
         return chassis
@@ -105,12 +116,16 @@ class ChassisCollection(collection.Collection):
 
     @classmethod
     def convert_with_links(cls, chassis, limit, url=None,
-                           expand=False, **kwargs):
+                           expand=False, fields=None, **kwargs):
+        if fields is not None:
+            kwargs['fields'] = ','.join(fields)
         collection = ChassisCollection()
-        collection.chassis = [Chassis.convert_with_links(ch, expand)
+        collection.chassis = [Chassis.convert_with_links(ch, expand, fields)
                               for ch in chassis]
         url = url or None
-        collection.next = collection.get_next(limit, url=url, **kwargs)
+        last = chassis[-1] if chassis else None
+        collection.next = collection.get_next(limit, url=url, last=last,
+                                              **kwargs)
         return collection
 
 
@@ -124,49 +139,89 @@ class ChassisController(rest.RestController):
         'detail': ['GET'],
     }
 
-    def _get_chassis(self, marker, limit, sort_key, sort_dir):
+    def _get_chassis(self, marker, limit, sort_key, sort_dir, cursor=None,
+                     columns=None):
         limit = utils.validate_limit(limit)
         sort_dir = utils.validate_sort_dir(sort_dir)
         marker_obj = None
-        if marker:
+        if cursor:
+            marker_obj = utils.decode_cursor(cursor)
+        elif marker:
             marker_obj = objects.Chassis.get_by_uuid(pecan.request.context,
                                                      marker)
-        chassis = pecan.request.dbapi.get_chassis_list(limit, marker_obj,
-                                                       sort_key=sort_key,
-                                                       sort_dir=sort_dir)
-        return chassis
+        if columns is not None:
+            if sort_key in objects.Chassis.fields:
+                # the sort key of the last chassis goes into the next link
+                columns = columns + [sort_key]
+        return pecan.request.dbapi.get_all_chassis(columns, limit, marker_obj,
+                                                   sort_key=sort_key,
+                                                   sort_dir=sort_dir)
 
-    @wsme_pecan.wsexpose(ChassisCollection, wtypes.text,
-                         int, wtypes.text, wtypes.text)
-    def get_all(self, marker=None, limit=None, sort_key='id', sort_dir='asc'):
-        """Retrieve a list of chassis."""
-        chassis = self._get_chassis(marker, limit, sort_key, sort_dir)
+    @wsme_pecan.wsexpose(ChassisCollection, wtypes.text, int,
+                         wtypes.text, wtypes.text, wtypes.text, wtypes.text)
+    def get_all(self, marker=None, limit=None, sort_key='id', sort_dir='asc',
+                cursor=None, fields=None):
+        """Retrieve a list of chassis.
+
+        :param fields: a comma separated list of the attributes to show,
+                       instead of the default ones.
+        """
+        fields = utils.validate_fields(fields, Chassis)
+        # only load the columns shown
+        if fields is None:
+            columns = MINIMUM_FIELDS
+        else:
+            columns = utils.get_columns(fields, objects.Chassis)
+        chassis = self._get_chassis(marker, limit, sort_key, sort_dir,
+                                    cursor, columns)
+        response = etag.not_modified(etag.collection_etag(chassis))
+        if response is not None:
+            return response
         return ChassisCollection.convert_with_links(chassis, limit,
+                                                    fields=fields,
                                                     sort_key=sort_key,
                                                     sort_dir=sort_dir)
 
     @wsme_pecan.wsexpose(ChassisCollection, wtypes.text, int,
-                         wtypes.text, wtypes.text)
-    def detail(self, marker=None, limit=None, sort_key='id', sort_dir='asc'):
+                         wtypes.text, wtypes.text, wtypes.text, wtypes.text)
+    def detail(self, marker=None, limit=None, sort_key='id', sort_dir='asc',
+               cursor=None, fields=None):
         """Retrieve a list of chassis with detail."""
         # /detail should only work agaist collections
         parent = pecan.request.path.split('/')[:-1][-1]
         if parent != "chassis":
             raise exception.HTTPNotFound
 
-        chassis = self._get_chassis(marker, limit, sort_key, sort_dir)
+        fields = utils.validate_fields(fields, Chassis)
+        columns = None
+        if fields is not None:
+            columns = utils.get_columns(fields, objects.Chassis)
+        chassis = self._get_chassis(marker, limit, sort_key, sort_dir,
+                                    cursor, columns)
+        response = etag.not_modified(etag.collection_etag(chassis))
+        if response is not None:
+            return response
         resource_url = '/'.join(['chassis', 'detail'])
         return ChassisCollection.convert_with_links(chassis, limit,
                                                     url=resource_url,
                                                     expand=True,
+                                                    fields=fields,
                                                     sort_key=sort_key,
                                                     sort_dir=sort_dir)
 
-    @wsme_pecan.wsexpose(Chassis, wtypes.text)
-    def get_one(self, uuid):
-        """Retrieve information about the given chassis."""
+    @wsme_pecan.wsexpose(Chassis, wtypes.text, wtypes.text)
+    def get_one(self, uuid, fields=None):
+        """Retrieve information about the given chassis.
+
+        :param fields: a comma separated list of the attributes to show,
+                       instead of all of them.
+        """
+        fields = utils.validate_fields(fields, Chassis)
         rpc_chassis = objects.Chassis.get_by_uuid(pecan.request.context, uuid)
-        return Chassis.convert_with_links(rpc_chassis)
+        response = etag.not_modified(etag.object_etag(rpc_chassis))
+        if response is not None:
+            return response
+        return Chassis.convert_with_links(rpc_chassis, fields=fields)
 
     @wsme_pecan.wsexpose(Chassis, body=Chassis)
     def post(self, chassis):
@@ -182,6 +237,7 @@ class ChassisController(rest.RestController):
     def patch(self, uuid, patch):
         """Update an existing chassis."""
         chassis = objects.Chassis.get_by_uuid(pecan.request.context, uuid)
+        expected = etag.check_if_match(chassis)
         chassis_dict = chassis.as_dict()
 
         utils.validate_patch(patch)
@@ -207,7 +263,11 @@ class ChassisController(rest.RestController):
             if chassis[key] != patched_chassis[key]:
                 chassis[key] = patched_chassis[key]
 
-        chassis.save()
+        try:
+            chassis.save(expected=expected)
+        except exception.ChassisUpdateConflict:
+            # the chassis was modified after it was checked against If-Match
+            raise exception.PreconditionFailed(resource=uuid)
         return Chassis.convert_with_links(chassis)
 
     @wsme_pecan.wsexpose(None, wtypes.text, status_code=204)
@@ -17,10 +17,13 @@
 #    under the License.
 
 import pecan
+import six
+from six.moves.urllib import parse
 from wsme import types as wtypes
 
 from ironic.api.controllers.v1 import base
 from ironic.api.controllers.v1 import link
+from ironic.api.controllers.v1 import utils
 
 
 class Collection(base.APIBase):
@@ -32,20 +35,41 @@ class Collection(base.APIBase):
     def collection(self):
         return getattr(self, self._type)
 
-    def has_next(self, limit):
-        """Return whether collection has more items."""
-        return len(self.collection) and len(self.collection) == limit
+    def has_next(self, limit, count=None):
+        """Return whether collection has more items.
 
-    def get_next(self, limit, url=None, **kwargs):
-        """Return a link to the next subset of the collection."""
-        if not self.has_next(limit):
+        :param count: the number of items of the collection, when they were
+                      streamed rather than kept in it.
+        """
+        if count is None:
+            count = len(self.collection)
+        return count and count == limit
+
+    def get_next(self, limit, url=None, last=None, count=None, **kwargs):
+        """Return a link to the next subset of the collection.
+
+        :param last: the DB object of the last item of the collection. The
+                     link resumes after it with a cursor when given, with
+                     a marker otherwise.
+        :param count: the number of items of the collection, when they were
+                      streamed rather than kept in it.
+        """
+        if not self.has_next(limit, count):
             return wtypes.Unset
 
         resource_url = url or self._type
-        q_args = ''.join(['%s=%s&' % (key, kwargs[key]) for key in kwargs])
-        next_args = '?%(args)slimit=%(limit)d&marker=%(marker)s' % {
+        # filter values such as 'power on' need quoting
+        q_args = ''.join(['%s=%s&' % (key, parse.quote(
+                              six.text_type(value).encode('utf-8')))
+                          for key, value in kwargs.items()])
+        if last is not None:
+            position = 'cursor=%s' % utils.encode_cursor(
+                                            last, kwargs.get('sort_key', 'id'))
+        else:
+            position = 'marker=%s' % self.collection[-1].uuid
+        next_args = '?%(args)slimit=%(limit)d&%(position)s' % {
                                             'args': q_args, 'limit': limit,
-                                            'marker': self.collection[-1].uuid}
+                                            'position': position}
 
         return link.Link.make_link('next', pecan.request.host_url,
                                    resource_url, next_args).href
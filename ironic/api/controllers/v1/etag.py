@@ -0,0 +1,115 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Entity tags and conditional requests.
+
+The tag of an object is made from the values of its columns, and the tag
+of a page of a collection from those of its items and the URL of the
+page; both are computed from the DB objects, so that a request matching
+If-None-Match is answered with 304 Not Modified before the API objects
+are built.
+
+An object has the same tag whichever of its attributes are shown, so
+that the tag of any GET of the object can be sent with If-Match to
+update it. The items of a page only load the columns shown, and the tag
+of the page only changes with those.
+
+An update matching If-Match is only written if the object still has the
+values it was checked with, so that of two updates sent with the same
+tag, only the first is made.
+"""
+
+import hashlib
+
+import pecan
+import six
+import webob
+import wsme
+
+from ironic.common import exception
+from ironic.objects import base
+from ironic.openstack.common import jsonutils
+
+
+# NOTE: the write of a checked object does not compare its identity and
+#       timestamps, nor the reservation of a node, which the conductor takes
+#       to write it (and which also changes its updated_at).
+_UNCHECKED_FIELDS = frozenset(['id', 'uuid', 'created_at', 'updated_at',
+                               'reservation'])
+
+
+def _make_etag(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(six.text_type(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _version(obj):
+    # NOTE: the values rather than the time the object was changed, which
+    #       MySQL keeps to the second: two updates within the same second
+    #       must not give the same tag.
+    parts = []
+    for name in sorted(obj.fields):
+        if hasattr(obj, base.get_attrname(name)):
+            # only the columns loaded by a projected query
+            value = getattr(obj, name)
+            parts.extend((name, jsonutils.dumps(value, sort_keys=True)))
+    return parts
+
+
+def object_etag(obj):
+    """Return the entity tag of a DB object."""
+    return _make_etag(*_version(obj))
+
+
+def collection_etag(objs):
+    """Return the entity tag of a page of DB objects, for this request."""
+    parts = [pecan.request.path_qs]
+    for obj in objs:
+        parts.extend(_version(obj))
+    return _make_etag(*parts)
+
+
+def not_modified(etag):
+    """Set the ETag of the response, and check it against If-None-Match.
+
+    :param etag: the entity tag of the resource.
+    :returns: a 304 Not Modified response when the client already has
+              this version of the resource, otherwise None.
+    """
+    pecan.response.etag = etag
+    if etag in pecan.request.if_none_match:
+        return wsme.api.Response(None, status_code=304)
+
+
+def check_if_match(obj):
+    """Check that a DB object was not modified since the client read it.
+
+    :param obj: the object about to be updated.
+    :returns: None if the request has no If-Match header, otherwise the
+              values of the object to save it with as ``expected``, so
+              that it is not written if it changes after this check.
+    :raises: PreconditionFailed if the request has an If-Match header
+             which does not list the entity tag of the object.
+    """
+    if pecan.request.if_match is webob.etag.AnyETag:
+        return None
+    if object_etag(obj) not in pecan.request.if_match:
+        raise exception.PreconditionFailed(resource=obj.uuid)
+    return dict((name, obj[name]) for name in obj.fields
+                if name not in _UNCHECKED_FIELDS and
+                hasattr(obj, base.get_attrname(name)))
@@ -26,12 +26,17 @@ from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
 from ironic.api.controllers.v1 import base
+from ironic.api.controllers.v1 import bulk
 from ironic.api.controllers.v1 import collection
+from ironic.api.controllers.v1 import etag
 from ironic.api.controllers.v1 import link
 from ironic.api.controllers.v1 import port
 from ironic.api.controllers.v1 import state
+from ironic.api.controllers.v1 import streaming
 from ironic.api.controllers.v1 import utils
 from ironic.common import exception
+from ironic.common import states
+from ironic.common import utils as ironic_utils
 from ironic import objects
 from ironic.openstack.common import excutils
 from ironic.openstack.common import log
@@ -80,19 +85,32 @@ class NodePowerStateController(rest.RestController):
                          status_code=202)
     def put(self, node_id, target):
         """Set the power state of the machine."""
-        node = objects.Node.get_by_uuid(pecan.request.context, node_id)
-        if node.target_power_state is not None:
+        #TODO(lucasagomes): Test if it's able to transition to the target
+        # state from the current one
+        if target not in (states.POWER_ON, states.POWER_OFF, states.REBOOT):
+            raise wsme.exc.ClientSideError(_("Invalid power state %s.") %
+                                           target)
+
+        # Claim the power operation by setting the target power state, in
+        # a single statement which only succeeds if no other operation is
+        # in progress. The conductor clears it when it is done; a claim no
+        # conductor took is cleared by their periodic task.
+        dbapi = pecan.request.dbapi
+        try:
+            node = dbapi.update_node(node_id, {'target_power_state': target},
+                                     expected={'target_power_state': None})
+        except exception.NodeUpdateConflict:
             raise wsme.exc.ClientSideError(_("Power operation for node %s is "
                                              "already in progress.") %
-                                              node['uuid'], status_code=409)
-        #TODO(lucasagomes): Test if target is a valid state and if it's able
-        # to transition to the target state from the current one
+                                              node_id, status_code=409)
 
-        # Note that there is a race condition. The node state(s) could change
-        # by the time the RPC call is made and the TaskManager manager gets a
-        # lock.
-        pecan.request.rpcapi.change_node_power_state(pecan.request.context,
-                                                     node, target)
+        try:
+            pecan.request.rpcapi.change_node_power_state(
+                                        pecan.request.context, node, target)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                dbapi.update_node(node_id, {'target_power_state': None},
+                                  expected={'target_power_state': target})
         return NodePowerState.convert_with_links(node, expand=False)
 
 
@@ -173,6 +191,13 @@ class NodeStatesController(rest.RestController):
         return state
 
 
+# The fields of a node listed without detail.
+MINIMUM_FIELDS = ['uuid', 'power_state', 'target_power_state',
+                  'provision_state', 'target_provision_state',
+                  'last_error',
+                  'instance_uuid']
+
+
 class Node(base.APIBase):
     """API representation of a bare metal node.
 
@@ -231,33 +256,43 @@ class Node(base.APIBase):
             setattr(self, k, kwargs.get(k))
 
     @classmethod
-    def convert_with_links(cls, rpc_node, expand=True):
-        minimum_fields = ['uuid', 'power_state', 'target_power_state',
-                          'provision_state', 'target_provision_state',
-                          'last_error',
-                          'instance_uuid']
-        fields = minimum_fields if not expand else None
+    def convert_with_links(cls, rpc_node, expand=True, chassis_uuids=None,
+                           fields=None):
+        """Convert a node, with links.
+
+        :param chassis_uuids: A dict mapping chassis ids to UUIDs, used
+                              instead of looking the chassis of the node up.
+        :param fields: The attributes to show, instead of those chosen by
+                       expand.
+        """
+        if fields is None and not expand:
+            fields = MINIMUM_FIELDS + ['links']
         node = Node.from_rpc_object(rpc_node, fields)
 
         # translate id -> uuid
         if node.chassis_id and isinstance(node.chassis_id, six.integer_types):
-            chassis_obj = objects.Chassis.get_by_uuid(pecan.request.context,
-                                                      node.chassis_id)
-            node.chassis_id = chassis_obj.uuid
-
-        node.links = [link.Link.make_link('self', pecan.request.host_url,
-                                          'nodes', node.uuid),
-                      link.Link.make_link('bookmark',
-                                          pecan.request.host_url,
-                                          'nodes', node.uuid,
-                                          bookmark=True)
-                     ]
-        if expand:
+            if chassis_uuids is not None:
+                node.chassis_id = chassis_uuids[node.chassis_id]
+            else:
+                chassis_obj = objects.Chassis.get_by_uuid(
+                                    pecan.request.context, node.chassis_id)
+                node.chassis_id = chassis_obj.uuid
+
+        uuid = rpc_node.uuid
+        if fields is None or 'links' in fields:
+            node.links = [link.Link.make_link('self', pecan.request.host_url,
+                                              'nodes', uuid),
+                          link.Link.make_link('bookmark',
+                                              pecan.request.host_url,
+                                              'nodes', uuid,
+                                              bookmark=True)
+                         ]
+        if fields is None or 'ports' in fields:
             node.ports = [link.Link.make_link('self', pecan.request.host_url,
-                                              'nodes', node.uuid + "/ports"),
+                                              'nodes', uuid + "/ports"),
                           link.Link.make_link('bookmark',
                                               pecan.request.host_url,
-                                              'nodes', node.uuid + "/ports",
+                                              'nodes', uuid + "/ports",
                                               bookmark=True)
                          ]
         return node
@@ -272,14 +307,44 @@ class NodeCollection(collection.Collection):
     def __init__(self, **kwargs):
         self._type = 'nodes'
 
+    @staticmethod
+    def _convert_nodes(nodes, expand, fields):
+        chassis_uuids = None
+        if (expand and fields is None) or 'chassis_id' in (fields or []):
+            # look the chassis of the whole page up at once
+            chassis_uuids = pecan.request.dbapi.get_chassis_uuids(
+                                    [n.chassis_id for n in nodes
+                                     if n.chassis_id is not None])
+        return [Node.convert_with_links(n, expand, chassis_uuids, fields)
+                for n in nodes]
+
     @classmethod
     def convert_with_links(cls, nodes, limit, url=None,
-                           expand=False, **kwargs):
+                           expand=False, fields=None, **kwargs):
+        if fields is not None:
+            kwargs['fields'] = ','.join(fields)
         collection = NodeCollection()
-        collection.nodes = [Node.convert_with_links(n, expand) for n in nodes]
-        collection.next = collection.get_next(limit, url=url, **kwargs)
+        collection.nodes = cls._convert_nodes(nodes, expand, fields)
+        last = nodes[-1] if nodes else None
+        collection.next = collection.get_next(limit, url=url, last=last,
+                                              **kwargs)
         return collection
 
+    @classmethod
+    def stream_with_links(cls, nodes, limit, url=None,
+                          expand=False, fields=None, **kwargs):
+        """Stream the collection convert_with_links() would make.
+
+        :param nodes: an iterator over the nodes, which are converted in
+                      batches.
+        """
+        if fields is not None:
+            kwargs['fields'] = ','.join(fields)
+        streaming.stream(NodeCollection(), Node, nodes,
+                         lambda batch: cls._convert_nodes(batch, expand,
+                                                          fields),
+                         limit, url=url, **kwargs)
+
 
 class NodeVendorPassthruController(rest.RestController):
     """REST controller for VendorPassthru.
@@ -318,67 +383,78 @@ class NodesController(rest.RestController):
 
     _custom_actions = {
         'detail': ['GET'],
+        'bulk': ['POST'],
     }
 
     def __init__(self, from_chassis=False):
         self._from_chassis = from_chassis
 
     def _get_nodes(self, chassis_id, instance_uuid, associated, marker, limit,
-                   sort_key, sort_dir):
+                   sort_key, sort_dir, cursor=None, columns=None,
+                   filters=None, stream=False):
         if self._from_chassis and not chassis_id:
             raise exception.InvalidParameterValue(_(
                   "Chassis id not specified."))
 
         limit = utils.validate_limit(limit)
         sort_dir = utils.validate_sort_dir(sort_dir)
+        if sort_key not in objects.Node.fields:
+            # the next link is made from the sort key of the last node, the
+            # capacity columns are not node attributes
+            raise wsme.exc.ClientSideError(_("Invalid sort key: %s. Nodes "
+                                             "can only be sorted by one of "
+                                             "their attributes.") % sort_key)
 
         marker_obj = None
-        if marker:
+        if cursor:
+            marker_obj = utils.decode_cursor(cursor)
+        elif marker:
             marker_obj = objects.Node.get_by_uuid(pecan.request.context,
                                                   marker)
 
+        filters = dict(filters or {})
         if chassis_id:
-            nodes = pecan.request.dbapi.get_nodes_by_chassis(chassis_id, limit,
-                                                             marker_obj,
-                                                             sort_key=sort_key,
-                                                             sort_dir=sort_dir)
+            filters['chassis_id'] = chassis_id
         elif instance_uuid:
-            nodes = self._get_nodes_by_instance(instance_uuid)
+            filters['instance_uuid'] = instance_uuid
         elif associated:
-            nodes = self._get_nodes_by_instance_association(associated,
-                                                   limit, marker_obj,
-                                                   sort_key, sort_dir)
-        else:
-            nodes = pecan.request.dbapi.get_node_list(limit, marker_obj,
-                                                      sort_key=sort_key,
-                                                      sort_dir=sort_dir)
-        return nodes
-
-    def _get_nodes_by_instance(self, instance_uuid):
-        """Retrieve a node by its instance uuid.
-
-        It returns a list with the node, or an empty list if no node is found.
-        """
-        try:
-            node = pecan.request.dbapi.get_node_by_instance(instance_uuid)
-            return [node]
-        except exception.InstanceNotFound:
-            return []
-
-    def _get_nodes_by_instance_association(self, associated, limit, marker_obj,
-                                           sort_key, sort_dir):
-        """Retrieve nodes by instance association."""
-        if associated.lower() == 'true':
-            nodes = pecan.request.dbapi.get_associated_nodes(limit,
-                        marker_obj, sort_key=sort_key, sort_dir=sort_dir)
-        elif associated.lower() == 'false':
-            nodes = pecan.request.dbapi.get_unassociated_nodes(limit,
-                        marker_obj, sort_key=sort_key, sort_dir=sort_dir)
-        else:
-            raise wsme.exc.ClientSideError(_(
-                    "Invalid parameter value: %s, 'associated' "
-                    "can only be true or false.") % associated)
-        return nodes
+            filters['associated'] = self._check_bool('associated',
+                                                     associated)
+
+        if columns is not None:
+            # the sort key of the last node goes into the next link
+            columns = columns + [sort_key]
+        return pecan.request.dbapi.get_nodes(columns, filters, limit,
+                                             marker_obj, sort_key=sort_key,
+                                             sort_dir=sort_dir, stream=stream)
+
+    def _check_bool(self, name, value):
+        if value.lower() == 'true':
+            return True
+        elif value.lower() == 'false':
+            return False
+        raise wsme.exc.ClientSideError(_(
+                "Invalid parameter value: %(value)s, '%(name)s' "
+                "can only be true or false.") % {'value': value, 'name': name})
+
+    def _list_filters(self, driver, power_state, provision_state,
+                      reservation, has_last_error, cpu_arch, min_cpus,
+                      max_cpus, min_memory_mb, max_memory_mb, min_local_gb,
+                      max_local_gb):
+        filters = {'driver': driver,
+                   'power_state': power_state,
+                   'provision_state': provision_state,
+                   'reservation': reservation,
+                   'cpu_arch': cpu_arch,
+                   'min_cpus': min_cpus, 'max_cpus': max_cpus,
+                   'min_memory_mb': min_memory_mb,
+                   'max_memory_mb': max_memory_mb,
+                   'min_local_gb': min_local_gb,
+                   'max_local_gb': max_local_gb}
+        if has_last_error:
+            filters['has_last_error'] = self._check_bool('has_last_error',
+                                                         has_last_error)
+        return dict((k, v) for k, v in filters.items() if v is not None)
 
     def _convert_chassis_uuid_to_id(self, node_dict):
         # NOTE(lucasagomes): translate uuid -> id, used internally to
@@ -389,48 +465,124 @@ class NodesController(rest.RestController):
             node_dict['chassis_id'] = chassis_obj.id
 
     @wsme_pecan.wsexpose(NodeCollection, wtypes.text, wtypes.text,
-               wtypes.text, wtypes.text, int, wtypes.text, wtypes.text)
+               wtypes.text, wtypes.text, int, wtypes.text, wtypes.text,
+               wtypes.text, wtypes.text, wtypes.text, wtypes.text,
+               wtypes.text, wtypes.text, wtypes.text, int, int, int, int,
+               int, int, wtypes.text)
     def get_all(self, chassis_id=None, instance_uuid=None, associated=None,
-                marker=None, limit=None, sort_key='id', sort_dir='asc'):
-        """Retrieve a list of nodes."""
+                marker=None, limit=None, sort_key='id', sort_dir='asc',
+                cursor=None, driver=None, power_state=None,
+                provision_state=None, reservation=None, has_last_error=None,
+                cpu_arch=None, min_cpus=None, max_cpus=None,
+                min_memory_mb=None, max_memory_mb=None, min_local_gb=None,
+                max_local_gb=None, fields=None):
+        """Retrieve a list of nodes.
+
+        The nodes may be filtered on their driver, power and provision
+        states, the conductor holding their reservation and whether they
+        have a last error; and on the hardware properties used to
+        schedule instances: an architecture and bounds of the number of
+        cpus, the memory and the local disk size.
+
+        :param fields: a comma separated list of the attributes to show,
+                       instead of the default ones.
+        """
+        fields = utils.validate_fields(fields, Node)
+        filters = self._list_filters(driver, power_state, provision_state,
+                                     reservation, has_last_error, cpu_arch,
+                                     min_cpus, max_cpus, min_memory_mb,
+                                     max_memory_mb, min_local_gb,
+                                     max_local_gb)
+        # only load the columns shown
+        if fields is None:
+            columns = MINIMUM_FIELDS
+        else:
+            columns = utils.get_columns(fields, objects.Node)
+        stream = streaming.wanted(utils.validate_limit(limit))
         nodes = self._get_nodes(chassis_id, instance_uuid, associated, marker,
-                                limit, sort_key, sort_dir)
-
-        parameters = {'sort_key': sort_key, 'sort_dir': sort_dir}
+                                limit, sort_key, sort_dir, cursor,
+                                columns=columns, filters=filters,
+                                stream=stream)
+        parameters = dict(filters, sort_key=sort_key, sort_dir=sort_dir)
         if associated:
             parameters['associated'] = associated.lower()
-        return NodeCollection.convert_with_links(nodes, limit, **parameters)
+        if stream:
+            NodeCollection.stream_with_links(nodes, limit, fields=fields,
+                                             **parameters)
+            return
+
+        response = etag.not_modified(etag.collection_etag(nodes))
+        if response is not None:
+            return response
+        return NodeCollection.convert_with_links(nodes, limit, fields=fields,
+                                                 **parameters)
 
     @wsme_pecan.wsexpose(NodeCollection, wtypes.text, wtypes.text,
-            wtypes.text, wtypes.text, int, wtypes.text, wtypes.text)
+            wtypes.text, wtypes.text, int, wtypes.text, wtypes.text,
+            wtypes.text, wtypes.text, wtypes.text, wtypes.text, wtypes.text,
+            wtypes.text, wtypes.text, int, int, int, int, int, int,
+            wtypes.text)
     def detail(self, chassis_id=None, instance_uuid=None, associated=None,
-               marker=None, limit=None, sort_key='id', sort_dir='asc'):
+               marker=None, limit=None, sort_key='id', sort_dir='asc',
+               cursor=None, driver=None, power_state=None,
+               provision_state=None, reservation=None, has_last_error=None,
+               cpu_arch=None, min_cpus=None, max_cpus=None,
+               min_memory_mb=None, max_memory_mb=None, min_local_gb=None,
+               max_local_gb=None, fields=None):
         """Retrieve a list of nodes with detail."""
         # /detail should only work agaist collections
         parent = pecan.request.path.split('/')[:-1][-1]
         if parent != "nodes":
             raise exception.HTTPNotFound
 
+        filters = self._list_filters(driver, power_state, provision_state,
+                                     reservation, has_last_error, cpu_arch,
+                                     min_cpus, max_cpus, min_memory_mb,
+                                     max_memory_mb, min_local_gb,
+                                     max_local_gb)
+        fields = utils.validate_fields(fields, Node)
+        columns = None
+        if fields is not None:
+            columns = utils.get_columns(fields, objects.Node)
+        stream = streaming.wanted(utils.validate_limit(limit))
         nodes = self._get_nodes(chassis_id, instance_uuid, associated,
-                                marker, limit, sort_key, sort_dir)
+                                marker, limit, sort_key, sort_dir, cursor,
+                                columns=columns, filters=filters,
+                                stream=stream)
         resource_url = '/'.join(['nodes', 'detail'])
-
-        parameters = {'sort_key': sort_key, 'sort_dir': sort_dir}
+        parameters = dict(filters, sort_key=sort_key, sort_dir=sort_dir)
         if associated:
             parameters['associated'] = associated.lower()
+        if stream:
+            NodeCollection.stream_with_links(nodes, limit, url=resource_url,
+                                             expand=True, fields=fields,
+                                             **parameters)
+            return
+
+        response = etag.not_modified(etag.collection_etag(nodes))
+        if response is not None:
+            return response
         return NodeCollection.convert_with_links(nodes, limit,
                                                  url=resource_url,
-                                                 expand=True,
+                                                 expand=True, fields=fields,
                                                  **parameters)
 
-    @wsme_pecan.wsexpose(Node, wtypes.text)
-    def get_one(self, uuid):
-        """Retrieve information about the given node."""
+    @wsme_pecan.wsexpose(Node, wtypes.text, wtypes.text)
+    def get_one(self, uuid, fields=None):
+        """Retrieve information about the given node.
+
+        :param fields: a comma separated list of the attributes to show,
+                       instead of all of them.
+        """
         if self._from_chassis:
             raise exception.OperationNotPermitted
 
+        fields = utils.validate_fields(fields, Node)
         rpc_node = objects.Node.get_by_uuid(pecan.request.context, uuid)
-        return Node.convert_with_links(rpc_node)
+        response = etag.not_modified(etag.object_etag(rpc_node))
+        if response is not None:
+            return response
+        return Node.convert_with_links(rpc_node, fields=fields)
 
     @wsme_pecan.wsexpose(Node, body=Node)
     def post(self, node):
@@ -448,6 +600,39 @@ class NodesController(rest.RestController):
                 LOG.exception(e)
         return Node.convert_with_links(new_node)
 
+    @staticmethod
+    def _check_bulk_node(node_dict):
+        uuid = node_dict['uuid']
+        if uuid and not ironic_utils.is_uuid_like(uuid):
+            raise exception.InvalidUUID(uuid=uuid)
+        chassis_id = node_dict['chassis_id']
+        if chassis_id and not (ironic_utils.is_int_like(chassis_id) or
+                               ironic_utils.is_uuid_like(chassis_id)):
+            raise exception.InvalidIdentity(identity=chassis_id)
+
+    @wsme_pecan.wsexpose(bulk.BulkResult, body=[Node])
+    def bulk(self, nodes):
+        """Create many nodes at once.
+
+        Each node is checked on its own, and the valid ones are created
+        together; the result tells which nodes were created.
+
+        :param nodes: a list of nodes, as accepted by post().
+        """
+        if self._from_chassis:
+            raise exception.OperationNotPermitted
+        if not nodes:
+            raise wsme.exc.ClientSideError(_("No nodes to create"))
+
+        try:
+            results = bulk.create([n.as_dict() for n in nodes],
+                                  self._check_bulk_node,
+                                  pecan.request.dbapi.create_nodes)
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                LOG.exception(e)
+        return bulk.BulkResult.convert_with_links('nodes', results)
+
     @wsme_pecan.wsexpose(Node, wtypes.text, body=[wtypes.text])
     def patch(self, uuid, patch):
         """Update an existing node."""
@@ -455,6 +640,7 @@ class NodesController(rest.RestController):
             raise exception.OperationNotPermitted
 
         node = objects.Node.get_by_uuid(pecan.request.context, uuid)
+        expected = etag.check_if_match(node)
         node_dict = node.as_dict()
 
         utils.validate_patch(patch)
@@ -502,8 +688,11 @@ class NodesController(rest.RestController):
                     node[key] = patched_node[key]
 
             node = pecan.request.rpcapi.update_node(pecan.request.context,
-                                                    node)
+                                                    node, expected=expected)
 
+        except exception.NodeUpdateConflict:
+            # the node was modified after it was checked against If-Match
+            raise exception.PreconditionFailed(resource=uuid)
         except exception.IronicException as e:
             with excutils.save_and_reraise_exception():
                 LOG.exception(e)
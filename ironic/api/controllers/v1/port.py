@@ -26,8 +26,11 @@ from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
 from ironic.api.controllers.v1 import base
+from ironic.api.controllers.v1 import bulk
 from ironic.api.controllers.v1 import collection
+from ironic.api.controllers.v1 import etag
 from ironic.api.controllers.v1 import link
+from ironic.api.controllers.v1 import streaming
 from ironic.api.controllers.v1 import utils as api_utils
 from ironic.common import exception
 from ironic.common import utils
@@ -37,6 +40,9 @@ from ironic.openstack.common import log
 
 LOG = log.getLogger(__name__)
 
+# The attributes shown in the list of ports without detail.
+MINIMUM_FIELDS = ['uuid', 'address']
+
 
 class Port(base.APIBase):
     """API representation of a port.
@@ -63,23 +69,36 @@ class Port(base.APIBase):
             setattr(self, k, kwargs.get(k))
 
     @classmethod
-    def convert_with_links(cls, rpc_port, expand=True):
-        fields = ['uuid', 'address'] if not expand else None
+    def convert_with_links(cls, rpc_port, expand=True, fields=None,
+                           node_uuids=None):
+        """Convert a port, with links.
+
+        :param fields: The attributes to show, instead of those chosen by
+                       expand.
+        :param node_uuids: A dict mapping node ids to UUIDs, used instead
+                           of looking the node of the port up.
+        """
+        if fields is None and not expand:
+            fields = MINIMUM_FIELDS + ['links']
         port = Port.from_rpc_object(rpc_port, fields)
 
         # translate id -> uuid
         if port.node_id and isinstance(port.node_id, six.integer_types):
-            node_obj = objects.Node.get_by_uuid(pecan.request.context,
-                                                port.node_id)
-            port.node_id = node_obj.uuid
-
-        port.links = [link.Link.make_link('self', pecan.request.host_url,
-                                          'ports', port.uuid),
-                      link.Link.make_link('bookmark',
-                                          pecan.request.host_url,
-                                          'ports', port.uuid,
-                                          bookmark=True)
-                     ]
+            if node_uuids is not None:
+                port.node_id = node_uuids[port.node_id]
+            else:
+                node_obj = objects.Node.get_by_uuid(pecan.request.context,
+                                                    port.node_id)
+                port.node_id = node_obj.uuid
+
+        if fields is None or 'links' in fields:
+            port.links = [link.Link.make_link('self', pecan.request.host_url,
+                                              'ports', rpc_port.uuid),
+                          link.Link.make_link('bookmark',
+                                              pecan.request.host_url,
+                                              'ports', rpc_port.uuid,
+                                              bookmark=True)
+                         ]
         return port
 
 
@@ -92,48 +111,87 @@ class PortCollection(collection.Collection):
     def __init__(self, **kwargs):
         self._type = 'ports'
 
+    @staticmethod
+    def _convert_ports(ports, expand, fields):
+        node_uuids = None
+        if (expand and fields is None) or 'node_id' in (fields or []):
+            # look the nodes of the whole page up at once
+            node_uuids = pecan.request.dbapi.get_node_uuids(
+                                    [p.node_id for p in ports
+                                     if p.node_id is not None])
+        return [Port.convert_with_links(p, expand, fields, node_uuids)
+                for p in ports]
+
     @classmethod
     def convert_with_links(cls, ports, limit, url=None,
-                           expand=False, **kwargs):
+                           expand=False, fields=None, **kwargs):
+        if fields is not None:
+            kwargs['fields'] = ','.join(fields)
         collection = PortCollection()
-        collection.ports = [Port.convert_with_links(p, expand) for p in ports]
-        collection.next = collection.get_next(limit, url=url, **kwargs)
+        collection.ports = cls._convert_ports(ports, expand, fields)
+        last = ports[-1] if ports else None
+        collection.next = collection.get_next(limit, url=url, last=last,
+                                              **kwargs)
         return collection
 
+    @classmethod
+    def stream_with_links(cls, ports, limit, url=None,
+                          expand=False, fields=None, **kwargs):
+        """Stream the collection convert_with_links() would make.
+
+        :param ports: an iterator over the ports, which are converted in
+                      batches.
+        """
+        if fields is not None:
+            kwargs['fields'] = ','.join(fields)
+        streaming.stream(PortCollection(), Port, ports,
+                         lambda batch: cls._convert_ports(batch, expand,
+                                                          fields),
+                         limit, url=url, **kwargs)
+
 
 class PortsController(rest.RestController):
     """REST controller for Ports."""
 
     _custom_actions = {
         'detail': ['GET'],
+        'bulk': ['POST'],
     }
 
     def __init__(self, from_nodes=False):
         self._from_nodes = from_nodes
 
-    def _get_ports(self, node_id, marker, limit, sort_key, sort_dir):
+    def _get_ports(self, node_id, marker, limit, sort_key, sort_dir,
+                   cursor=None, columns=None, stream=False):
         if self._from_nodes and not node_id:
             raise exception.InvalidParameterValue(_(
                   "Node id not specified."))
 
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
+        if sort_key not in objects.Port.fields:
+            # the next link is made from the sort key of the last port
+            raise wsme.exc.ClientSideError(_("Invalid sort key: %s. Ports "
+                                             "can only be sorted by one of "
+                                             "their attributes.") % sort_key)
 
         marker_obj = None
-        if marker:
+        if cursor:
+            marker_obj = api_utils.decode_cursor(cursor)
+        elif marker:
             marker_obj = objects.Port.get_by_uuid(pecan.request.context,
                                                   marker)
 
+        filters = {}
         if node_id:
-            ports = pecan.request.dbapi.get_ports_by_node(node_id, limit,
-                                                          marker_obj,
-                                                          sort_key=sort_key,
-                                                          sort_dir=sort_dir)
-        else:
-            ports = pecan.request.dbapi.get_port_list(limit, marker_obj,
-                                                      sort_key=sort_key,
-                                                      sort_dir=sort_dir)
-        return ports
+            filters['node_id'] = node_id
+
+        if columns is not None:
+            # the sort key of the last port goes into the next link
+            columns = columns + [sort_key]
+        return pecan.request.dbapi.get_ports(columns, filters, limit,
+                                             marker_obj, sort_key=sort_key,
+                                             sort_dir=sort_dir, stream=stream)
 
     def _convert_node_uuid_to_id(self, port_dict):
         # NOTE(lucasagomes): translate uuid -> id, used internally to
@@ -167,41 +225,86 @@ class PortsController(rest.RestController):
             pass
 
     @wsme_pecan.wsexpose(PortCollection, wtypes.text, wtypes.text, int,
-                         wtypes.text, wtypes.text)
+                         wtypes.text, wtypes.text, wtypes.text, wtypes.text)
     def get_all(self, node_id=None, marker=None, limit=None,
-                sort_key='id', sort_dir='asc'):
-        """Retrieve a list of ports."""
-        ports = self._get_ports(node_id, marker, limit, sort_key, sort_dir)
-        return PortCollection.convert_with_links(ports, limit,
+                sort_key='id', sort_dir='asc', cursor=None, fields=None):
+        """Retrieve a list of ports.
+
+        :param fields: a comma separated list of the attributes to show,
+                       instead of the default ones.
+        """
+        fields = api_utils.validate_fields(fields, Port)
+        # only load the columns shown
+        if fields is None:
+            columns = MINIMUM_FIELDS
+        else:
+            columns = api_utils.get_columns(fields, objects.Port)
+        stream = streaming.wanted(api_utils.validate_limit(limit))
+        ports = self._get_ports(node_id, marker, limit, sort_key, sort_dir,
+                                cursor, columns, stream)
+        if stream:
+            PortCollection.stream_with_links(ports, limit, fields=fields,
+                                             sort_key=sort_key,
+                                             sort_dir=sort_dir)
+            return
+
+        response = etag.not_modified(etag.collection_etag(ports))
+        if response is not None:
+            return response
+        return PortCollection.convert_with_links(ports, limit, fields=fields,
                                                  sort_key=sort_key,
                                                  sort_dir=sort_dir)
 
     @wsme_pecan.wsexpose(PortCollection, wtypes.text, wtypes.text, int,
-                         wtypes.text, wtypes.text)
+                         wtypes.text, wtypes.text, wtypes.text, wtypes.text)
     def detail(self, node_id=None, marker=None, limit=None,
-                sort_key='id', sort_dir='asc'):
+                sort_key='id', sort_dir='asc', cursor=None, fields=None):
         """Retrieve a list of ports."""
         # NOTE(lucasagomes): /detail should only work agaist collections
         parent = pecan.request.path.split('/')[:-1][-1]
         if parent != "ports":
             raise exception.HTTPNotFound
 
-        ports = self._get_ports(node_id, marker, limit, sort_key, sort_dir)
+        fields = api_utils.validate_fields(fields, Port)
+        columns = None
+        if fields is not None:
+            columns = api_utils.get_columns(fields, objects.Port)
+        stream = streaming.wanted(api_utils.validate_limit(limit))
+        ports = self._get_ports(node_id, marker, limit, sort_key, sort_dir,
+                                cursor, columns, stream)
         resource_url = '/'.join(['ports', 'detail'])
+        if stream:
+            PortCollection.stream_with_links(ports, limit, url=resource_url,
+                                             expand=True, fields=fields,
+                                             sort_key=sort_key,
+                                             sort_dir=sort_dir)
+            return
+
+        response = etag.not_modified(etag.collection_etag(ports))
+        if response is not None:
+            return response
         return PortCollection.convert_with_links(ports, limit,
                                                  url=resource_url,
-                                                 expand=True,
+                                                 expand=True, fields=fields,
                                                  sort_key=sort_key,
                                                  sort_dir=sort_dir)
 
-    @wsme_pecan.wsexpose(Port, wtypes.text)
-    def get_one(self, uuid):
-        """Retrieve information about the given port."""
+    @wsme_pecan.wsexpose(Port, wtypes.text, wtypes.text)
+    def get_one(self, uuid, fields=None):
+        """Retrieve information about the given port.
+
+        :param fields: a comma separated list of the attributes to show,
+                       instead of all of them.
+        """
         if self._from_nodes:
             raise exception.OperationNotPermitted
 
+        fields = api_utils.validate_fields(fields, Port)
         rpc_port = objects.Port.get_by_uuid(pecan.request.context, uuid)
-        return Port.convert_with_links(rpc_port)
+        response = etag.not_modified(etag.object_etag(rpc_port))
+        if response is not None:
+            return response
+        return Port.convert_with_links(rpc_port, fields=fields)
 
     @wsme_pecan.wsexpose(Port, body=Port)
     def post(self, port):
@@ -228,6 +331,45 @@ class PortsController(rest.RestController):
                 LOG.exception(e)
         return Port.convert_with_links(new_port)
 
+    @staticmethod
+    def _check_bulk_port(port_dict):
+        missing_attr = [attr for attr in ['address', 'node_id']
+                        if not port_dict[attr]]
+        if missing_attr:
+            raise exception.InvalidParameterValue(
+                    err=_("Missing %s attribute(s)") % ', '.join(missing_attr))
+        if not utils.is_valid_mac(port_dict['address']):
+            raise exception.InvalidMAC(mac=port_dict['address'])
+        uuid = port_dict['uuid']
+        if uuid and not utils.is_uuid_like(uuid):
+            raise exception.InvalidUUID(uuid=uuid)
+        node_id = port_dict['node_id']
+        if not (utils.is_int_like(node_id) or utils.is_uuid_like(node_id)):
+            raise exception.InvalidIdentity(identity=node_id)
+
+    @wsme_pecan.wsexpose(bulk.BulkResult, body=[Port])
+    def bulk(self, ports):
+        """Create many ports at once.
+
+        Each port is checked on its own, and the valid ones are created
+        together; the result tells which ports were created.
+
+        :param ports: a list of ports, as accepted by post().
+        """
+        if self._from_nodes:
+            raise exception.OperationNotPermitted
+        if not ports:
+            raise wsme.exc.ClientSideError(_("No ports to create"))
+
+        try:
+            results = bulk.create([p.as_dict() for p in ports],
+                                  self._check_bulk_port,
+                                  pecan.request.dbapi.create_ports)
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                LOG.exception(e)
+        return bulk.BulkResult.convert_with_links('ports', results)
+
     @wsme_pecan.wsexpose(Port, wtypes.text, body=[wtypes.text])
     def patch(self, uuid, patch):
         """Update an existing port."""
@@ -235,6 +377,7 @@ class PortsController(rest.RestController):
             raise exception.OperationNotPermitted
 
         port = objects.Port.get_by_uuid(pecan.request.context, uuid)
+        expected = etag.check_if_match(port)
         port_dict = port.as_dict()
 
         api_utils.validate_patch(patch)
@@ -273,7 +416,11 @@ class PortsController(rest.RestController):
             if port[key] != patched_port[key]:
                 port[key] = patched_port[key]
 
-        port.save()
+        try:
+            port.save(expected=expected)
+        except exception.PortUpdateConflict:
+            # the port was modified after it was checked against If-Match
+            raise exception.PreconditionFailed(resource=uuid)
         return Port.convert_with_links(port)
 
     @wsme_pecan.wsexpose(None, wtypes.text, status_code=204)
@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import eventlet
+import pecan
+from pecan import rest
+
+import wsme
+from wsme import types as wtypes
+import wsmeext.pecan as wsme_pecan
+
+from ironic.api.controllers.v1 import base
+from ironic.common import exception
+from ironic.common import utils
+from ironic.openstack.common import log
+from ironic.openstack.common.rpc import common as rpc_common
+from oslo.config import cfg
+
+CONF = cfg.CONF
+
+LOG = log.getLogger(__name__)
+
+
+class PrefetchImage(base.APIBase):
+    """API representation of an image prefetched by a conductor."""
+
+    image_ref = wtypes.text
+    "The reference of the image in the image service"
+
+    kind = wtypes.Enum(str, 'tftp', 'instance')
+    "Where the image goes: tftp for kernels and ramdisks, or instance"
+
+    conductor = wtypes.text
+    "The hostname of the conductor fetching the image"
+
+    status = wtypes.text
+    "One of queued, fetching, cached or failed"
+
+    error = wtypes.text
+    "Why the image could not be fetched"
+
+
+class Prefetch(base.APIBase):
+    """API representation of an image prefetch.
+
+    Every conductor fetches the images of a prefetch into its own image
+    caches, so each image is listed once per conductor.
+    """
+
+    uuid = wtypes.text
+    "The UUID of the prefetch"
+
+    images = [PrefetchImage]
+    "The images to fetch, and their status on each conductor"
+
+
+class PrefetchController(rest.RestController):
+    """REST controller for image prefetches."""
+
+    @wsme_pecan.wsexpose(Prefetch, wtypes.text)
+    def get_one(self, prefetch_uuid):
+        """Retrieve the status of a prefetch on every active conductor.
+
+        :param prefetch_uuid: UUID of a prefetch.
+        """
+        context = pecan.request.context
+        rpcapi = pecan.request.rpcapi
+        hosts = pecan.request.dbapi.list_active_conductors(
+                                     interval=CONF.conductor.max_time_interval)
+
+        def get_status(host):
+            try:
+                return rpcapi.get_prefetch_status(
+                                context, prefetch_uuid, host,
+                                timeout=CONF.api.prefetch_status_timeout)
+            except exception.PrefetchNotFound:
+                return []
+            except rpc_common.Timeout:
+                LOG.warn(_("Conductor %(host)s did not report the status of "
+                           "prefetch %(prefetch)s.") %
+                         {'host': host, 'prefetch': prefetch_uuid})
+                return []
+
+        # the conductors are asked at once, a slow one only delays the
+        # answer by the timeout
+        hosts = sorted(hosts)
+        pool = eventlet.GreenPool(len(hosts) or 1)
+        images = []
+        for host, status in zip(hosts, pool.imap(get_status, hosts)):
+            images.extend(PrefetchImage(conductor=host, **image)
+                          for image in status)
+
+        if not images:
+            raise exception.PrefetchNotFound(prefetch=prefetch_uuid)
+        return Prefetch(uuid=prefetch_uuid, images=images)
+
+    @wsme_pecan.wsexpose(Prefetch, body=Prefetch, status_code=202)
+    def post(self, prefetch):
+        """Ask every conductor to fetch images into its image caches.
+
+        :param prefetch: a prefetch listing the image_ref and kind of the
+                         images to fetch.
+        """
+        if not prefetch.images:
+            raise wsme.exc.ClientSideError(_("No images to prefetch"))
+        for image in prefetch.images:
+            if not image.image_ref or not image.kind:
+                raise wsme.exc.ClientSideError(
+                    _("Images to prefetch need an image_ref and a kind"))
+
+        prefetch_uuid = utils.generate_uuid()
+        images = [{'image_ref': image.image_ref, 'kind': image.kind}
+                  for image in prefetch.images]
+        pecan.request.rpcapi.prefetch_images(pecan.request.context,
+                                             prefetch_uuid, images)
+        return Prefetch(uuid=prefetch_uuid,
+                        images=[PrefetchImage(status='queued', **image)
+                                for image in images])
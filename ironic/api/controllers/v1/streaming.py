@@ -0,0 +1,123 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Streaming of the JSON document of large collections.
+
+A streamed collection is serialized to the same document as when it is
+built at once, but its items are read from the database and converted in
+batches while the response is sent, so that memory does not grow with the
+size of the page.
+"""
+
+import itertools
+import json
+
+from oslo.config import cfg
+import pecan
+from pecan import core
+from wsme.rest import json as wsme_json
+
+CONF = cfg.CONF
+
+# The number of items converted at once.
+_BATCH_SIZE = 100
+
+_UNBOUND = object()
+
+
+def wanted(limit):
+    """Return whether a page of a collection of limit items is streamed."""
+    min_limit = CONF.api.stream_min_limit
+    return bool(min_limit) and limit >= min_limit
+
+
+def stream(collection, item_type, objs, convert, limit, url=None, **kwargs):
+    """Stream the JSON document of a collection as the response body.
+
+    :param collection: an empty collection of the streamed type.
+    :param item_type: the API type of the items.
+    :param objs: an iterator over the DB objects of the items.
+    :param convert: a callable converting a list of DB objects to their
+                    API objects.
+    :param limit: the limit of the page, to make its next link.
+    :param url: the url of the next link, as for Collection.get_next().
+    """
+    chunks = _chunks(collection, item_type, objs, convert, limit, url,
+                     kwargs)
+    # the chunks are sent by hooks.StreamHook
+    pecan.request.stream_chunks = _Chunks(core.state.request, chunks)
+
+
+def _chunks(collection, item_type, objs, convert, limit, url, kwargs):
+    try:
+        yield '{"%s": [' % collection._type
+        count = 0
+        last = None
+        while True:
+            batch = list(itertools.islice(objs, _BATCH_SIZE))
+            if not batch:
+                break
+            items = [json.dumps(wsme_json.tojson(item_type, item))
+                     for item in convert(batch)]
+            yield (', ' if count else '') + ', '.join(items)
+            count += len(batch)
+            last = batch[-1]
+    finally:
+        # the objects are read by queries of their own, none is left
+        # running when the client goes away
+        close = getattr(objs, 'close', None)
+        if close is not None:
+            close()
+
+    next_link = collection.get_next(limit, url=url, last=last, count=count,
+                                    **kwargs)
+    if next_link:
+        yield '], "next": %s}' % json.dumps(next_link)
+    else:
+        yield ']}'
+
+
+class _Chunks(object):
+    """The chunks of a streamed document, as the body of the response.
+
+    The chunks are made with the request of pecan bound, as in a
+    controller: pecan releases its request once the controller returned,
+    before the body is iterated, and the items are converted with links
+    made from the request and looked up through its dbapi.
+
+    The WSGI server closes the body when the client goes away before its
+    end, which stops reading the items.
+    """
+
+    def __init__(self, request, chunks):
+        self._request = request
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        previous = getattr(core.state, 'request', _UNBOUND)
+        core.state.request = self._request
+        try:
+            return next(self._chunks)
+        finally:
+            if previous is _UNBOUND:
+                del core.state.request
+            else:
+                core.state.request = previous
+
+    def close(self):
+        self._chunks.close()
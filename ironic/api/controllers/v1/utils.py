@@ -16,11 +16,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import re
+import six
 import wsme
 
 from oslo.config import cfg
 
+from ironic.db import api as db_api
+from ironic.openstack.common import jsonutils
+
 CONF = cfg.CONF
 
 
@@ -39,6 +44,69 @@ def validate_sort_dir(sort_dir):
     return sort_dir
 
 
+def validate_fields(fields, api_type):
+    """Parse the fields parameter of a request.
+
+    :param fields: a comma separated list of attributes of api_type, or
+                   None.
+    :param api_type: the API type of the requested resources.
+    :returns: the list of attribute names, or None when fields is None.
+    """
+    if fields is None:
+        return None
+    names = [f.strip() for f in fields.split(',') if f.strip()]
+    valid = [attr.name for attr in wsme.types.list_attributes(api_type)]
+    invalid = [name for name in names if name not in valid]
+    if invalid or not names:
+        raise wsme.exc.ClientSideError(_("Invalid fields: %(fields)s. "
+                                         "Acceptable values are: %(valid)s")
+                                       % {'fields': fields,
+                                          'valid': ', '.join(valid)})
+    return names
+
+
+def get_columns(fields, obj_class):
+    """Return the DB columns needed to show some attributes of objects.
+
+    The uuid is always loaded, since links are made from it.
+    """
+    return ['uuid'] + [f for f in fields
+                       if f in obj_class.fields and f != 'uuid']
+
+
+# The types of the sort key values of cursors; timestamps are strings.
+_CURSOR_VALUE_TYPES = (six.string_types + six.integer_types +
+                       (float, type(None)))
+
+
+def encode_cursor(obj, sort_key):
+    """Make the opaque token resuming a listing after obj.
+
+    :param obj: the last object of a page.
+    :param sort_key: the key the listing is sorted by.
+    """
+    value = jsonutils.to_primitive(obj[sort_key], convert_datetime=True)
+    token = base64.urlsafe_b64encode(jsonutils.dumps([sort_key, value,
+                                                      obj['id']]))
+    return token.rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Turn a token made by encode_cursor() into a DB API Cursor."""
+    try:
+        token = str(cursor)
+        token += '=' * (-len(token) % 4)
+        sort_key, value, id = jsonutils.loads(
+                                    base64.urlsafe_b64decode(token))
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise wsme.exc.ClientSideError(_("Invalid cursor: %s") % cursor)
+    if (not isinstance(sort_key, six.string_types) or
+            not isinstance(value, _CURSOR_VALUE_TYPES) or
+            not isinstance(id, six.integer_types) or isinstance(id, bool)):
+        raise wsme.exc.ClientSideError(_("Invalid cursor: %s") % cursor)
+    return db_api.Cursor(sort_key, value, id)
+
+
 def validate_patch(patch):
     """Performs a basic validation on patch."""
 
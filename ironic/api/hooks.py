@@ -110,3 +110,25 @@ class AdminAuthHook(hooks.PecanHook):
 
         if not is_admin_api and not ctx.is_public_api:
             raise exc.HTTPForbidden()
+
+
+class StreamHook(hooks.PecanHook):
+    """Send the chunks of a streamed collection as the response body.
+
+    The JSON renderer of wsme always sets a body; the chunks left on the
+    request by the controller replace it afterwards.
+    """
+
+    def after(self, state):
+        chunks = getattr(state.request, 'stream_chunks', None)
+        if chunks is not None:
+            state.response.app_iter = chunks
+
+
+class NotModifiedHook(hooks.PecanHook):
+    """Remove the body rendered for a 304 Not Modified response."""
+
+    def after(self, state):
+        if state.response.status_int == 304:
+            state.response.body = ''
+            state.response.content_type = None
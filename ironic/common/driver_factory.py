@@ -62,3 +62,8 @@ class DriverFactory(object):
     def names(self):
         """The list of driver names available."""
         return self._extension_manager.names()
+
+    @property
+    def drivers(self):
+        """The list of drivers available."""
+        return [ext.obj for ext in self._extension_manager.extensions]
@@ -209,6 +209,28 @@ class InvalidIdentity(Invalid):
     message = _("Expected an uuid or int but received %(identity)s.")
 
 
+class Conflict(IronicException):
+    message = _('Conflict.')
+    code = 409
+
+
+class PreconditionFailed(IronicException):
+    message = _("%(resource)s was modified since it was read.")
+    code = 412
+
+
+class NodeAlreadyExists(Conflict):
+    message = _("A node with UUID %(uuid)s already exists.")
+
+
+class PortAlreadyExists(Conflict):
+    message = _("A port with UUID %(uuid)s already exists.")
+
+
+class MACAlreadyExists(Conflict):
+    message = _("A port with MAC address %(mac)s already exists.")
+
+
 class InvalidMAC(Invalid):
     message = _("Expected a MAC address but received %(mac)s.")
 
@@ -276,6 +298,11 @@ class NodeLocked(InvalidState):
     message = _("Node %(node)s is locked by another process.")
 
 
+class NodeUpdateConflict(InvalidState):
+    message = _("Node %(node)s was not updated because it no longer has "
+                "the expected %(fields)s.")
+
+
 class NodeAssociated(InvalidState):
     message = _("Node %(node)s is associated with instance %(instance)s.")
 
@@ -284,14 +311,28 @@ class PortNotFound(NotFound):
     message = _("Port %(port)s could not be found.")
 
 
+class PortUpdateConflict(InvalidState):
+    message = _("Port %(port)s was not updated because it no longer has "
+                "the expected %(fields)s.")
+
+
 class ChassisNotFound(NotFound):
     message = _("Chassis %(chassis)s could not be found.")
 
 
+class ChassisUpdateConflict(InvalidState):
+    message = _("Chassis %(chassis)s was not updated because it no longer "
+                "has the expected %(fields)s.")
+
+
 class ConductorNotFound(NotFound):
     message = _("Conductor %(conductor)s could not be found.")
 
 
+class PrefetchNotFound(NotFound):
+    message = _("Image prefetch %(prefetch)s could not be found.")
+
+
 class ConductorAlreadyRegistered(IronicException):
     message = _("Conductor %(conductor)s already registered.")
 
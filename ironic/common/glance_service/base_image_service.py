@@ -19,13 +19,14 @@
 
 import functools
 import logging
+import random
 import shutil
 import sys
 import time
 import urlparse
 
-from glanceclient import client
 from ironic.common import exception
+from ironic.common.glance_service import client_pool
 from ironic.common.glance_service import service_utils
 
 from oslo.config import cfg
@@ -34,6 +35,9 @@ from oslo.config import cfg
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# Upper bound, in seconds, for the delay between two glance retries.
+_MAX_RETRY_INTERVAL = 30
+
 
 def _translate_image_exception(image_id, exc_value):
     if isinstance(exc_value, (exception.Forbidden,
@@ -57,8 +61,18 @@ def _translate_plain_exception(exc_value):
     return exc_value
 
 
+def _retry_interval(attempt):
+    """Exponential backoff with jitter for the given (1-based) attempt.
+
+    Randomizing the delay keeps conductors that lost glance at the same
+    moment from retrying in lock step.
+    """
+    backoff = min(_MAX_RETRY_INTERVAL, 2 ** (attempt - 1))
+    return random.uniform(backoff / 2.0, backoff)
+
+
 def check_image_service(func):
-    """Creates a glance client if doesn't exists and calls the function."""
+    """Gets a pooled glance client if not set and calls the function."""
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
         """wrapper around methods calls
@@ -76,13 +90,13 @@ def check_image_service(func):
             scheme = 'https'
         else:
             scheme = 'http'
-        params = {}
-        params['insecure'] = CONF.glance.glance_api_insecure
+        token = None
         if CONF.glance.auth_strategy == 'keystone':
-            params['token'] = self.context.auth_token
+            token = self.context.auth_token
         endpoint = '%s://%s:%s' % (scheme, self.glance_host, self.glance_port)
-        self.client = client.Client(self.version,
-                                    endpoint, **params)
+        self.client = client_pool.get_pool().get(
+                self.version, endpoint, token=token,
+                insecure=CONF.glance.glance_api_insecure)
         return func(self, *args, **kwargs)
     return wrapper
 
@@ -142,9 +156,13 @@ class BaseImageService(object):
                                           'attempt': attempt,
                                           'method': method,
                                           'extra': extra})
-                time.sleep(1)
+                time.sleep(_retry_interval(attempt))
             except image_excs as e:
                 exc_type, exc_value, exc_trace = sys.exc_info()
+                if isinstance(exc_value, exception.Unauthorized):
+                    # The token is no good anymore, don't hand this client
+                    # out again.
+                    client_pool.get_pool().evict(self.client)
                 if method == 'list':
                     new_exc = _translate_plain_exception(
                         exc_value)
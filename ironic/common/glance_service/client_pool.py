@@ -0,0 +1,101 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Process-wide pool of glance clients.
+
+Building a glanceclient.Client for every image service instance throws
+away the client (and any connection state it keeps) after a single call.
+The pool keeps clients keyed on everything that makes them different, so
+metadata lookups and downloads against the same endpoint reuse them.
+"""
+
+import time
+
+from glanceclient import client
+from oslo.config import cfg
+
+from ironic.common import utils
+
+
+pool_opts = [
+    cfg.IntOpt('glance_client_pool_size',
+               default=32,
+               help='Maximum number of glance clients kept for reuse '
+                    'between requests.'),
+    cfg.IntOpt('glance_client_ttl',
+               default=3000,
+               help='Seconds a pooled glance client is reused before it is '
+                    'rebuilt. Keep this below the keystone token lifetime.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(pool_opts, group='glance')
+
+
+class GlanceClientPool(object):
+    """A size-capped LRU of glance clients with age based eviction."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clients = utils.LRUCache(max_size)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, version, endpoint, token=None, insecure=False):
+        """Return a client for the given parameters, creating it if needed.
+
+        :param version: The glance API version.
+        :param endpoint: The glance endpoint URL.
+        :param token: (Optional) Auth token the client sends.
+        :param insecure: (Optional) Whether SSL certificates are checked.
+        :returns: A glanceclient.Client instance.
+        """
+        # NOTE: nothing below yields to the eventlet hub, so greenthreads
+        #       can not interleave while the dict is being updated.
+        key = (endpoint, version, token, insecure)
+        now = time.time()
+        entry = self._clients.get(key)
+        if entry is None or now - entry[1] >= self.ttl:
+            params = {'insecure': insecure}
+            if token is not None:
+                params['token'] = token
+            entry = (client.Client(version, endpoint, **params), now)
+            self._clients[key] = entry
+        return entry[0]
+
+    def evict(self, glance_client):
+        """Drop a client from the pool, e.g. after its token was rejected."""
+        for key, entry in self._clients.items():
+            if entry[0] is glance_client:
+                del self._clients[key]
+
+    def clear(self):
+        self._clients.clear()
+
+
+_POOL = None
+
+
+def get_pool():
+    """Return the process-wide client pool."""
+    global _POOL
+    if _POOL is None:
+        _POOL = GlanceClientPool(CONF.glance.glance_client_pool_size,
+                                 CONF.glance.glance_client_ttl)
+    return _POOL
@@ -23,13 +23,16 @@ Handling of VM disk images.
 
 import os
 import re
+import zlib
 
+from eventlet.green import subprocess
 from oslo.config import cfg
 
 from ironic.common import exception
 from ironic.common import image_service as service
 from ironic.common import utils
 from ironic.openstack.common import fileutils
+from ironic.openstack.common import jsonutils
 from ironic.openstack.common import log as logging
 from ironic.openstack.common import strutils
 
@@ -44,6 +47,12 @@ image_opts = [
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
 
+# The qemu-img info results kept by qemu_img_info().
+_INFO_CACHE = utils.LRUCache(128)
+
+_GZIP_MAGIC = '\x1f\x8b'
+_XZ_MAGIC = '\xfd7zXZ\x00'
+
 
 class QemuImgInfo(object):
     BACKING_FILE_RE = re.compile((r"^(.*?)\s*\(actual\s+path\s*:"
@@ -51,8 +60,11 @@ class QemuImgInfo(object):
     TOP_LEVEL_RE = re.compile(r"^([\w\d\s\_\-]+):(.*)$")
     SIZE_RE = re.compile(r"\(\s*(\d+)\s+bytes\s*\)", re.I)
 
-    def __init__(self, cmd_output=None):
-        details = self._parse(cmd_output or '')
+    def __init__(self, cmd_output=None, format='human'):
+        if format == 'json':
+            details = self._parse_json(cmd_output or '{}')
+        else:
+            details = self._parse(cmd_output or '')
         self.image = details.get('image')
         self.backing_file = details.get('backing_file')
         self.file_format = details.get('file_format')
@@ -136,15 +148,33 @@ class QemuImgInfo(object):
                 del lines_after[0]
         return real_details
 
+    def _parse_json(self, cmd_output):
+        # Output of 'qemu-img info --output=json', mapped to the keys the
+        # human readable output parser produces.
+        data = jsonutils.loads(cmd_output)
+        snapshots = [{'id': snap.get('id'),
+                      'tag': snap.get('name'),
+                      'vm_size': snap.get('vm-state-size'),
+                      'date': snap.get('date-sec'),
+                      'vm_clock': snap.get('vm-clock-sec')}
+                     for snap in data.get('snapshots', [])]
+        backing_file = (data.get('full-backing-filename') or
+                        data.get('backing-filename'))
+        return {'image': data.get('filename'),
+                'file_format': data.get('format'),
+                'virtual_size': data.get('virtual-size'),
+                'cluster_size': data.get('cluster-size'),
+                'disk_size': data.get('actual-size'),
+                'backing_file': backing_file,
+                'snapshot_list': snapshots,
+                'encryption': data.get('encrypted')}
+
     def _parse(self, cmd_output):
         # Analysis done of qemu-img.c to figure out what is going on here
         # Find all points start with some chars and then a ':' then a newline
         # and then handle the results of those 'top level' items in a separate
-        # function.
-        #
-        # TODO(harlowja): newer versions might have a json output format
-        #                 we should switch to that whenever possible.
-        #                 see: http://bit.ly/XLJXDX
+        # function. Only used for the versions of qemu-img without a json
+        # output format.
         contents = {}
         lines = [x for x in cmd_output.splitlines() if x.strip()]
         while lines:
@@ -160,23 +190,154 @@ class QemuImgInfo(object):
         return contents
 
 
-def qemu_img_info(path):
-    """Return an object containing the parsed output from qemu-img info."""
-    if not os.path.exists(path):
-        return QemuImgInfo()
-
+def _inspect_image(path):
+    try:
+        out, err = utils.execute('env', 'LC_ALL=C', 'LANG=C',
+                                 'qemu-img', 'info', '--output=json', path)
+        return QemuImgInfo(out, format='json')
+    except (exception.ProcessExecutionError, ValueError):
+        # qemu-img older than 1.5 has no JSON output.
+        LOG.debug(_("qemu-img info --output=json failed for %s, parsing "
+                    "the human readable output instead.") % path)
     out, err = utils.execute('env', 'LC_ALL=C', 'LANG=C',
                              'qemu-img', 'info', path)
     return QemuImgInfo(out)
 
 
+def qemu_img_info(path):
+    """Return an object containing the parsed output from qemu-img info.
+
+    Results are cached until the file is replaced or modified, so
+    inspecting the same master image again does not run qemu-img.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return QemuImgInfo()
+
+    key = (path, st.st_ino, st.st_size, st.st_mtime)
+    info = _INFO_CACHE.get(key)
+    if info is None:
+        info = _inspect_image(path)
+        _INFO_CACHE[key] = info
+    return info
+
+
 def convert_image(source, dest, out_format, run_as_root=False):
     """Convert image to other format."""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
-def fetch(context, image_href, path, image_service=None):
+class _GzipWriter(object):
+    """Decompress gzip data written to it into a file."""
+
+    def __init__(self, image_file, image_href):
+        self._file = image_file
+        self._image_href = image_href
+        self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def write(self, data):
+        try:
+            while data:
+                self._file.write(self._zlib.decompress(data))
+                data = self._zlib.unused_data
+                if data:
+                    # gzip files may be made of several members
+                    self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise exception.ImageUnacceptable(image_id=self._image_href,
+                    reason=_("gzip decompression failed: %s") % e)
+
+    def close(self):
+        self._file.write(self._zlib.flush())
+
+
+class _XzWriter(object):
+    """Decompress xz data written to it into a file, with xz(1)."""
+
+    def __init__(self, image_file, image_href):
+        self._image_href = image_href
+        image_file.flush()
+        self._process = subprocess.Popen(['xz', '--decompress', '--stdout'],
+                                         stdin=subprocess.PIPE,
+                                         stdout=image_file,
+                                         stderr=subprocess.PIPE)
+
+    def _fail(self, reason):
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        raise exception.ImageUnacceptable(image_id=self._image_href,
+                reason=_("xz decompression failed: %s") % reason)
+
+    def write(self, data):
+        try:
+            self._process.stdin.write(data)
+        except IOError:
+            self._fail(self._process.stderr.read().strip())
+
+    def close(self):
+        self._process.stdin.close()
+        err = self._process.stderr.read()
+        if self._process.wait() != 0:
+            self._fail(err.strip())
+
+
+class _DecompressingFile(object):
+    """Write-only file decompressing gzip and xz images on the fly.
+
+    The compression is detected from the magic bytes of the data; other
+    data is written to the file unchanged.
+    """
+
+    def __init__(self, image_file, image_href):
+        self._file = image_file
+        self._image_href = image_href
+        self._head = ''
+        self._writer = None
+
+    def _start(self):
+        if self._head.startswith(_GZIP_MAGIC):
+            LOG.debug(_("Decompressing gzip image %s.") % self._image_href)
+            self._writer = _GzipWriter(self._file, self._image_href)
+        elif self._head.startswith(_XZ_MAGIC):
+            LOG.debug(_("Decompressing xz image %s.") % self._image_href)
+            self._writer = _XzWriter(self._file, self._image_href)
+        else:
+            self._writer = self._file
+        head, self._head = self._head, ''
+        self._writer.write(head)
+
+    def write(self, data):
+        if self._writer is None:
+            self._head += data
+            if len(self._head) >= len(_XZ_MAGIC):
+                self._start()
+        else:
+            self._writer.write(data)
+
+    def close(self):
+        if self._writer is None:
+            self._start()
+        if self.decompressed:
+            self._writer.close()
+
+    @property
+    def decompressed(self):
+        """Whether the data written was decompressed."""
+        return self._writer is not self._file
+
+
+def fetch(context, image_href, path, image_service=None, decompress=True):
+    """Download an image to path.
+
+    :param decompress: whether gzip and xz compressed images are
+                       decompressed while they are downloaded, so that the
+                       compressed image is never written to disk.
+    :returns: True if path holds the image as stored in the image service,
+              False if it was decompressed.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -186,16 +347,34 @@ def fetch(context, image_href, path, image_service=None):
 
     with fileutils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
-            image_service.download(image_href, image_file)
-
-
-def fetch_to_raw(context, image_href, path, image_service=None):
+            if decompress:
+                data = _DecompressingFile(image_file, image_href)
+                image_service.download(image_href, data)
+                data.close()
+                return not data.decompressed
+            else:
+                image_service.download(image_href, image_file)
+                return True
+
+
+def fetch_to_raw(context, image_href, path, image_service=None,
+                 decompress=True):
+    """Download an image to path, converting it to a raw image if needed.
+
+    :returns: True if path holds the image as stored in the image service,
+              so that the checksum of the image service describes it.
+    """
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, image_service)
-    image_to_raw(image_href, path, path_tmp)
+    unchanged = fetch(context, image_href, path_tmp, image_service,
+                      decompress)
+    return not image_to_raw(image_href, path, path_tmp) and unchanged
 
 
 def image_to_raw(image_href, path, path_tmp):
+    """Move the image at path_tmp to path, converting it to raw if needed.
+
+    :returns: True if the image was converted.
+    """
     with fileutils.remove_path_on_error(path_tmp):
         data = qemu_img_info(path_tmp)
 
@@ -227,5 +406,7 @@ def image_to_raw(image_href, path, path_tmp):
                                  data.file_format)
 
                 os.rename(staged, path)
+                return True
         else:
             os.rename(path_tmp, path)
+            return False
@@ -13,6 +13,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import time
+
+from eventlet import semaphore
 from keystoneclient import exceptions as ksexception
 from oslo.config import cfg
 from six.moves.urllib import parse
@@ -20,13 +23,62 @@ from six.moves.urllib import parse
 from ironic.api import acl
 from ironic.common import exception
 
+keystone_opts = [
+    cfg.IntOpt('catalog_ttl',
+               default=600,
+               help='Seconds the Keystone service catalog is kept in '
+                    'memory before authenticating again to refresh it.'),
+    cfg.IntOpt('token_stale_duration',
+               default=120,
+               help='Authenticate again when the cached Keystone token '
+                    'expires within this many seconds.'),
+]
+
 CONF = cfg.CONF
 acl.register_opts(CONF)
+CONF.register_opts(keystone_opts, group='keystone')
 
 
-def get_service_url(attr='name', filter_value='ironic',
-                    service_type='baremetal', endpoint_type='internal'):
-    """Wrapper for get service url from keystone service catalog."""
+class KeystoneSession(object):
+    """A Keystone client shared by the whole process.
+
+    Its token and service catalog are reused until the token is about to
+    expire or the catalog is older than CONF.keystone.catalog_ttl. The
+    catalog comes with the token, so refreshing one renews both. When
+    many green threads find the session stale at once, a single one
+    authenticates and the others wait for its result.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._authenticated_at = 0
+        self._lock = semaphore.Semaphore()
+
+    def _is_fresh(self):
+        if self._client is None:
+            return False
+        if time.time() - self._authenticated_at >= CONF.keystone.catalog_ttl:
+            return False
+        auth_ref = getattr(self._client, 'auth_ref', None)
+        return not (auth_ref and auth_ref.will_expire_soon(
+                                    CONF.keystone.token_stale_duration))
+
+    def get_client(self):
+        """Return an authenticated client with a service catalog."""
+        if self._is_fresh():
+            return self._client
+        with self._lock:
+            # The session may have been refreshed while we waited.
+            if not self._is_fresh():
+                self._client = _authenticate()
+                self._authenticated_at = time.time()
+            return self._client
+
+
+_SESSION = KeystoneSession()
+
+
+def _authenticate():
     auth_url = CONF.keystone_authtoken.auth_uri or ''
     api_v3 = CONF.keystone_authtoken.auth_version == 'v3.0' or \
             'v3' in parse.urlparse(auth_url).path
@@ -52,6 +104,14 @@ def get_service_url(attr='name', filter_value='ironic',
     if not ksclient.has_service_catalog():
         raise exception.CatalogFailure(_('No keystone service catalog loaded'))
 
+    return ksclient
+
+
+def get_service_url(attr='name', filter_value='ironic',
+                    service_type='baremetal', endpoint_type='internal'):
+    """Wrapper for get service url from keystone service catalog."""
+    ksclient = _SESSION.get_client()
+
     try:
         endpoint = ksclient.service_catalog.url_for(attr=attr,
                                                    filter_value=filter_value,
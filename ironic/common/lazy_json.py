@@ -0,0 +1,78 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A dict which is only decoded from its JSON text when it is used."""
+
+import ast
+import collections
+import json
+
+import six
+
+
+class LazyJSONDict(collections.MutableMapping):
+    """A mapping holding the JSON text of a dict until it is first accessed.
+
+    Rows loaded from the database carry their JSON columns this way, so
+    that loading a node only pays for decoding the columns which are read.
+    """
+
+    def __init__(self, text):
+        self._text = text
+        self._dict = None
+
+    @property
+    def loaded(self):
+        """Whether the JSON text has been decoded."""
+        return self._dict is not None
+
+    def load(self):
+        """Decode the JSON text, once, and return the dict."""
+        if self._dict is None:
+            value = json.loads(self._text)
+            # NOTE: nodes created with the '{}' default hold the JSON
+            #       encoding of that string rather than an empty object.
+            if isinstance(value, six.string_types):
+                value = ast.literal_eval(value)
+            self._dict = dict(value or {})
+        return self._dict
+
+    def to_json(self):
+        """Return the JSON text of the dict.
+
+        The original text is returned as long as the dict was not decoded;
+        once it was, it may have been modified in place and is encoded again.
+        """
+        if self._dict is None:
+            return self._text
+        return json.dumps(self._dict)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        return repr(self.load())
@@ -20,6 +20,7 @@
 
 """Utilities and helper functions."""
 
+import collections
 import contextlib
 import errno
 import hashlib
@@ -590,3 +591,59 @@ def is_uuid_like(val):
         return str(uuid.UUID(val)) == val
     except (TypeError, ValueError, AttributeError):
         return False
+
+
+class LRUCache(object):
+    """A mapping which forgets its least recently used items beyond a size.
+
+    collections.OrderedDict does not exist on python 2.6; the order of use
+    of the keys is kept in a deque, least recently used first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = {}
+        self._order = collections.deque()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __iter__(self):
+        """Iterate the keys, least recently used first."""
+        return iter(list(self._order))
+
+    def items(self):
+        return [(key, self._items[key]) for key in self._order]
+
+    def get(self, key, default=None):
+        """Return the value of key, which becomes the most recently used."""
+        if key not in self._items:
+            return default
+        self._order.remove(key)
+        self._order.append(key)
+        return self._items[key]
+
+    def __setitem__(self, key, value):
+        if key in self._items:
+            self._order.remove(key)
+        self._items[key] = value
+        self._order.append(key)
+        while len(self._items) > self.size:
+            del self._items[self._order.popleft()]
+
+    def __delitem__(self, key):
+        del self._items[key]
+        self._order.remove(key)
+
+    def pop(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._order.remove(key)
+        return self._items.pop(key)
+
+    def clear(self):
+        self._items.clear()
+        self._order.clear()
@@ -43,6 +43,7 @@ from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common import service
 from ironic.common import states
+from ironic.conductor import prefetch
 from ironic.conductor import task_manager
 from ironic.db import api as dbapi
 from ironic.objects import base as objects_base
@@ -59,11 +60,18 @@ cfg.CONF.register_opt(cfg.StrOpt('api_url',
                       help='Url of Ironic API service. If not set Ironic can '
                       'get current value from Keystone service catalog.'))
 
+cfg.CONF.register_opt(cfg.IntOpt('power_target_timeout',
+                      default=300,
+                      help='Time, in seconds, after which the target power '
+                      'state of an unreserved node is cleared, when no '
+                      'conductor took the power operation requested.'),
+                      group='conductor')
+
 
 class ConductorManager(service.PeriodicService):
     """Ironic Conductor service main class."""
 
-    RPC_API_VERSION = '1.4'
+    RPC_API_VERSION = '1.6'
 
     def __init__(self, host, topic):
         serializer = objects_base.IronicObjectSerializer()
@@ -86,6 +94,35 @@ class ConductorManager(service.PeriodicService):
             self.dbapi.unregister_conductor(self.host)
             self.dbapi.register_conductor({'hostname': self.host,
                                            'drivers': drivers})
+        self._prefetcher = prefetch.ImagePrefetcher(
+                [driver.deploy for driver in df.drivers
+                 if driver.deploy is not None])
+        self._recover_reserved_nodes()
+
+    def _recover_reserved_nodes(self):
+        """Release the nodes left reserved by a previous run of this host.
+
+        A deploy which was queued or running when the conductor stopped
+        can not complete anymore; its node is failed rather than left in
+        DEPLOYING.
+        """
+        nodes = self.dbapi.get_nodes(['uuid', 'provision_state'],
+                                     filters={'reservation': self.host})
+        for node in nodes:
+            values = {'reservation': None}
+            if node.provision_state == states.DEPLOYING:
+                values['provision_state'] = states.DEPLOYFAIL
+                values['last_error'] = (_("The deploy was interrupted by a "
+                                          "restart of conductor %s.")
+                                        % self.host)
+            try:
+                self.dbapi.update_node(node.uuid, values,
+                                       expected={'reservation': self.host})
+            except (exception.NodeNotFound, exception.NodeUpdateConflict):
+                continue
+            LOG.warn(_("Released node %(node)s left reserved by a previous "
+                       "run of conductor %(host)s.")
+                     % {'node': node.uuid, 'host': self.host})
 
     # TODO(deva): add stop() to call unregister_conductor
 
@@ -110,7 +147,7 @@ class ConductorManager(service.PeriodicService):
             state = driver.power.get_power_state(task, node)
             return state
 
-    def update_node(self, context, node_obj):
+    def update_node(self, context, node_obj, expected=None):
         """Update a node with the supplied data.
 
         This method is the main "hub" for PUT and PATCH requests in the API.
@@ -119,6 +156,9 @@ class ConductorManager(service.PeriodicService):
 
         :param context: an admin context
         :param node_obj: a changed (but not saved) node object.
+        :param expected: optional dict of the values some fields of the
+                         node must still have for it to be updated.
+        :raises: NodeUpdateConflict if the node no longer has them.
 
         """
         node_id = node_obj.get('uuid')
@@ -146,7 +186,7 @@ class ConductorManager(service.PeriodicService):
                             pstate=node_obj['power_state'])
 
             # update any remaining parameters, then save
-            node_obj.save(context)
+            node_obj.save(context, expected=expected)
 
             return node_obj
 
@@ -171,6 +211,20 @@ class ConductorManager(service.PeriodicService):
                     "The desired new state is %(state)s.")
                     % {'node': node_id, 'state': new_state})
 
+        try:
+            self._change_node_power_state(context, node_id, new_state)
+        except exception.NodeLocked:
+            with excutils.save_and_reraise_exception():
+                # The API set the target power state when it accepted the
+                # request; clear it, unless someone else changed it since.
+                try:
+                    dbapi.get_instance().update_node(
+                            node_id, {'target_power_state': states.NOSTATE},
+                            expected={'target_power_state': new_state})
+                except exception.NodeUpdateConflict:
+                    pass
+
+    def _change_node_power_state(self, context, node_id, new_state):
         with task_manager.acquire(context, node_id, shared=False) as task:
             node = task.node
             try:
@@ -182,6 +236,7 @@ class ConductorManager(service.PeriodicService):
                         _("Failed to change power state to '%(target)s'. "
                           "Error: %(error)s") % {
                             'target': new_state, 'error': e}
+                    node['target_power_state'] = states.NOSTATE
                     node.save(context)
 
             if curr_state == new_state:
@@ -195,6 +250,7 @@ class ConductorManager(service.PeriodicService):
                 # This isn't an error, so we'll clear last_error field
                 # (from previous operation), log a warning, and return.
                 node['last_error'] = None
+                node['target_power_state'] = states.NOSTATE
                 node.save(context)
                 LOG.warn(_("Not going to change_node_power_state because "
                            "current state = requested state = '%(state)s'.")
@@ -359,6 +415,45 @@ class ConductorManager(service.PeriodicService):
             finally:
                 node.save(context)
 
+    def prefetch_images(self, context, prefetch_id, images):
+        """RPC method to fetch images into this conductor's image caches.
+
+        The images are fetched in the background, use get_prefetch_status
+        to follow their progress.
+
+        :param context: an admin context.
+        :param prefetch_id: the uuid identifying this prefetch.
+        :param images: a list of dicts with the 'image_ref' and the 'kind'
+                       ('tftp' or 'instance') of each image.
+
+        """
+        LOG.debug(_("RPC prefetch_images called for %(count)d images, "
+                    "prefetch %(prefetch)s.") %
+                    {'count': len(images), 'prefetch': prefetch_id})
+        self._prefetcher.start(context, prefetch_id, images,
+                               spawn=self.tg.add_thread)
+
+    def get_prefetch_status(self, context, prefetch_id):
+        """RPC method returning the status of the images of a prefetch.
+
+        :param context: an admin context.
+        :param prefetch_id: the uuid identifying the prefetch.
+        :returns: a list of dicts with the 'image_ref', 'kind', 'status'
+                  and 'error' of each image.
+        :raises: PrefetchNotFound if this conductor does not know the
+                 prefetch.
+
+        """
+        return self._prefetcher.status(prefetch_id)
+
     @periodic_task.periodic_task
     def _conductor_service_record_keepalive(self, context):
         self.dbapi.touch_conductor(self.host)
+
+    @periodic_task.periodic_task
+    def _clear_stale_power_targets(self, context):
+        count = self.dbapi.clear_stale_power_targets(
+                                    cfg.CONF.conductor.power_target_timeout)
+        if count:
+            LOG.warn(_("Cleared the target power state of %d nodes whose "
+                       "power operation was never taken.") % count)
@@ -0,0 +1,112 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# coding=utf-8
+
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Warm the master image caches of a conductor before a wave of deploys.
+
+Deploys fetch their images from Glance while holding the node's exclusive
+lock. Prefetching the images the deploys will use moves that download out
+of the deploys. Each conductor keeps the status of its recent prefetches
+in memory, so it can be asked how far along they are.
+
+The images are fetched by the deploy interfaces of the conductor's
+drivers, see DeployInterface.prefetch_image().
+"""
+
+from ironic.common import exception
+from ironic.common import utils
+from ironic.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+QUEUED = 'queued'
+FETCHING = 'fetching'
+CACHED = 'cached'
+FAILED = 'failed'
+
+# Number of prefetches whose status is remembered.
+MAX_PREFETCHES = 32
+
+
+class ImagePrefetcher(object):
+    """Fetch lists of images in the background and track their status."""
+
+    def __init__(self, deploys):
+        """Constructor.
+
+        :param deploys: the deploy interfaces of the drivers of the
+                        conductor.
+        """
+        # Deploy interfaces of the same class share their image caches,
+        # each image is fetched once per class.
+        self._deploys = []
+        for deploy in deploys:
+            if type(deploy) not in [type(d) for d in self._deploys]:
+                self._deploys.append(deploy)
+        self._prefetches = utils.LRUCache(MAX_PREFETCHES)
+
+    def start(self, context, prefetch_id, images, spawn):
+        """Start fetching images.
+
+        :param context: request context.
+        :param prefetch_id: the uuid identifying this prefetch.
+        :param images: a list of dicts with the 'image_ref' and 'kind' of
+                       the images, see DeployInterface.prefetch_image().
+        :param spawn: a function running its arguments in a new thread.
+        """
+        status = [{'image_ref': image['image_ref'],
+                   'kind': image['kind'],
+                   'status': QUEUED,
+                   'error': None} for image in images]
+        self._prefetches[prefetch_id] = status
+        return spawn(self._fetch, context, prefetch_id, status)
+
+    def _fetch(self, context, prefetch_id, status):
+        # Images are fetched one at a time so that a prefetch does not
+        # compete with the deploys running on this conductor.
+        for image in status:
+            image['status'] = FETCHING
+            try:
+                self._fetch_image(context, image['image_ref'], image['kind'])
+            except Exception as e:
+                LOG.warn(_("Prefetch %(prefetch)s failed to fetch image "
+                           "%(image)s: %(error)s") %
+                         {'prefetch': prefetch_id,
+                          'image': image['image_ref'], 'error': e})
+                image['status'] = FAILED
+                image['error'] = unicode(e)
+            else:
+                image['status'] = CACHED
+
+    def _fetch_image(self, context, image_ref, kind):
+        fetched = False
+        for deploy in self._deploys:
+            if deploy.prefetch_image(context, image_ref, kind):
+                fetched = True
+        if not fetched:
+            raise exception.InvalidParameterValue(_(
+                "No driver of this conductor keeps image caches."))
+
+    def status(self, prefetch_id):
+        """Return the status of each image of a prefetch.
+
+        :raises: PrefetchNotFound
+        """
+        status = self._prefetches.get(prefetch_id)
+        if status is None:
+            raise exception.PrefetchNotFound(prefetch=prefetch_id)
+        return [dict(image) for image in status]
@@ -56,10 +56,12 @@ class ConductorAPI(ironic.openstack.common.rpc.proxy.RpcProxy):
         1.2 - Added vendor_passhthru.
         1.3 - Rename start_power_state_change to change_node_power_state.
         1.4 - Add do_node_deploy and do_node_tear_down.
+        1.5 - Add prefetch_images and get_prefetch_status.
+        1.6 - Add expected parameter to update_node.
 
     """
 
-    RPC_API_VERSION = '1.4'
+    RPC_API_VERSION = '1.6'
 
     def __init__(self, topic=None):
         if topic is None:
@@ -82,7 +84,7 @@ class ConductorAPI(ironic.openstack.common.rpc.proxy.RpcProxy):
                          self.make_msg('get_node_power_state',
                                        node_id=node_id))
 
-    def update_node(self, context, node_obj):
+    def update_node(self, context, node_obj, expected=None):
         """Synchronously, have a conductor update the node's information.
 
         Update the node's information in the database and return a node object.
@@ -96,12 +98,17 @@ class ConductorAPI(ironic.openstack.common.rpc.proxy.RpcProxy):
 
         :param context: request context.
         :param node_obj: a changed (but not saved) node object.
+        :param expected: optional dict of the values some fields of the
+                         node must still have for it to be updated.
         :returns: updated node object, including all fields.
+        :raises: NodeUpdateConflict if the node no longer has the
+                 expected values.
 
         """
         return self.call(context,
                          self.make_msg('update_node',
-                                       node_obj=node_obj))
+                                       node_obj=node_obj,
+                                       expected=expected))
 
     def change_node_power_state(self, context, node_obj, new_state):
         """Asynchronously change power state of a node.
@@ -170,3 +177,36 @@ class ConductorAPI(ironic.openstack.common.rpc.proxy.RpcProxy):
         self.cast(context,
                   self.make_msg('do_node_tear_down',
                                 node_obj=node_obj))
+
+    def prefetch_images(self, context, prefetch_id, images):
+        """Signal to all conductors to fetch images into their caches.
+
+        :param context: request context.
+        :param prefetch_id: the uuid identifying this prefetch.
+        :param images: a list of dicts with the 'image_ref' and the 'kind'
+                       ('tftp' or 'instance') of each image.
+
+        """
+        self.fanout_cast(context,
+                         self.make_msg('prefetch_images',
+                                       prefetch_id=prefetch_id,
+                                       images=images))
+
+    def get_prefetch_status(self, context, prefetch_id, host, timeout=None):
+        """Ask a conductor for the status of the images of a prefetch.
+
+        :param context: request context.
+        :param prefetch_id: the uuid identifying the prefetch.
+        :param host: the hostname of the conductor.
+        :param timeout: the time to wait for the answer, in seconds.
+        :returns: a list of dicts with the 'image_ref', 'kind', 'status'
+                  and 'error' of each image.
+        :raises: PrefetchNotFound if the conductor does not know the
+                 prefetch.
+
+        """
+        return self.call(context,
+                         self.make_msg('get_prefetch_status',
+                                       prefetch_id=prefetch_id),
+                         topic='%s.%s' % (self.topic, host),
+                         timeout=timeout)
@@ -95,7 +95,8 @@ def require_exclusive_lock(f):
 
 
 @contextlib.contextmanager
-def acquire(context, node_ids, shared=False, driver_name=None):
+def acquire(context, node_ids, shared=False, driver_name=None,
+            reserved=False):
     """Context manager for acquiring a lock on one or more Nodes.
 
     Acquire a lock atomically on a non-empty set of nodes. The lock
@@ -108,6 +109,9 @@ def acquire(context, node_ids, shared=False, driver_name=None):
     :param shared: Boolean indicating whether to take a shared or exclusive
                    lock. Default: False.
     :param driver_name: Name of Driver. Default: None.
+    :param reserved: Boolean indicating whether this conductor already
+                     holds the exclusive lock, handed over by a task
+                     which kept it. Default: False.
     :returns: An instance of :class:`TaskManager`.
 
     """
@@ -119,7 +123,7 @@ def acquire(context, node_ids, shared=False, driver_name=None):
         node_ids = [node_ids]
 
     try:
-        if not shared:
+        if not shared and not reserved:
             t.dbapi.reserve_nodes(CONF.host, node_ids)
         for id in node_ids:
             t.resources.append(resource_manager.NodeManager.acquire(
@@ -128,7 +132,7 @@ def acquire(context, node_ids, shared=False, driver_name=None):
     finally:
         for id in [r.id for r in t.resources]:
             resource_manager.NodeManager.release(id, t)
-        if not shared:
+        if not shared and not t.keep_reservation:
             t.dbapi.release_nodes(CONF.host, node_ids)
 
 
@@ -140,6 +144,16 @@ class TaskManager(object):
         self.shared = shared
         self.resources = []
         self.dbapi = dbapi.get_instance()
+        self.keep_reservation = False
+
+    @require_exclusive_lock
+    def hand_over(self):
+        """Keep the exclusive lock held when the task ends.
+
+        The lock is released by another task, later acquired with
+        reserved=True, such as a job queued by this one.
+        """
+        self.keep_reservation = True
 
     @property
     def node(self):
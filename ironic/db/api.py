@@ -19,6 +19,7 @@ Base classes for storage engines
 """
 
 import abc
+import collections
 
 import six
 
@@ -33,6 +34,13 @@ def get_instance():
     return IMPL
 
 
+# Position of the last row of a page: the sort key, its value for that row
+# and the row id. Passed as the marker of a list method, the next page is
+# found with a range condition on the sort key index rather than by
+# comparing with a marker object loaded first.
+Cursor = collections.namedtuple('Cursor', ['sort_key', 'value', 'id'])
+
+
 @six.add_metaclass(abc.ABCMeta)
 class Connection(object):
     """Base class for storage system connections."""
@@ -42,15 +50,43 @@ class Connection(object):
         """Constructor."""
 
     @abc.abstractmethod
-    def get_nodes(self, columns):
-        """Return a list of dicts of all nodes.
-
-        :param columns: List of columns to return.
+    def get_nodes(self, columns, filters=None, limit=None, marker=None,
+                  sort_key=None, sort_dir=None, stream=False):
+        """Return a list of nodes, loading only some of their columns.
+
+        :param columns: List of columns to load, or None to load them all.
+                        The id is always loaded; the other fields of the
+                        returned nodes are left unset.
+        :param filters: Filters to apply. A dict which may contain:
+                        chassis_id: the id or uuid of a chassis.
+                        instance_uuid: the uuid of an instance.
+                        associated: True to only return the nodes with an
+                        instance, False for the nodes without one.
+                        driver, power_state, provision_state,
+                        reservation: the value of that node field.
+                        has_last_error: True to only return the nodes with
+                        a last error, False for the nodes without one.
+                        cpus, memory_mb, local_gb, cpu_arch: the value of
+                        that node property.
+                        min_cpus, max_cpus, min_memory_mb, max_memory_mb,
+                        min_local_gb, max_local_gb: inclusive bounds of
+                        that node property.
+        :param limit: Maximum number of nodes to return.
+        :param marker: the last item of the previous page; we return the next
+                       result set.
+        :param sort_key: Attribute by which results should be sorted.
+        :param sort_dir: direction in which results should be sorted.
+                         (asc, desc)
+        :param stream: True to return an iterator reading the nodes from the
+                       database in batches, each by a query of its own,
+                       rather than a list. The columns must include the
+                       sort key.
+        :returns: A list of nodes.
         """
 
     @abc.abstractmethod
     def get_node_list(self, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, filters=None):
         """Return a list of nodes.
 
         :param limit: Maximum number of nodes to return.
@@ -59,6 +95,7 @@ class Connection(object):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param filters: Filters to apply, as for get_nodes().
         """
 
     @abc.abstractmethod
@@ -94,6 +131,19 @@ class Connection(object):
                  because it was not reserved by this host.
         """
 
+    @abc.abstractmethod
+    def clear_stale_power_targets(self, interval):
+        """Clear the target power state of the nodes left claimed.
+
+        The API claims a power operation by setting the target power state
+        of an unreserved node; the claim of an operation which no conductor
+        took is cleared once the node was not updated for interval seconds.
+
+        :param interval: Seconds since the last update of a node to
+                         consider its target power state stale.
+        :returns: The number of nodes cleared.
+        """
+
     @abc.abstractmethod
     def create_node(self, values):
         """Create a new node.
@@ -115,6 +165,19 @@ class Connection(object):
         :returns: A node.
         """
 
+    @abc.abstractmethod
+    def create_nodes(self, values_list):
+        """Create several nodes in a single transaction.
+
+        A chassis_id may be given as the id or the uuid of a chassis; the
+        uuids of the whole batch are resolved together.
+
+        :param values_list: A list of dicts, as accepted by create_node().
+        :returns: A list holding, for each dict of values_list, either the
+                  new node or the exception which prevented its creation
+                  (ChassisNotFound or NodeAlreadyExists).
+        """
+
     @abc.abstractmethod
     def get_node(self, node_id):
         """Return a node.
@@ -123,6 +186,14 @@ class Connection(object):
         :returns: A node.
         """
 
+    @abc.abstractmethod
+    def get_node_uuids(self, node_ids):
+        """Return the UUIDs of many nodes with a single query.
+
+        :param node_ids: A list of node ids.
+        :returns: A dict mapping the id of each node found to its UUID.
+        """
+
     @abc.abstractmethod
     def get_node_by_instance(self, instance):
         """Return a node.
@@ -154,7 +225,7 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def update_node(self, node_id, values):
+    def update_node(self, node_id, values, expected=None):
         """Update properties of a node.
 
         :param node_id: The id or uuid of a node.
@@ -169,7 +240,16 @@ class Connection(object):
                              'my-field-2': val2,
                             }
                        }
+        :param expected: Dict of the values some fields must currently
+                         have for the update to be made, eg.
+                         {'target_power_state': None}. The check and the
+                         update are done in a single statement; JSON
+                         fields are compared decoded, with the node locked
+                         until it is updated.
         :returns: A node.
+        :raises: NodeNotFound if the node does not exist.
+        :raises: NodeUpdateConflict if the node does not have the
+                 expected values.
         """
 
     @abc.abstractmethod
@@ -188,6 +268,29 @@ class Connection(object):
         :returns: A port.
         """
 
+    @abc.abstractmethod
+    def get_ports(self, columns, filters=None, limit=None, marker=None,
+                  sort_key=None, sort_dir=None, stream=False):
+        """Return a list of ports, loading only some of their columns.
+
+        :param columns: List of columns to load, or None to load them all.
+                        The id is always loaded; the other fields of the
+                        returned ports are left unset.
+        :param filters: Filters to apply. A dict which may contain:
+                        node_id: the id or uuid of a node.
+        :param limit: Maximum number of ports to return.
+        :param marker: the last item of the previous page; we return the next
+                       result set.
+        :param sort_key: Attribute by which results should be sorted.
+        :param sort_dir: direction in which results should be sorted.
+                         (asc, desc)
+        :param stream: True to return an iterator reading the ports from the
+                       database in batches, each by a query of its own,
+                       rather than a list. The columns must include the
+                       sort key.
+        :returns: A list of ports.
+        """
+
     @abc.abstractmethod
     def get_port_list(self, limit=None, marker=None,
                       sort_key=None, sort_dir=None):
@@ -224,12 +327,31 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def update_port(self, port_id, values):
+    def create_ports(self, values_list):
+        """Create several ports in a single transaction.
+
+        A node_id may be given as the id or the uuid of a node; the uuids
+        of the whole batch are resolved together.
+
+        :param values_list: A list of dicts, as accepted by create_port().
+        :returns: A list holding, for each dict of values_list, either the
+                  new port or the exception which prevented its creation
+                  (NodeNotFound, PortAlreadyExists or MACAlreadyExists).
+        """
+
+    @abc.abstractmethod
+    def update_port(self, port_id, values, expected=None):
         """Update properties of an port.
 
         :param port_id: The id or MAC of a port.
         :param values: Dict of values to update.
+        :param expected: Dict of the values some fields must currently
+                         have for the update to be made. The port is
+                         locked from the check until it is updated.
         :returns: A port.
+        :raises: PortNotFound if the port does not exist.
+        :raises: PortUpdateConflict if the port does not have the
+                 expected values.
         """
 
     @abc.abstractmethod
@@ -254,6 +376,31 @@ class Connection(object):
         :returns: A chassis.
         """
 
+    @abc.abstractmethod
+    def get_chassis_uuids(self, chassis_ids):
+        """Return the UUIDs of many chassis with a single query.
+
+        :param chassis_ids: A list of chassis ids.
+        :returns: A dict mapping the id of each chassis found to its UUID.
+        """
+
+    @abc.abstractmethod
+    def get_all_chassis(self, columns, limit=None, marker=None,
+                        sort_key=None, sort_dir=None):
+        """Return a list of chassis, loading only some of their columns.
+
+        :param columns: List of columns to load, or None to load them all.
+                        The id is always loaded; the other fields of the
+                        returned chassis are left unset.
+        :param limit: Maximum number of chassis to return.
+        :param marker: the last item of the previous page; we return the next
+                       result set.
+        :param sort_key: Attribute by which results should be sorted.
+        :param sort_dir: direction in which results should be sorted.
+                         (asc, desc)
+        :returns: A list of chassis.
+        """
+
     @abc.abstractmethod
     def get_chassis_list(self, limit=None, marker=None,
                          sort_key=None, sort_dir=None):
@@ -268,12 +415,18 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def update_chassis(self, chassis_id, values):
+    def update_chassis(self, chassis_id, values, expected=None):
         """Update properties of an chassis.
 
         :param chassis_id: The id or the uuid of a chassis.
         :param values: Dict of values to update.
+        :param expected: Dict of the values some fields must currently
+                         have for the update to be made. The chassis is
+                         locked from the check until it is updated.
         :returns: A chassis.
+        :raises: ChassisNotFound if the chassis does not exist.
+        :raises: ChassisUpdateConflict if the chassis does not have the
+                 expected values.
         """
 
     @abc.abstractmethod
@@ -322,9 +475,47 @@ class Connection(object):
         :raises: ConductorNotFound
         """
 
+    @abc.abstractmethod
+    def list_active_conductors(self, interval):
+        """Retrieve the hostnames of the registered active conductors.
+
+        :param interval: Time since last check-in of a conductor.
+        """
+
     @abc.abstractmethod
     def list_active_conductor_drivers(self, interval):
         """Retrieve a list of drivers supported by the registered conductors.
 
         :param interval: Time since last check-in of a conductor.
         """
+
+    @abc.abstractmethod
+    def register_master_image(self, values):
+        """Advertise that a conductor serves a master image to its peers.
+
+        Registering the same image again for a conductor replaces the
+        previous record.
+
+        :param values: A dict with the hostname of the conductor, the
+                       checksum the image service gives the image, the
+                       sha1 of the served file as content_checksum and
+                       the url it is served at.
+        :returns: A master image record.
+        """
+
+    @abc.abstractmethod
+    def unregister_master_image(self, hostname, checksum):
+        """Stop advertising a master image of a conductor.
+
+        :param hostname: The hostname of the conductor.
+        :param checksum: The image service checksum of the image.
+        """
+
+    @abc.abstractmethod
+    def get_master_image_peers(self, checksum, interval):
+        """Retrieve the active conductors serving a master image.
+
+        :param checksum: The image service checksum of the image.
+        :param interval: Time since last check-in of a conductor.
+        :returns: A list of master image records.
+        """
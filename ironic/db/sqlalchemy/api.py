@@ -18,20 +18,26 @@
 """SQLAlchemy storage backend."""
 
 import datetime
+import operator
 
 from oslo.config import cfg
 
+import six
+import sqlalchemy
 from sqlalchemy.orm.exc import NoResultFound
 
 from ironic.common import exception
+from ironic.common import lazy_json
 from ironic.common import states
 from ironic.common import utils
 from ironic.db import api
 from ironic.db.sqlalchemy import models
 from ironic import objects
+from ironic.objects import utils as obj_utils
 from ironic.openstack.common.db import exception as db_exc
 from ironic.openstack.common.db.sqlalchemy import session as db_session
 from ironic.openstack.common.db.sqlalchemy import utils as db_utils
+from ironic.openstack.common import jsonutils
 from ironic.openstack.common import log
 from ironic.openstack.common import timeutils
 
@@ -80,6 +86,39 @@ def add_identity_filter(query, value):
         raise exception.InvalidIdentity(identity=value)
 
 
+def add_identity_clause(table, value):
+    """Return the condition selecting a row of a table by ID or UUID.
+
+    :param table: Table to select the row of.
+    :param value: Value for selecting the row by.
+    :return: A SQL expression.
+    """
+    if utils.is_int_like(value):
+        return table.c.id == value
+    elif utils.is_uuid_like(value):
+        return table.c.uuid == value
+    else:
+        raise exception.InvalidIdentity(identity=value)
+
+
+def _changed_fields(ref, expected):
+    """Return the names of the fields of ref differing from expected."""
+    return sorted(key for key, value in expected.items()
+                  if ref[key] != value)
+
+
+def _supports_update_returning(dialect):
+    """Whether an UPDATE can return the rows it changed."""
+    return dialect.name == 'postgresql'
+
+
+def _sorts_nulls_first(dialect, sort_dir):
+    """Whether rows with a NULL sort key come first in a sorted query."""
+    # PostgreSQL sorts NULL after any value, MySQL and SQLite before.
+    nulls_last_when_asc = dialect.name == 'postgresql'
+    return nulls_last_when_asc == (sort_dir == 'desc')
+
+
 def add_filter_by_many_identities(query, model, values):
     """Adds an identity filter to a query for values list.
 
@@ -136,6 +175,167 @@ def add_node_filter_by_chassis(query, value):
         return query.filter(models.Chassis.uuid == value)
 
 
+# Bound parameters in the IN clause of a single bulk create query; sqlite
+# refuses statements with more than 999 of them.
+_BULK_IN_SIZE = 500
+
+
+# Rows read by each query of a streamed page.
+_STREAM_BATCH_SIZE = 100
+
+
+def _chunks(items, size=_BULK_IN_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _identity_key(value):
+    return int(value) if utils.is_int_like(value) else value
+
+
+def _resolve_identities(model, identities, session):
+    """Map the ids and uuids of rows of a model to their ids.
+
+    Identities which do not match any row are left out of the mapping.
+    """
+    ids = set(int(i) for i in identities if utils.is_int_like(i))
+    uuids = set(i for i in identities
+                if not utils.is_int_like(i) and utils.is_uuid_like(i))
+    mapping = {}
+    for column, values in ((model.id, ids), (model.uuid, uuids)):
+        for chunk in _chunks(values):
+            query = model_query(model.id, model.uuid, session=session)
+            for row_id, row_uuid in query.filter(column.in_(chunk)):
+                mapping[row_id] = row_id
+                mapping[row_uuid] = row_id
+    return mapping
+
+
+def _existing_values(column, values, session):
+    """Return which of the values are already stored in a column."""
+    existing = set()
+    for chunk in _chunks(set(values)):
+        query = model_query(column, session=session)
+        existing.update(row[0] for row in query.filter(column.in_(chunk)))
+    return existing
+
+
+def _bulk_insert(model, rows, session):
+    """Insert rows with executemany and return their models.
+
+    Only the columns a row gives are inserted, the others get their
+    defaults; the rows giving the same columns are inserted together.
+    """
+    if not rows:
+        return []
+    columns = set(c.name for c in model.__table__.columns
+                  if c.name not in ('id', 'created_at', 'updated_at'))
+    batches = {}
+    for row in rows:
+        values = dict((c, v) for c, v in row.items() if c in columns)
+        batches.setdefault(frozenset(values), []).append(values)
+    for batch in batches.values():
+        session.execute(model.__table__.insert(), batch)
+    refs = {}
+    for chunk in _chunks(row['uuid'] for row in rows):
+        query = model_query(model, session=session)
+        for ref in query.filter(model.uuid.in_(chunk)):
+            refs[ref.uuid] = ref
+    return [refs[row['uuid']] for row in rows]
+
+
+def _from_partial_row(obj, columns, row):
+    """Set the fields of an object loaded by a projected query."""
+    for column in columns:
+        obj[column] = getattr(row, column)
+    obj.obj_reset_changes()
+    return obj
+
+
+def _projected_query(model, klass, columns):
+    """Return a query loading only some columns of a model, and the columns.
+
+    The id is always loaded; None loads whole rows.
+    """
+    if columns is None:
+        return model_query(model), None
+    columns = ['id'] + [c for c in columns if c != 'id']
+    unknown = set(columns) - set(klass.fields)
+    if unknown:
+        raise exception.InvalidParameterValue(_(
+            "Unknown %(table)s columns: %(columns)s") %
+            {'table': model.__tablename__,
+             'columns': ', '.join(sorted(unknown))})
+    return model_query(*[getattr(model, c) for c in columns]), columns
+
+
+def _from_projected_rows(klass, columns, rows, stream=False):
+    """Make the objects of the rows returned by a _projected_query().
+
+    :param stream: True to return an iterator making the objects as the rows
+                   are read, rather than a list.
+    """
+    if columns is None:
+        objs = (klass._from_db_object(klass(), row) for row in rows)
+    else:
+        objs = (_from_partial_row(klass(), columns, row) for row in rows)
+    return objs if stream else list(objs)
+
+
+# The node properties which are copied into columns of their own on write,
+# so that nodes can be filtered on them, and their types.
+_CAPACITY_COLUMNS = {
+    'cpus': int,
+    'memory_mb': int,
+    'local_gb': int,
+    'cpu_arch': six.text_type,
+}
+
+
+def _set_node_defaults(values):
+    # ensure defaults are present for new nodes
+    if not values.get('uuid'):
+        values['uuid'] = utils.generate_uuid()
+    if not values.get('power_state'):
+        values['power_state'] = states.NOSTATE
+    if not values.get('provision_state'):
+        values['provision_state'] = states.NOSTATE
+    if not values.get('properties'):
+        values['properties'] = '{}'
+    if not values.get('extra'):
+        values['extra'] = '{}'
+    if not values.get('driver_info'):
+        values['driver_info'] = '{}'
+    return _set_capacity_columns(values)
+
+
+def _set_capacity_columns(values):
+    """Copy the node properties used to select nodes into their columns."""
+    properties = values.get('properties')
+    if 'properties' not in values or (
+            isinstance(properties, lazy_json.LazyJSONDict) and
+            not properties.loaded):
+        # properties which were not decoded since they were read are
+        # unchanged, and so are their columns
+        return values
+    properties = obj_utils.dict_or_none(values['properties'])
+    for name, convert in _CAPACITY_COLUMNS.items():
+        try:
+            values[name] = convert(properties[name])
+        except (KeyError, TypeError, ValueError):
+            values[name] = None
+    return values
+
+
+def _set_port_defaults(values):
+    if not values.get('uuid'):
+        values['uuid'] = utils.generate_uuid()
+    if not values.get('extra'):
+        values['extra'] = '{}'
+    return values
+
+
 def _check_port_change_forbidden(port, session):
     node_id = port['node_id']
     if node_id is not None:
@@ -146,18 +346,108 @@ def _check_port_change_forbidden(port, session):
             raise exception.NodeLocked(node=node_id)
 
 
+def _keyset_query(model, query, limit, cursor, sort_key, sort_dir):
+    """Add sorting and the condition to list the rows after cursor."""
+    sort_key = sort_key or 'id'
+    if cursor.sort_key != sort_key:
+        raise exception.InvalidParameterValue(_(
+            "The cursor was made for sort key %(cursor)s, not %(key)s.") %
+            {'cursor': cursor.sort_key, 'key': sort_key})
+    try:
+        key_attr = getattr(model, sort_key)
+    except AttributeError:
+        raise db_utils.InvalidSortKey()
+
+    if sort_dir == 'desc':
+        order, after, from_ = sqlalchemy.desc, operator.lt, operator.le
+    else:
+        order, after, from_ = sqlalchemy.asc, operator.gt, operator.ge
+
+    if sort_key == 'id':
+        query = query.filter(after(model.id, cursor.id)).\
+                      order_by(order(model.id))
+    else:
+        value = cursor.value
+        column_type = key_attr.property.columns[0].type
+        if isinstance(column_type, sqlalchemy.DateTime) and value:
+            value = timeutils.parse_strtime(value)
+        nulls_first = _sorts_nulls_first(query.session.bind.dialect,
+                                         sort_dir)
+        if value is None:
+            # the rows after cursor in the NULL sort keys, then the
+            # others if they come after the NULL ones.
+            condition = sqlalchemy.and_(key_attr == None,
+                                        after(model.id, cursor.id))
+            if nulls_first:
+                condition = sqlalchemy.or_(condition, key_attr != None)
+            query = query.filter(condition)
+        elif nulls_first:
+            # (key, id) > (value, cursor.id), written so that the leading
+            # condition is a range on the sort key index.
+            query = query.filter(from_(key_attr, value)).\
+                          filter(sqlalchemy.or_(after(key_attr, value),
+                                                after(model.id, cursor.id)))
+        else:
+            query = query.filter(sqlalchemy.or_(
+                    key_attr == None,
+                    sqlalchemy.and_(from_(key_attr, value),
+                                    sqlalchemy.or_(
+                                        after(key_attr, value),
+                                        after(model.id, cursor.id)))))
+        query = query.order_by(order(key_attr), order(model.id))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 def _paginate_query(model, limit=None, marker=None, sort_key=None,
-                    sort_dir=None, query=None):
+                    sort_dir=None, query=None, stream=False):
+    """Return a page of rows.
+
+    :param stream: True to return an iterator reading the rows in batches,
+                   see _stream_query(), rather than a list.
+    """
     if not query:
         query = model_query(model)
-    sort_keys = ['id']
-    if sort_key and sort_key not in sort_keys:
-        sort_keys.insert(0, sort_key)
-    query = db_utils.paginate_query(query, model, limit, sort_keys,
-                                    marker=marker, sort_dir=sort_dir)
+    if stream:
+        return _stream_query(model, limit, marker, sort_key, sort_dir, query)
+    if isinstance(marker, api.Cursor):
+        query = _keyset_query(model, query, limit, marker, sort_key,
+                              sort_dir)
+    else:
+        sort_keys = ['id']
+        if sort_key and sort_key not in sort_keys:
+            sort_keys.insert(0, sort_key)
+        query = db_utils.paginate_query(query, model, limit, sort_keys,
+                                        marker=marker, sort_dir=sort_dir)
     return query.all()
 
 
+def _stream_query(model, limit, marker, sort_key, sort_dir, query):
+    """Read a page of rows in batches, each by a query of its own.
+
+    A batch starts after the last row of the previous one, so that no
+    connection is held while the rows already read are sent: the client
+    may read them slowly, or go away and never close the iterator.
+    Drivers such as MySQLdb buffer the whole result of a query anyway.
+    """
+    sort_key = sort_key or 'id'
+    while limit is None or limit > 0:
+        size = _STREAM_BATCH_SIZE
+        if limit is not None:
+            size = min(size, limit)
+            limit -= size
+        rows = _paginate_query(model, size, marker, sort_key, sort_dir,
+                               query)
+        for row in rows:
+            yield row
+        if len(rows) < size:
+            return
+        value = jsonutils.to_primitive(getattr(rows[-1], sort_key),
+                                       convert_datetime=True)
+        marker = api.Cursor(sort_key, value, rows[-1].id)
+
+
 def _check_node_already_locked(query, query_by):
     no_reserv = None
     locked_ref = query.filter(models.Node.reservation != no_reserv).first()
@@ -178,15 +468,58 @@ class Connection(api.Connection):
     def __init__(self):
         pass
 
-    @objects.objectify(objects.Node)
-    def get_nodes(self, columns):
-        pass
+    def _add_nodes_filters(self, query, filters):
+        filters = filters or {}
+        if filters.get('chassis_id'):
+            # get_chassis() to raise an exception if the chassis is not found
+            chassis_obj = self.get_chassis(filters['chassis_id'])
+            query = query.filter(models.Node.chassis_id == chassis_obj.id)
+        if filters.get('instance_uuid'):
+            if not utils.is_uuid_like(filters['instance_uuid']):
+                raise exception.InvalidUUID(uuid=filters['instance_uuid'])
+            query = query.filter(
+                    models.Node.instance_uuid == filters['instance_uuid'])
+        if filters.get('associated') is not None:
+            if filters['associated']:
+                query = query.filter(models.Node.instance_uuid != None)
+            else:
+                query = query.filter(models.Node.instance_uuid == None)
+        for name in ('driver', 'power_state', 'provision_state',
+                     'reservation'):
+            if filters.get(name) is not None:
+                query = query.filter(getattr(models.Node, name) ==
+                                     filters[name])
+        if filters.get('has_last_error') is not None:
+            if filters['has_last_error']:
+                query = query.filter(models.Node.last_error != None)
+            else:
+                query = query.filter(models.Node.last_error == None)
+        for name in _CAPACITY_COLUMNS:
+            column = getattr(models.Node, name)
+            if filters.get(name) is not None:
+                query = query.filter(column == filters[name])
+            if filters.get('min_' + name) is not None:
+                query = query.filter(column >= filters['min_' + name])
+            if filters.get('max_' + name) is not None:
+                query = query.filter(column <= filters['max_' + name])
+        return query
+
+    def get_nodes(self, columns, filters=None, limit=None, marker=None,
+                  sort_key=None, sort_dir=None, stream=False):
+        query, columns = _projected_query(models.Node, objects.Node,
+                                          columns)
+        query = self._add_nodes_filters(query, filters)
+
+        rows = _paginate_query(models.Node, limit, marker,
+                               sort_key, sort_dir, query, stream)
+        return _from_projected_rows(objects.Node, columns, rows, stream)
 
     @objects.objectify(objects.Node)
     def get_node_list(self, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, filters=None):
+        query = self._add_nodes_filters(model_query(models.Node), filters)
         return _paginate_query(models.Node, limit, marker,
-                               sort_key, sort_dir)
+                               sort_key, sort_dir, query)
 
     @objects.objectify(objects.Node)
     def get_nodes_by_chassis(self, chassis_id, limit=None, marker=None,
@@ -254,27 +587,77 @@ class Connection(api.Connection):
                     # one or more node had reservation != tag
                     _check_node_already_locked(query, query_by)
 
+    def clear_stale_power_targets(self, interval):
+        limit = timeutils.utcnow() - datetime.timedelta(seconds=interval)
+        session = get_session()
+        with session.begin():
+            query = model_query(models.Node, session=session).\
+                        filter(models.Node.target_power_state != None).\
+                        filter(models.Node.reservation == None).\
+                        filter(sqlalchemy.func.coalesce(
+                                models.Node.updated_at,
+                                models.Node.created_at) < limit)
+            return query.update({'target_power_state': None},
+                                synchronize_session=False)
+
     @objects.objectify(objects.Node)
     def create_node(self, values):
-        # ensure defaults are present for new nodes
-        if not values.get('uuid'):
-            values['uuid'] = utils.generate_uuid()
-        if not values.get('power_state'):
-            values['power_state'] = states.NOSTATE
-        if not values.get('provision_state'):
-            values['provision_state'] = states.NOSTATE
-        if not values.get('properties'):
-            values['properties'] = '{}'
-        if not values.get('extra'):
-            values['extra'] = '{}'
-        if not values.get('driver_info'):
-            values['driver_info'] = '{}'
+        _set_node_defaults(values)
 
         node = models.Node()
         node.update(values)
         node.save()
         return node
 
+    def create_nodes(self, values_list):
+        values_list = [_set_node_defaults(dict(v)) for v in values_list]
+        results = [None] * len(values_list)
+        pending = []
+        session = get_session()
+        try:
+            with session.begin():
+                chassis = _resolve_identities(models.Chassis,
+                                              [v['chassis_id']
+                                               for v in values_list
+                                               if v.get('chassis_id')],
+                                              session)
+                taken = _existing_values(models.Node.uuid,
+                                         [v['uuid'] for v in values_list],
+                                         session)
+                for i, values in enumerate(values_list):
+                    chassis_id = values.get('chassis_id')
+                    if chassis_id:
+                        if _identity_key(chassis_id) not in chassis:
+                            results[i] = exception.ChassisNotFound(
+                                                        chassis=chassis_id)
+                            continue
+                        values['chassis_id'] = \
+                                chassis[_identity_key(chassis_id)]
+                    if values['uuid'] in taken:
+                        results[i] = exception.NodeAlreadyExists(
+                                                        uuid=values['uuid'])
+                        continue
+                    taken.add(values['uuid'])
+                    pending.append(i)
+
+                refs = _bulk_insert(models.Node,
+                                    [values_list[i] for i in pending],
+                                    session)
+                for i, ref in zip(pending, refs):
+                    results[i] = objects.Node._from_db_object(objects.Node(),
+                                                              ref)
+        except db_exc.DBDuplicateEntry:
+            # A node was created with one of the uuids since they were
+            # checked, and the whole batch was rolled back; create the
+            # nodes one by one to tell which.
+            for i in pending:
+                try:
+                    results[i] = self.create_node(values_list[i])
+                except db_exc.DBDuplicateEntry:
+                    results[i] = exception.NodeAlreadyExists(
+                                                uuid=values_list[i]['uuid'])
+        return results
+
     @objects.objectify(objects.Node)
     def get_node(self, node_id):
         query = model_query(models.Node)
@@ -287,6 +670,13 @@ class Connection(api.Connection):
 
         return result
 
+    def get_node_uuids(self, node_ids):
+        uuids = {}
+        for chunk in _chunks(set(node_ids)):
+            query = model_query(models.Node.id, models.Node.uuid)
+            uuids.update(query.filter(models.Node.id.in_(chunk)))
+        return uuids
+
     @objects.objectify(objects.Node)
     def get_node_by_instance(self, instance):
         if not utils.is_uuid_like(instance):
@@ -330,17 +720,54 @@ class Connection(api.Connection):
             query.delete()
 
     @objects.objectify(objects.Node)
-    def update_node(self, node_id, values):
+    def update_node(self, node_id, values, expected=None):
+        values = _set_capacity_columns(dict(values))
+        nodes = models.Node.__table__
+        conditions = [add_identity_clause(nodes, node_id)]
+        expected_json = {}
+        for key, value in (expected or {}).items():
+            if isinstance(nodes.c[key].type, models.JSONEncodedDict):
+                # the same dict has many JSON encodings, so these fields
+                # are compared decoded rather than in the UPDATE
+                expected_json[key] = value
+            else:
+                conditions.append(nodes.c[key] == value)
+        stmt = nodes.update().where(sqlalchemy.and_(*conditions)).\
+                     values(**values)
+
         session = get_session()
         with session.begin():
-            query = model_query(models.Node, session=session)
-            query = add_identity_filter(query, node_id)
-
-            count = query.update(values, synchronize_session='fetch')
-            if count != 1:
+            if expected_json:
+                keys = sorted(expected_json)
+                query = model_query(*[getattr(models.Node, key)
+                                      for key in keys], session=session)
+                query = add_identity_filter(query, node_id)
+                row = query.with_lockmode('update').first()
+                if row is None:
+                    raise exception.NodeNotFound(node=node_id)
+                changed = _changed_fields(dict(zip(keys, row)),
+                                          expected_json)
+                if changed:
+                    raise exception.NodeUpdateConflict(
+                            node=node_id, fields=', '.join(changed))
+
+            if _supports_update_returning(session.bind.dialect):
+                ref = session.execute(stmt.returning(*nodes.c)).first()
+                if ref is not None:
+                    return ref
+            elif session.execute(stmt).rowcount == 1:
+                query = model_query(models.Node, session=session)
+                return add_identity_filter(query, node_id).one()
+
+            # without expected values the update can only have missed a
+            # node that was deleted in the meantime
+            if expected is None:
                 raise exception.NodeNotFound(node=node_id)
-            ref = query.one()
-        return ref
+            query = model_query(models.Node.id, session=session)
+            if add_identity_filter(query, node_id).first() is None:
+                raise exception.NodeNotFound(node=node_id)
+            raise exception.NodeUpdateConflict(
+                    node=node_id, fields=', '.join(sorted(expected)))
 
     @objects.objectify(objects.Port)
     def get_port(self, port_id):
@@ -358,6 +785,20 @@ class Connection(api.Connection):
     def get_port_by_vif(self, vif):
         pass
 
+    def get_ports(self, columns, filters=None, limit=None, marker=None,
+                  sort_key=None, sort_dir=None, stream=False):
+        query, columns = _projected_query(models.Port, objects.Port,
+                                          columns)
+        filters = filters or {}
+        if filters.get('node_id'):
+            # get_node() to raise an exception if the node is not found
+            node_obj = self.get_node(filters['node_id'])
+            query = query.filter(models.Port.node_id == node_obj.id)
+
+        rows = _paginate_query(models.Port, limit, marker,
+                               sort_key, sort_dir, query, stream)
+        return _from_projected_rows(objects.Port, columns, rows, stream)
+
     @objects.objectify(objects.Port)
     def get_port_list(self, limit=None, marker=None,
                       sort_key=None, sort_dir=None):
@@ -376,25 +817,91 @@ class Connection(api.Connection):
 
     @objects.objectify(objects.Port)
     def create_port(self, values):
-        if not values.get('uuid'):
-            values['uuid'] = utils.generate_uuid()
-        if not values.get('extra'):
-            values['extra'] = '{}'
+        _set_port_defaults(values)
         port = models.Port()
         port.update(values)
         port.save()
         return port
 
+    def create_ports(self, values_list):
+        values_list = [_set_port_defaults(dict(v)) for v in values_list]
+        results = [None] * len(values_list)
+        pending = []
+        session = get_session()
+        try:
+            with session.begin():
+                nodes = _resolve_identities(models.Node,
+                                            [v['node_id'] for v in values_list
+                                             if v.get('node_id')],
+                                            session)
+                taken_uuids = _existing_values(models.Port.uuid,
+                                               [v['uuid']
+                                                for v in values_list],
+                                               session)
+                taken_macs = _existing_values(models.Port.address,
+                                              [v['address']
+                                               for v in values_list
+                                               if v.get('address')],
+                                              session)
+                for i, values in enumerate(values_list):
+                    node_id = values.get('node_id')
+                    if node_id:
+                        if _identity_key(node_id) not in nodes:
+                            results[i] = exception.NodeNotFound(node=node_id)
+                            continue
+                        values['node_id'] = nodes[_identity_key(node_id)]
+                    if values['uuid'] in taken_uuids:
+                        results[i] = exception.PortAlreadyExists(
+                                                        uuid=values['uuid'])
+                        continue
+                    if values.get('address') in taken_macs:
+                        results[i] = exception.MACAlreadyExists(
+                                                        mac=values['address'])
+                        continue
+                    taken_uuids.add(values['uuid'])
+                    if values.get('address'):
+                        taken_macs.add(values['address'])
+                    pending.append(i)
+
+                refs = _bulk_insert(models.Port,
+                                    [values_list[i] for i in pending],
+                                    session)
+                for i, ref in zip(pending, refs):
+                    results[i] = objects.Port._from_db_object(objects.Port(),
+                                                              ref)
+        except db_exc.DBDuplicateEntry:
+            # A port was created with one of the uuids or addresses since
+            # they were checked, and the whole batch was rolled back;
+            # create the ports one by one to tell which.
+            for i in pending:
+                values = values_list[i]
+                try:
+                    results[i] = self.create_port(values)
+                except db_exc.DBDuplicateEntry as e:
+                    if any('address' in column for column in e.columns):
+                        results[i] = exception.MACAlreadyExists(
+                                                        mac=values['address'])
+                    else:
+                        results[i] = exception.PortAlreadyExists(
+                                                        uuid=values['uuid'])
+        return results
+
     @objects.objectify(objects.Port)
-    def update_port(self, port_id, values):
+    def update_port(self, port_id, values, expected=None):
         session = get_session()
         with session.begin():
             query = model_query(models.Port, session=session)
             query = add_port_filter(query, port_id)
+            if expected:
+                query = query.with_lockmode('update')
             try:
                 ref = query.one()
             except NoResultFound:
                 raise exception.PortNotFound(port=port_id)
+            changed = _changed_fields(ref, expected or {})
+            if changed:
+                raise exception.PortUpdateConflict(
+                        port=port_id, fields=', '.join(changed))
             _check_port_change_forbidden(ref, session)
 
             ref.update(values)
@@ -425,6 +932,21 @@ class Connection(api.Connection):
         except NoResultFound:
             raise exception.ChassisNotFound(chassis=chassis_id)
 
+    def get_chassis_uuids(self, chassis_ids):
+        uuids = {}
+        for chunk in _chunks(set(chassis_ids)):
+            query = model_query(models.Chassis.id, models.Chassis.uuid)
+            uuids.update(query.filter(models.Chassis.id.in_(chunk)))
+        return uuids
+
+    def get_all_chassis(self, columns, limit=None, marker=None,
+                        sort_key=None, sort_dir=None):
+        query, columns = _projected_query(models.Chassis, objects.Chassis,
+                                          columns)
+        rows = _paginate_query(models.Chassis, limit, marker,
+                               sort_key, sort_dir, query)
+        return _from_projected_rows(objects.Chassis, columns, rows)
+
     @objects.objectify(objects.Chassis)
     def get_chassis_list(self, limit=None, marker=None,
                          sort_key=None, sort_dir=None):
@@ -443,12 +965,21 @@ class Connection(api.Connection):
         return chassis
 
     @objects.objectify(objects.Chassis)
-    def update_chassis(self, chassis_id, values):
+    def update_chassis(self, chassis_id, values, expected=None):
         session = get_session()
         with session.begin():
             query = model_query(models.Chassis, session=session)
             query = add_identity_filter(query, chassis_id)
 
+            if expected:
+                ref = query.with_lockmode('update').first()
+                if ref is None:
+                    raise exception.ChassisNotFound(chassis=chassis_id)
+                changed = _changed_fields(ref, expected)
+                if changed:
+                    raise exception.ChassisUpdateConflict(
+                            chassis=chassis_id, fields=', '.join(changed))
+
             count = query.update(values)
             if count != 1:
                 raise exception.ChassisNotFound(chassis=chassis_id)
@@ -518,6 +1049,13 @@ class Connection(api.Connection):
             if count == 0:
                 raise exception.ConductorNotFound(conductor=hostname)
 
+    def list_active_conductors(self, interval):
+        limit = timeutils.utcnow() - datetime.timedelta(seconds=interval)
+        result = model_query(models.Conductor.hostname).\
+                    filter(models.Conductor.updated_at >= limit).\
+                    all()
+        return [row[0] for row in result]
+
     def list_active_conductor_drivers(self, interval):
         # TODO(deva): add configurable default 'interval', somewhere higher
         #             up the code. This isn't a db-specific option.
@@ -530,3 +1068,32 @@ class Connection(api.Connection):
         for row in result:
             driver_set.update(set(row['drivers']))
         return list(driver_set)
+
+    def register_master_image(self, values):
+        session = get_session()
+        with session.begin():
+            model_query(models.MasterImage, session=session).\
+                    filter_by(hostname=values['hostname'],
+                              checksum=values['checksum']).\
+                    delete()
+            image = models.MasterImage()
+            image.update(values)
+            image.save(session=session)
+        return image
+
+    def unregister_master_image(self, hostname, checksum):
+        session = get_session()
+        with session.begin():
+            model_query(models.MasterImage, session=session).\
+                    filter_by(hostname=hostname, checksum=checksum).\
+                    delete()
+
+    def get_master_image_peers(self, checksum, interval):
+        limit = timeutils.utcnow() - datetime.timedelta(seconds=interval)
+        return model_query(models.MasterImage).\
+                    join(models.Conductor,
+                         models.Conductor.hostname ==
+                         models.MasterImage.hostname).\
+                    filter(models.MasterImage.checksum == checksum).\
+                    filter(models.Conductor.updated_at >= limit).\
+                    all()
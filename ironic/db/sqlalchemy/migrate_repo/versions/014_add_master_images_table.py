@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from migrate.changeset import UniqueConstraint
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+
+from ironic.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+ENGINE = 'InnoDB'
+CHARSET = 'utf8'
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+
+    master_images = Table('master_images', meta,
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('hostname', String(length=255), nullable=False),
+        Column('checksum', String(length=255), nullable=False),
+        Column('content_checksum', String(length=255), nullable=False),
+        Column('url', String(length=255), nullable=False),
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        mysql_engine=ENGINE,
+        mysql_charset=CHARSET,
+    )
+
+    try:
+        master_images.create()
+    except Exception:
+        LOG.info(repr(master_images))
+        LOG.exception(_('Exception while creating table.'))
+        raise
+
+    uc = UniqueConstraint('hostname', 'checksum',
+                          table=master_images,
+                          name='uniq_master_images0hostname0checksum')
+    uc.create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError(_('Downgrade from version 014 is unsupported.'))
@@ -0,0 +1,40 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+# (table, index name, columns). Paginated lists are ordered by id, so the
+# indexes used by them end with it.
+INDEXES = [
+    ('nodes', 'nodes_reservation_idx', ['reservation']),
+    ('nodes', 'nodes_chassis_id_idx', ['chassis_id', 'id']),
+    ('nodes', 'nodes_provision_state_power_state_idx',
+     ['provision_state', 'power_state']),
+    ('ports', 'ports_node_id_idx', ['node_id', 'id']),
+    ('conductors', 'conductors_updated_at_idx', ['updated_at']),
+]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+
+    for table_name, name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        Index(name, *[table.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError(_('Downgrade from version 015 is unsupported.'))
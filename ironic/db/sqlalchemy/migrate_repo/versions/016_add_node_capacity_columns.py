@@ -0,0 +1,87 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import ast
+import json
+
+import six
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table
+
+from ironic.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+# The node properties copied into columns of their own, with their types
+# and how to convert them, as the DB API does for later updates.
+# Unassociated nodes are looked up by the resources they provide, so the
+# indexes start with instance_uuid.
+COLUMNS = [
+    ('cpus', Integer, int),
+    ('memory_mb', Integer, int),
+    ('local_gb', Integer, int),
+    ('cpu_arch', String(255), six.text_type),
+]
+
+
+def _load_properties(text):
+    try:
+        value = json.loads(text or '{}')
+        if isinstance(value, basestring):
+            value = ast.literal_eval(value)
+        return dict(value or {})
+    except (TypeError, ValueError, SyntaxError):
+        return {}
+
+
+def _coerce(node_id, name, convert, value):
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        # UnicodeError is a ValueError
+        LOG.warning(_('Node %(node)s: not copying its %(name)s property '
+                      '%(value)r into a column.') %
+                    {'node': node_id, 'name': name, 'value': value})
+        return None
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    nodes = Table('nodes', meta, autoload=True)
+
+    for name, type_, convert in COLUMNS:
+        nodes.create_column(Column(name, type_, nullable=True))
+    for name, type_, convert in COLUMNS:
+        Index('nodes_%s_idx' % name, nodes.c.instance_uuid,
+              nodes.c[name]).create()
+
+    rows = migrate_engine.execute(
+            nodes.select().with_only_columns([nodes.c.id,
+                                              nodes.c.properties])).fetchall()
+    for row in rows:
+        properties = _load_properties(row['properties'])
+        values = dict((name, _coerce(row['id'], name, convert,
+                                     properties.get(name)))
+                      for name, type_, convert in COLUMNS)
+        if any(v is not None for v in values.values()):
+            migrate_engine.execute(
+                    nodes.update().where(nodes.c.id == row['id']).
+                          values(**values))
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError(_('Downgrade from version 016 is unsupported.'))
@@ -0,0 +1,36 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+# (index name, columns) of the nodes indexes serving the list filters which
+# no index covered yet; provision_state and reservation already lead one.
+INDEXES = [
+    ('nodes_driver_idx', ['driver', 'id']),
+    ('nodes_power_state_idx', ['power_state', 'id']),
+]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    nodes = Table('nodes', meta, autoload=True)
+
+    for name, columns in INDEXES:
+        Index(name, *[nodes.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError(_('Downgrade from version 017 is unsupported.'))
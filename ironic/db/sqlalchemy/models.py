@@ -30,6 +30,7 @@ from sqlalchemy import schema, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.types import TypeDecorator, VARCHAR
 
+from ironic.common import lazy_json
 from ironic.openstack.common.db.sqlalchemy import models
 
 sql_opts = [
@@ -65,6 +66,25 @@ class JSONEncodedDict(TypeDecorator):
         return value
 
 
+class LazyJSONEncodedDict(JSONEncodedDict):
+    """Represents a dict as a json-encoded string, decoded on first use.
+
+    Loaded values are LazyJSONDict mappings, and are only encoded again
+    when they were decoded.
+    """
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, lazy_json.LazyJSONDict):
+            return value.to_json()
+        return super(LazyJSONEncodedDict, self).process_bind_param(value,
+                                                                   dialect)
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            value = lazy_json.LazyJSONDict(value)
+        return value
+
+
 class IronicBase(models.TimestampMixin,
                  models.ModelBase):
 
@@ -89,7 +109,7 @@ class Chassis(Base):
         )
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
-    extra = Column(JSONEncodedDict)
+    extra = Column(LazyJSONEncodedDict)
     description = Column(String(255), nullable=True)
 
 
@@ -99,19 +119,45 @@ class Conductor(Base):
     __tablename__ = 'conductors'
     __table_args__ = (
         schema.UniqueConstraint('hostname', name='uniq_conductors0hostname'),
+        Index('conductors_updated_at_idx', 'updated_at'),
         )
     id = Column(Integer, primary_key=True)
     hostname = Column(String(255), nullable=False)
     drivers = Column(JSONEncodedDict)
 
 
+class MasterImage(Base):
+    """Represents a master image a conductor serves to its peers."""
+
+    __tablename__ = 'master_images'
+    __table_args__ = (
+        schema.UniqueConstraint('hostname', 'checksum',
+                                name='uniq_master_images0hostname0checksum'),
+        )
+    id = Column(Integer, primary_key=True)
+    hostname = Column(String(255), nullable=False)
+    checksum = Column(String(255), nullable=False)
+    content_checksum = Column(String(255), nullable=False)
+    url = Column(String(255), nullable=False)
+
+
 class Node(Base):
     """Represents a bare metal node."""
 
     __tablename__ = 'nodes'
     __table_args__ = (
         schema.UniqueConstraint('uuid', name='node_uuid_ux'),
-        Index('node_instance_uuid', 'instance_uuid'))
+        Index('node_instance_uuid', 'instance_uuid'),
+        Index('nodes_reservation_idx', 'reservation'),
+        Index('nodes_chassis_id_idx', 'chassis_id', 'id'),
+        Index('nodes_provision_state_power_state_idx',
+              'provision_state', 'power_state'),
+        Index('nodes_cpus_idx', 'instance_uuid', 'cpus'),
+        Index('nodes_memory_mb_idx', 'instance_uuid', 'memory_mb'),
+        Index('nodes_local_gb_idx', 'instance_uuid', 'local_gb'),
+        Index('nodes_cpu_arch_idx', 'instance_uuid', 'cpu_arch'),
+        Index('nodes_driver_idx', 'driver', 'id'),
+        Index('nodes_power_state_idx', 'power_state', 'id'))
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
     instance_uuid = Column(String(36), nullable=True)
@@ -121,11 +167,17 @@ class Node(Base):
     provision_state = Column(String(15), nullable=True)
     target_provision_state = Column(String(15), nullable=True)
     last_error = Column(Text, nullable=True)
-    properties = Column(JSONEncodedDict)
+    properties = Column(LazyJSONEncodedDict)
     driver = Column(String(15))
-    driver_info = Column(JSONEncodedDict)
+    driver_info = Column(LazyJSONEncodedDict)
     reservation = Column(String(255), nullable=True)
-    extra = Column(JSONEncodedDict)
+    extra = Column(LazyJSONEncodedDict)
+    # copies of the properties used to select nodes, kept in sync with
+    # properties by the db api so that they can be filtered on
+    cpus = Column(Integer, nullable=True)
+    memory_mb = Column(Integer, nullable=True)
+    local_gb = Column(Integer, nullable=True)
+    cpu_arch = Column(String(255), nullable=True)
 
 
 class Port(Base):
@@ -134,9 +186,10 @@ class Port(Base):
     __tablename__ = 'ports'
     __table_args__ = (
         schema.UniqueConstraint('address', name='iface_address_ux'),
-        schema.UniqueConstraint('uuid', name='port_uuid_ux'))
+        schema.UniqueConstraint('uuid', name='port_uuid_ux'),
+        Index('ports_node_id_idx', 'node_id', 'id'))
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
     address = Column(String(18))
     node_id = Column(Integer, ForeignKey('nodes.id'), nullable=True)
-    extra = Column(JSONEncodedDict)
+    extra = Column(LazyJSONEncodedDict)
@@ -111,6 +111,21 @@ class DeployInterface(object):
         :returns: status of the deploy. One of ironic.common.states.
         """
 
+    def prefetch_image(self, context, image_ref, kind):
+        """Fetch an image into the image caches of this interface.
+
+        Deploys of the image then find it in the caches rather than
+        fetching it while holding the lock of their node. Interfaces which
+        keep no image caches do not override this method.
+
+        :param context: context.
+        :param image_ref: the reference of the image.
+        :param kind: 'tftp' for kernels and ramdisks, or 'instance'.
+        :returns: True if the image was fetched, False if this interface
+                  keeps no image caches.
+        """
+        return False
+
 
 @six.add_metaclass(abc.ABCMeta)
 class PowerInterface(object):
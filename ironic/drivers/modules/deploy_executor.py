@@ -0,0 +1,102 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""
+Bounded executor for the I/O heavy part of deployments.
+
+Writing an image to a node saturates the conductor's disks and NICs, so
+running every deploy that calls back at once makes all of them slow.
+Jobs submitted here run on a fixed number of workers; the others wait
+in a FIFO queue.
+"""
+
+import sys
+
+import eventlet
+from eventlet import event
+from eventlet import queue
+from oslo.config import cfg
+
+from ironic.openstack.common import log as logging
+
+
+executor_opts = [
+    cfg.IntOpt('workers',
+               default=4,
+               help='Maximum number of deploys writing images to nodes at '
+                    'the same time on this conductor. Extra deploys wait '
+                    'in FIFO order.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(executor_opts, group='deploy')
+
+LOG = logging.getLogger(__name__)
+
+
+class DeployExecutor(object):
+    """Run jobs on a fixed number of green workers, in submission order."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.running = 0
+        self._queue = queue.Queue()
+        self._pool = eventlet.GreenPool(workers)
+        for i in range(workers):
+            self._pool.spawn_n(self._work)
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a free worker."""
+        return self._queue.qsize()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) for execution.
+
+        :returns: an eventlet Event; its wait() returns the result of the
+                  job or raises the exception the job raised.
+        """
+        job = event.Event()
+        self._queue.put((job, func, args, kwargs))
+        LOG.debug(_("Queued deploy job %(func)s, %(running)d running, "
+                    "%(depth)d waiting."),
+                  {'func': getattr(func, '__name__', func),
+                   'running': self.running, 'depth': self.queue_depth})
+        return job
+
+    def _work(self):
+        while True:
+            job, func, args, kwargs = self._queue.get()
+            self.running += 1
+            try:
+                job.send(func(*args, **kwargs))
+            except Exception:
+                LOG.exception(_("Deploy job %s failed.") %
+                              getattr(func, '__name__', func))
+                job.send_exception(*sys.exc_info())
+            finally:
+                self.running -= 1
+
+
+_EXECUTOR = None
+
+
+def get_executor():
+    """Return the conductor-wide deploy executor."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = DeployExecutor(CONF.deploy.workers)
+    return _EXECUTOR
@@ -16,6 +16,7 @@
 #    under the License.
 
 
+import errno
 import os
 import time
 
@@ -23,18 +24,114 @@ import re
 import socket
 import stat
 
+from oslo.config import cfg
+
 from ironic.common import exception
 from ironic.common import utils
 from ironic.openstack.common import excutils
+from ironic.openstack.common import jsonutils
 from ironic.openstack.common import log as logging
-
+from ironic.openstack.common import loopingcall
+
+
+deploy_opts = [
+    cfg.BoolOpt('sparse_image_write',
+                default=True,
+                help='Only copy the allocated extents of the root image to '
+                     'the node instead of every block of it.'),
+    cfg.StrOpt('image_hole_policy',
+               default='auto',
+               help='How to handle the holes of the root image skipped by '
+                    'sparse_image_write. The holes must read back zeros: '
+                    'an image converted by qemu-img has holes where its '
+                    'blocks were zeros, and they would otherwise read '
+                    'back the previous content of the disk. "auto" '
+                    'discards them when the target reports reading back '
+                    'zeros after a discard, and zeroes them otherwise. '
+                    '"zeroout" always zeroes them, writing zeros when the '
+                    'target can not do it by itself. "discard" discards '
+                    'them. "none" leaves them untouched, only for disks '
+                    'known to hold zeros already.'),
+    cfg.IntOpt('ready_timeout',
+               default=60,
+               help='Seconds to wait for iSCSI devices, partitions and the '
+                    'deploy ramdisk to become ready during a deploy.'),
+    cfg.IntOpt('ionice_class',
+               help='Run the dd processes copying images to nodes with this '
+                    'ionice scheduling class: 1 (realtime), 2 (best-effort) '
+                    'or 3 (idle). Unset leaves the I/O priority alone.'),
+    cfg.IntOpt('ionice_level',
+               default=4,
+               help='ionice priority, from 0 (highest) to 7, of the dd '
+                    'processes when ionice_class is set.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(deploy_opts, group='deploy')
 
 LOG = logging.getLogger(__name__)
 
+# Linux values of the lseek() whence flags, python 2 does not expose them.
+SEEK_DATA = 3
+SEEK_HOLE = 4
+
+# Image extents are aligned to, and copied in, blocks of this size.
+BLOCK_SIZE = 1024 * 1024
+
+# Holes smaller than this are copied along with the data around them:
+# spawning another dd costs more than pushing a few MB of zeros.
+MIN_HOLE_SIZE = 16 * BLOCK_SIZE
+
+# Seconds between two checks while waiting for something to be ready.
+POLL_INTERVAL = 0.5
+
 
 # All functions are called from deploy() directly or indirectly.
 # They are split for stub-out.
 
+def wait_for(condition, timeout=None):
+    """Poll condition() until it is true or timeout seconds have passed.
+
+    The polling runs in a green timer, so other greenthreads keep running
+    while we wait.
+
+    :param condition: a callable returning True once ready.
+    :param timeout: seconds to wait, defaults to CONF.deploy.ready_timeout.
+    :returns: True if the condition was met, False on timeout.
+    """
+    if timeout is None:
+        timeout = CONF.deploy.ready_timeout
+    deadline = time.time() + timeout
+
+    def _poll():
+        if condition():
+            raise loopingcall.LoopingCallDone(True)
+        if time.time() >= deadline:
+            raise loopingcall.LoopingCallDone(False)
+
+    timer = loopingcall.FixedIntervalLoopingCall(_poll)
+    return timer.start(interval=POLL_INTERVAL).wait()
+
+
+def wait_for_path(path):
+    """Wait for a device node to show up."""
+    if not wait_for(lambda: os.path.exists(path)):
+        LOG.warn(_("Device %s did not show up in time."), path)
+        return False
+    return True
+
+
+def udev_settle():
+    """Wait for udev to process the events queued so far."""
+    try:
+        utils.execute('udevadm', 'settle',
+                      '--timeout=%d' % CONF.deploy.ready_timeout,
+                      check_exit_code=[0])
+    except exception.ProcessExecutionError as e:
+        # Not fatal, callers still wait for the nodes they need.
+        LOG.warn(_("udevadm settle failed: %s"), e)
+
+
 def discovery(portal_address, portal_port):
     """Do iSCSI discovery on portal."""
     utils.execute('iscsiadm',
@@ -54,8 +151,8 @@ def login_iscsi(portal_address, portal_port, target_iqn):
                   '--login',
                   run_as_root=True,
                   check_exit_code=[0])
-    # Ensure the login complete
-    time.sleep(3)
+    # Let udev create the /dev/disk/by-path links for the new session.
+    udev_settle()
 
 
 def logout_iscsi(portal_address, portal_port, target_iqn):
@@ -81,8 +178,9 @@ def make_partitions(dev, root_mb, swap_mb):
             run_as_root=True,
             attempts=3,
             check_exit_code=[0])
-    # avoid "device is busy"
-    time.sleep(3)
+    # avoid "device is busy" by letting udev finish with the new
+    # partition table before anyone opens the partitions.
+    udev_settle()
 
 
 def is_block_device(dev):
@@ -91,17 +189,97 @@ def is_block_device(dev):
     return stat.S_ISBLK(s.st_mode)
 
 
+def _ionice(*cmd):
+    """Prefix cmd with ionice when an I/O scheduling class is configured."""
+    if CONF.deploy.ionice_class is None:
+        return cmd
+    return ('ionice',
+            '-c', str(CONF.deploy.ionice_class),
+            '-n', str(CONF.deploy.ionice_level)) + cmd
+
+
 def dd(src, dst):
     """Execute dd from src to dst."""
-    utils.execute('dd',
+    utils.execute(*_ionice('dd',
                   'if=%s' % src,
                   'of=%s' % dst,
                   'bs=1M',
+                  'oflag=direct'),
+                  run_as_root=True,
+                  check_exit_code=[0])
+
+
+def dd_extent(src, dst, offset, length):
+    """Copy length bytes at offset from src to the same offset in dst.
+
+    Both offset and length must be multiples of BLOCK_SIZE.
+    """
+    utils.execute(*_ionice('dd',
+                  'if=%s' % src,
+                  'of=%s' % dst,
+                  'bs=%d' % BLOCK_SIZE,
+                  'skip=%d' % (offset / BLOCK_SIZE),
+                  'seek=%d' % (offset / BLOCK_SIZE),
+                  'count=%d' % (length / BLOCK_SIZE),
                   'oflag=direct',
+                  'conv=notrunc'),
                   run_as_root=True,
                   check_exit_code=[0])
 
 
+def zero_extent(dev, offset, length, discard=False):
+    """Make a range of a device read back zeros.
+
+    Uses BLKZEROOUT (or BLKDISCARD when discard is True) so no zeros
+    cross the wire when the target supports it. A range the target
+    refuses to zero out is overwritten with zeros instead.
+
+    :raises: ProcessExecutionError if the range could not be zeroed.
+    """
+    args = ['blkdiscard', '-o', offset, '-l', length, dev]
+    if not discard:
+        args.insert(1, '-z')
+    try:
+        utils.execute(*args, run_as_root=True, check_exit_code=[0])
+    except exception.ProcessExecutionError:
+        if discard:
+            raise
+        LOG.debug(_("Device %s can not zero out ranges, writing zeros "
+                    "instead."), dev)
+        dd_extent('/dev/zero', dev, offset, length)
+
+
+def _queue_limit(dev, name):
+    """Read an attribute of the request queue of a block device.
+
+    :returns: its integer value, or None when it can not be read.
+    """
+    block = os.path.realpath('/sys/class/block/%s'
+                             % os.path.basename(os.path.realpath(dev)))
+    # a partition has no queue of its own, the queue of its disk is used
+    for path in (block, os.path.dirname(block)):
+        try:
+            with open(os.path.join(path, 'queue', name)) as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            continue
+    return None
+
+
+def get_hole_policy(dev):
+    """Return the policy applied to the holes of an image written to dev.
+
+    The "auto" policy discards the holes when the target reports that
+    discarded blocks read back zeros, and zeroes them otherwise.
+    """
+    policy = CONF.deploy.image_hole_policy
+    if policy != 'auto':
+        return policy
+    if _queue_limit(dev, 'discard_zeroes_data') == 1:
+        return 'discard'
+    return 'zeroout'
+
+
 def mkswap(dev, label='swap1'):
     """Execute mkswap on a device."""
     utils.execute('mkswap',
@@ -120,27 +298,60 @@ def block_uuid(dev):
 
 
 def switch_pxe_config(path, root_uuid):
-    """Switch a pxe config from deployment mode to service mode."""
+    """Switch a pxe config from deployment mode to service mode.
+
+    Handles both pxelinux configs and iPXE scripts.
+    """
     with open(path) as f:
         lines = f.readlines()
     root = 'UUID=%s' % root_uuid
     rre = re.compile(r'\{\{ ROOT \}\}')
     dre = re.compile('^default .*$')
+    gre = re.compile('^goto deploy$')
     with open(path, 'w') as f:
         for line in lines:
             line = rre.sub(root, line)
             line = dre.sub('default boot', line)
+            line = gre.sub('goto boot', line)
             f.write(line)
 
 
-def notify(address, port):
-    """Notify a node that it becomes ready to reboot."""
+def _try_notify(address, port, timeout=None):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if timeout is not None:
+        s.settimeout(timeout)
     try:
         s.connect((address, port))
         s.send('done')
+    except socket.timeout:
+        return False
+    except socket.error as e:
+        if e.errno != errno.ECONNREFUSED:
+            raise
+        return False
     finally:
         s.close()
+    return True
+
+
+def notify(address, port):
+    """Notify a node that it becomes ready to reboot.
+
+    The deploy ramdisk starts listening on the port only after it posted
+    its deploy info, so retry until it accepts the connection.
+    """
+    deadline = time.time() + CONF.deploy.ready_timeout
+
+    def _notify():
+        # a connection to an unreachable address must not block past the
+        # end of the wait
+        timeout = max(deadline - time.time(), 0.1)
+        return _try_notify(address, port, timeout)
+
+    if not wait_for(_notify):
+        raise exception.InstanceDeployFailure(_(
+            "Node %(address)s did not listen on port %(port)s.") %
+            {'address': address, 'port': port})
 
 
 def get_dev(address, port, iqn, lun):
@@ -159,22 +370,133 @@ def get_image_mb(image_path):
     return image_mb
 
 
+def _seek_data_extents(image_path):
+    """List the data extents of a file with SEEK_DATA/SEEK_HOLE.
+
+    :raises: OSError if the filesystem does not support them.
+    """
+    extents = []
+    fd = os.open(image_path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        offset = 0
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, SEEK_DATA)
+            except OSError as e:
+                # ENXIO means there is no data past offset.
+                if e.errno == errno.ENXIO:
+                    break
+                raise
+            end = os.lseek(fd, start, SEEK_HOLE)
+            extents.append((start, end - start))
+            offset = end
+    finally:
+        os.close(fd)
+    return extents
+
+
+def _qemu_img_map_extents(image_path):
+    """List the data extents of a raw image with 'qemu-img map'."""
+    out, err = utils.execute('qemu-img', 'map', '--output=json',
+                             '-f', 'raw', image_path)
+    return [(e['start'], e['length']) for e in jsonutils.loads(out)
+            if e.get('data')]
+
+
+def _align_extents(extents, size):
+    """Align extents to BLOCK_SIZE and merge the ones close together."""
+    aligned = []
+    limit = (size + BLOCK_SIZE - 1) / BLOCK_SIZE * BLOCK_SIZE
+    for offset, length in sorted(extents):
+        start = offset / BLOCK_SIZE * BLOCK_SIZE
+        end = min(limit, (offset + length + BLOCK_SIZE - 1)
+                         / BLOCK_SIZE * BLOCK_SIZE)
+        if aligned and start - aligned[-1][1] < MIN_HOLE_SIZE:
+            aligned[-1][1] = max(aligned[-1][1], end)
+        elif end > start:
+            aligned.append([start, end])
+    return [(start, end - start) for start, end in aligned]
+
+
+def get_image_extents(image_path):
+    """Find the ranges of a raw image that hold data.
+
+    :param image_path: path of a raw image.
+    :returns: a sorted list of non overlapping (offset, length) tuples,
+              aligned to BLOCK_SIZE.
+    """
+    size = os.path.getsize(image_path)
+    try:
+        extents = _seek_data_extents(image_path)
+    except OSError:
+        try:
+            extents = _qemu_img_map_extents(image_path)
+        except (exception.ProcessExecutionError, OSError,
+                ValueError, KeyError):
+            LOG.debug(_("Can not map the extents of %s, it will be "
+                        "copied in full."), image_path)
+            extents = [(0, size)]
+    return _align_extents(extents, size)
+
+
+def write_image(image_path, dev):
+    """Write a raw image to a device, skipping its holes when possible.
+
+    :param image_path: path of a raw image.
+    :param dev: the device to write to.
+    :returns: the number of bytes written to the device.
+    """
+    size = os.path.getsize(image_path)
+    if not CONF.deploy.sparse_image_write:
+        dd(image_path, dev)
+        return size
+
+    extents = get_image_extents(image_path)
+    written = 0
+    for offset, length in extents:
+        dd_extent(image_path, dev, offset, length)
+        written += min(length, size - offset)
+
+    policy = get_hole_policy(dev)
+    if policy not in ('zeroout', 'discard', 'none'):
+        LOG.warn(_("Unknown image_hole_policy '%s', zeroing the holes of "
+                   "the image."), policy)
+        policy = 'zeroout'
+    if policy != 'none':
+        offset = 0
+        for start, length in extents + [(size, 0)]:
+            if start > offset:
+                # Round up: the tail of a partial last block is zeroed too.
+                hole = (min(start, size) - offset + BLOCK_SIZE - 1) \
+                        / BLOCK_SIZE * BLOCK_SIZE
+                zero_extent(dev, offset, hole,
+                            discard=(policy == 'discard'))
+            offset = start + length
+
+    LOG.info(_("Wrote %(written)d of %(size)d bytes of image %(image)s "
+               "to %(dev)s."),
+             {'written': written, 'size': size, 'image': image_path,
+              'dev': dev})
+    return written
+
+
 def work_on_disk(dev, root_mb, swap_mb, image_path):
     """Creates partitions and write an image to the root partition."""
     root_part = "%s-part1" % dev
     swap_part = "%s-part2" % dev
 
-    if not is_block_device(dev):
+    if not wait_for_path(dev) or not is_block_device(dev):
         LOG.warn(_("parent device '%s' not found"), dev)
         return
     make_partitions(dev, root_mb, swap_mb)
-    if not is_block_device(root_part):
+    if not wait_for_path(root_part) or not is_block_device(root_part):
         LOG.warn(_("root device '%s' not found"), root_part)
         return
-    if not is_block_device(swap_part):
+    if not wait_for_path(swap_part) or not is_block_device(swap_part):
         LOG.warn(_("swap device '%s' not found"), swap_part)
         return
-    dd(image_path, root_part)
+    write_image(image_path, root_part)
     mkswap(swap_part)
 
     try:
@@ -206,6 +528,4 @@ def deploy(address, port, iqn, lun, image_path, pxe_config_path,
     finally:
         logout_iscsi(address, port, iqn)
     switch_pxe_config(pxe_config_path, root_uuid)
-    # Ensure the node started netcat on the port after POST the request.
-    time.sleep(3)
     notify(address, 10000)
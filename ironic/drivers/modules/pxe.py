@@ -18,9 +18,16 @@
 PXE Driver and supporting meta-classes.
 """
 
+import errno
+import hashlib
 import os
+import random
+import socket
 import tempfile
+import time
+import urllib2
 
+import eventlet
 import jinja2
 from oslo.config import cfg
 
@@ -32,9 +39,12 @@ from ironic.common import keystone
 from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import task_manager
+from ironic.db import api as dbapi
 from ironic.drivers import base
+from ironic.drivers.modules import deploy_executor
 from ironic.drivers.modules import deploy_utils
 from ironic.openstack.common import context
+from ironic.openstack.common import excutils
 from ironic.openstack.common import fileutils
 from ironic.openstack.common import lockutils
 from ironic.openstack.common import log as logging
@@ -55,21 +65,79 @@ pxe_opts = [
     cfg.StrOpt('pxe_config_template',
                default='$pybasedir/drivers/modules/pxe_config.template',
                help='Template file for PXE configuration'),
+    cfg.StrOpt('ipxe_config_template',
+               default='$pybasedir/drivers/modules/ipxe_config.template',
+               help='Template file for the iPXE script of a node, used '
+                    'instead of pxe_config_template when booting over '
+                    'HTTP'),
+    cfg.StrOpt('ipxe_boot_script',
+               default='$pybasedir/drivers/modules/boot.ipxe',
+               help='iPXE script copied to the root of http_root. Nodes '
+                    'chainloading iPXE should be pointed at it, it loads '
+                    'the iPXE script matching their MAC address'),
     cfg.IntOpt('pxe_deploy_timeout',
                 help='Timeout for PXE deployments. Default: 0 (unlimited)',
                 default=0),
     cfg.StrOpt('tftp_root',
                default='/tftpboot',
                help='Ironic compute node\'s tftp root path'),
+    cfg.StrOpt('boot_protocol',
+               default='tftp',
+               help='How nodes fetch their boot configuration, kernels and '
+                    'ramdisks: "tftp" with pxelinux, or "http" with iPXE. '
+                    'Drivers and the pxe_boot_protocol field of a node\'s '
+                    'driver_info override it'),
+    cfg.StrOpt('http_root',
+               default='/httpboot',
+               help='Directory served over HTTP to nodes booting with iPXE. '
+                    'It must be on the same filesystem as tftp_master_path'),
+    cfg.StrOpt('http_url',
+               help='URL under which http_root is served to the nodes, '
+                    'e.g. http://192.0.2.1:8080'),
+    cfg.StrOpt('deploy_mode',
+               default='iscsi',
+               help='How the instance image is written to a node: '
+                    '"iscsi", the conductor writes it to the disk the '
+                    'deploy ramdisk exports over iSCSI, or "pull", the '
+                    'deploy ramdisk downloads it from http_url and writes '
+                    'it itself. The pxe_deploy_mode field of a node\'s '
+                    'driver_info overrides it'),
     cfg.StrOpt('images_path',
                default='/var/lib/ironic/images/',
-               help='Directory where images are stored on disk'),
+               help='Directory where images are stored on disk. With the '
+                    'pull deploy mode it must be on the same filesystem as '
+                    'http_root'),
     cfg.StrOpt('tftp_master_path',
                default='/tftpboot/master_images',
                help='Directory where master tftp images are stored on disk'),
     cfg.StrOpt('instance_master_path',
                default='/var/lib/ironic/master_images',
-               help='Directory where master tftp images are stored on disk')
+               help='Directory where master tftp images are stored on disk'),
+    cfg.BoolOpt('share_master_images',
+                default=False,
+                help='Whether conductors share their instance master '
+                     'images: this conductor downloads them from the '
+                     'other conductors serving them before trying Glance, '
+                     'and serves its own if master_images_url is set. A '
+                     'download is only kept if its md5 checksum is the one '
+                     'of the Glance image, so images converted after being '
+                     'downloaded from Glance are not shared'),
+    cfg.StrOpt('master_images_url',
+               help='URL under which this conductor serves '
+                    'instance_master_path to the other conductors. When '
+                    'set along with share_master_images, its instance '
+                    'master images are advertised and the other conductors '
+                    'download them from here rather than from Glance'),
+    cfg.IntOpt('peer_timeout',
+               default=60,
+               help='Seconds to wait for a peer conductor serving a master '
+                    'image before trying the next one, or Glance'),
+    cfg.IntOpt('api_url_ttl',
+               default=300,
+               help='Seconds the Ironic API url found in the Keystone '
+                    'service catalog is used before being looked up again, '
+                    'when api_url is not set. The lookup is done in the '
+                    'background, deploys keep using the old url meanwhile.'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -77,6 +145,63 @@ LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 CONF.register_opts(pxe_opts, group='pxe')
 CONF.import_opt('use_ipv6', 'ironic.netconf')
+CONF.import_opt('host', 'ironic.common.service')
+CONF.import_opt('max_time_interval', 'ironic.conductor.rpcapi',
+                group='conductor')
+
+BOOT_PROTOCOLS = ('tftp', 'http')
+DEPLOY_MODES = ('iscsi', 'pull')
+
+
+def _get_boot_protocol(node, default=None):
+    """Get the protocol a node fetches its boot files with.
+
+    :param node: a single Node.
+    :param default: the protocol of the driver, if any.
+    :returns: 'tftp' or 'http'.
+    :raises: InvalidParameterValue if the protocol is unknown, or is
+             'http' while CONF.pxe.http_url is not set.
+    """
+    info = node.get('driver_info', {})
+    protocol = (info.get('pxe_boot_protocol') or default or
+                CONF.pxe.boot_protocol)
+    if protocol not in BOOT_PROTOCOLS:
+        raise exception.InvalidParameterValue(_(
+            "Unknown boot protocol %(protocol)s, expected one of "
+            "%(protocols)s.") % {'protocol': protocol,
+                                 'protocols': BOOT_PROTOCOLS})
+    if protocol == 'http' and not CONF.pxe.http_url:
+        raise exception.InvalidParameterValue(_(
+            "Booting over HTTP needs the http_url option to be set."))
+    return protocol
+
+
+def _get_deploy_mode(node, default=None):
+    """Get how the instance image is written to a node.
+
+    :param node: a single Node.
+    :param default: the deploy mode of the driver, if any.
+    :returns: 'iscsi' or 'pull'.
+    :raises: InvalidParameterValue if the mode is unknown, or is 'pull'
+             while CONF.pxe.http_url is not set.
+    """
+    info = node.get('driver_info', {})
+    mode = info.get('pxe_deploy_mode') or default or CONF.pxe.deploy_mode
+    if mode not in DEPLOY_MODES:
+        raise exception.InvalidParameterValue(_(
+            "Unknown deploy mode %(mode)s, expected one of %(modes)s.") %
+            {'mode': mode, 'modes': DEPLOY_MODES})
+    if mode == 'pull' and not CONF.pxe.http_url:
+        raise exception.InvalidParameterValue(_(
+            "The pull deploy mode needs the http_url option to be set."))
+    return mode
+
+
+def _get_boot_root(protocol):
+    """Directory the boot files are served from with protocol."""
+    if protocol == 'http':
+        return CONF.pxe.http_root
+    return CONF.pxe.tftp_root
 
 
 def _parse_driver_info(node):
@@ -127,7 +252,78 @@ def _parse_driver_info(node):
     return d_info
 
 
-def _build_pxe_config(node, pxe_info):
+class _ApiUrlCache(object):
+    """Ironic API url from the service catalog, refreshed in the background.
+
+    Only the first lookup blocks. Once the url is older than
+    CONF.pxe.api_url_ttl, callers keep getting it while a single green
+    thread looks it up again.
+    """
+
+    def __init__(self):
+        self.url = None
+        self.expires = 0
+        self.refreshing = False
+
+    def get(self):
+        if self.url is None:
+            return self._refresh()
+        if time.time() >= self.expires and not self.refreshing:
+            self.refreshing = True
+            eventlet.spawn_n(self._background_refresh)
+        return self.url
+
+    def _refresh(self):
+        url = keystone.get_service_url()
+        self.url = url
+        self.expires = time.time() + CONF.pxe.api_url_ttl
+        return url
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            LOG.warn(_("Could not refresh the Ironic API url from the "
+                       "service catalog, still using %(url)s: %(error)s") %
+                     {'url': self.url, 'error': e})
+        finally:
+            self.refreshing = False
+
+
+_API_URL_CACHE = _ApiUrlCache()
+
+# Compiled PXE config templates and the mtime of their file, by path.
+_PXE_TEMPLATES = {}
+
+
+def _get_api_url():
+    return CONF.api_url or _API_URL_CACHE.get()
+
+
+def _get_pxe_template(path):
+    """Return the compiled PXE config template at path.
+
+    The template is compiled again only when its file was modified.
+    """
+    mtime = os.stat(path).st_mtime
+    cached = _PXE_TEMPLATES.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    tmpl_path, tmpl_file = os.path.split(path)
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(tmpl_path))
+    template = env.get_template(tmpl_file)
+    _PXE_TEMPLATES[path] = (mtime, template)
+    return template
+
+
+def _get_http_url(path):
+    """URL of a file under CONF.pxe.http_root."""
+    return '/'.join([CONF.pxe.http_url.rstrip('/'),
+                     os.path.relpath(path, CONF.pxe.http_root)])
+
+
+def _build_pxe_config(node, pxe_info, protocol='tftp'):
     """Build the PXE config file for a node
 
     This method builds the PXE boot configuration file for a node,
@@ -137,11 +333,13 @@ def _build_pxe_config(node, pxe_info):
     to the two phases of booting. This may be extended later.
 
     :param pxe_options: A dict of values to set on the configuarion file
+    :param protocol: 'tftp' builds a pxelinux config, 'http' an iPXE
+                     script loading the files from CONF.pxe.http_url.
     :returns: A formated string with the file content.
     """
     LOG.debug(_("Building PXE config for deployment %s.") % node['id'])
 
-    ironic_api = CONF.api_url or keystone.get_service_url()
+    ironic_api = _get_api_url()
 
     deploy_key = utils.random_alnum(32)
     ctx = context.get_admin_context()
@@ -150,21 +348,27 @@ def _build_pxe_config(node, pxe_info):
     node['driver_info'] = driver_info
     node.save(ctx)
 
+    if protocol == 'http':
+        get_location = _get_http_url
+        template_path = CONF.pxe.ipxe_config_template
+    else:
+        get_location = lambda path: path
+        template_path = CONF.pxe.pxe_config_template
+
     pxe_options = {
             'deployment_id': node['uuid'],
             'deployment_key': deploy_key,
             'deployment_iscsi_iqn': "iqn-%s" % node['instance_uuid'],
-            'deployment_aki_path': pxe_info['deploy_kernel'][1],
-            'deployment_ari_path': pxe_info['deploy_ramdisk'][1],
-            'aki_path': pxe_info['kernel'][1],
-            'ari_path': pxe_info['ramdisk'][1],
+            'deployment_aki_path': get_location(pxe_info['deploy_kernel'][1]),
+            'deployment_ari_path': get_location(
+                                            pxe_info['deploy_ramdisk'][1]),
+            'aki_path': get_location(pxe_info['kernel'][1]),
+            'ari_path': get_location(pxe_info['ramdisk'][1]),
             'ironic_api_url': ironic_api,
             'pxe_append_params': CONF.pxe.pxe_append_params,
         }
 
-    tmpl_path, tmpl_file = os.path.split(CONF.pxe.pxe_config_template)
-    env = jinja2.Environment(loader=jinja2.FileSystemLoader(tmpl_path))
-    template = env.get_template(tmpl_file)
+    template = _get_pxe_template(template_path)
     return template.render({'pxe_options': pxe_options,
                             'ROOT': '{{ ROOT }}'})
 
@@ -181,22 +385,23 @@ def _get_node_mac_addresses(task, node):
             return [p.address for p in r.ports]
 
 
-def _get_pxe_mac_path(mac):
+def _get_pxe_mac_path(mac, protocol='tftp'):
     """Convert a MAC address into a PXE config file name.
 
     :param mac: A mac address string in the format xx:xx:xx:xx:xx:xx.
+    :param protocol: 'tftp' for the pxelinux name of the file, 'http'
+                     for the name boot.ipxe looks up.
     :returns: the path to the config file.
     """
-    return os.path.join(
-            CONF.pxe.tftp_root,
-            'pxelinux.cfg',
-            "01-" + mac.replace(":", "-").lower()
-        )
+    name = mac.replace(":", "-").lower()
+    if protocol != 'http':
+        name = "01-" + name
+    return os.path.join(_get_boot_root(protocol), 'pxelinux.cfg', name)
 
 
-def _get_pxe_config_file_path(instance_uuid):
+def _get_pxe_config_file_path(instance_uuid, protocol='tftp'):
     """Generate the path for an instances PXE config file."""
-    return os.path.join(CONF.pxe.tftp_root, instance_uuid, 'config')
+    return os.path.join(_get_boot_root(protocol), instance_uuid, 'config')
 
 
 def _get_image_dir_path(d_info):
@@ -218,6 +423,109 @@ def _link_master_image(path, dest_path):
         os.link(path, dest_path)
 
 
+def _is_shared_master_image(path):
+    """Whether path is a master image peers can ask this conductor for.
+
+    Only instance master images named after their image service checksum
+    are shared.
+    """
+    return (os.path.dirname(os.path.normpath(path)) ==
+            os.path.normpath(CONF.pxe.instance_master_path) and
+            os.path.basename(path).startswith('md5-'))
+
+
+def _advertise_master_image(path):
+    """Let the other conductors download the master image at path.
+
+    Only an image stored as the image service gave it is advertised, since
+    its peers check its content against the image service checksum.
+    """
+    if (not CONF.pxe.share_master_images or
+            not CONF.pxe.master_images_url or
+            not _is_shared_master_image(path)):
+        return
+    name = os.path.basename(path)
+    if _get_image_checksums(path).get('md5') != name[len('md5-'):]:
+        return
+    dbapi.get_instance().register_master_image(
+            {'hostname': CONF.host,
+             'checksum': name[len('md5-'):],
+             'content_checksum': _get_image_checksum(path, 'sha1')[1],
+             'url': '/'.join([CONF.pxe.master_images_url.rstrip('/'),
+                              name])})
+
+
+def _withdraw_master_image(path):
+    """Stop advertising the master image at path, which was deleted."""
+    if not CONF.pxe.master_images_url or not _is_shared_master_image(path):
+        return
+    dbapi.get_instance().unregister_master_image(
+            CONF.host, os.path.basename(path)[len('md5-'):])
+
+
+def _download_from_peer(url, path):
+    """Download url to path.
+
+    :returns: a tuple of the md5 and sha1 checksums of the downloaded
+              content.
+    """
+    md5 = hashlib.md5()
+    sha1 = hashlib.sha1()
+    response = urllib2.urlopen(url, timeout=CONF.pxe.peer_timeout)
+    try:
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: response.read(1024 * 1024), ''):
+                md5.update(chunk)
+                sha1.update(chunk)
+                f.write(chunk)
+    finally:
+        response.close()
+    return md5.hexdigest(), sha1.hexdigest()
+
+
+def _fetch_master_image_from_peers(master_image, path):
+    """Try to download a master image from the conductors serving it.
+
+    Peers are tried in random order to spread the load, and a download
+    is only kept if its content has the md5 checksum the image service
+    gave the image, which the master image is named after: what a peer
+    advertises is not trusted.
+
+    :param master_image: the path of the master image to fetch.
+    :param path: where to download it.
+    :returns: the sha1 checksum of the downloaded image, or None if no
+              peer could provide it.
+    """
+    if (not CONF.pxe.share_master_images or
+            not _is_shared_master_image(master_image)):
+        return None
+    checksum = os.path.basename(master_image)[len('md5-'):]
+    peers = [peer for peer in dbapi.get_instance().get_master_image_peers(
+                                checksum, CONF.conductor.max_time_interval)
+             if peer['hostname'] != CONF.host]
+    random.shuffle(peers)
+    for peer in peers:
+        try:
+            md5, content_checksum = _download_from_peer(peer['url'], path)
+        except (IOError, socket.error, urllib2.URLError) as e:
+            LOG.warn(_("Failed to download master image %(image)s from "
+                       "conductor %(host)s: %(error)s") %
+                     {'image': master_image, 'host': peer['hostname'],
+                      'error': e})
+            continue
+        if md5 != checksum:
+            LOG.warn(_("Master image %(image)s downloaded from conductor "
+                       "%(host)s does not match the image service "
+                       "checksum.") %
+                     {'image': master_image, 'host': peer['hostname']})
+            continue
+        LOG.debug(_("Downloaded master image %(image)s from conductor "
+                    "%(host)s.") % {'image': master_image,
+                                    'host': peer['hostname']})
+        return content_checksum
+    return None
+
+
 @lockutils.synchronized('master_image', 'ironic-')
 def _unlink_master_image(path):
     #TODO(ghe): keep images for a while (kind of local cache)
@@ -231,6 +539,7 @@ def _unlink_master_image(path):
     # os.listdir('.') if os.stat('./' + f).st_nlink == 1], key=lambda s: s[1])
     if os.path.exists(path) and os.stat(path).st_nlink == 1:
         utils.unlink_without_raise(path)
+        _withdraw_master_image(path)
 
 
 @lockutils.synchronized('master_image', 'ironic-')
@@ -266,7 +575,53 @@ def _remove_download_in_progress_lock(lock_file):
     fileutils.delete_if_exists(lock_file)
 
 
-def _get_image(ctx, path, uuid, master_path=None, image_service=None):
+def _get_master_image_path(master_path, uuid):
+    """Path of the master image of uuid known to the index.
+
+    Master images are named after the checksum of their content, so that
+    images with different uuids but the same bytes share one file. The
+    index maps image ids to those names; images missing from it fall back
+    to a file named after the image id.
+    """
+    image_id = service_utils.parse_image_ref(uuid)[0]
+    index_path = os.path.join(master_path, 'index', image_id)
+    try:
+        name = os.path.basename(os.readlink(index_path))
+    except OSError:
+        name = image_id
+    return os.path.join(master_path, name)
+
+
+def _lookup_master_image_path(ctx, master_path, uuid, image_service=None):
+    """Path of the master image of uuid, adding it to the index if needed.
+
+    Images unknown to the index are looked up in the image service, which
+    gives the checksum of their content.
+    """
+    image_id = service_utils.parse_image_ref(uuid)[0]
+    index_path = os.path.join(master_path, 'index', image_id)
+    if os.path.islink(index_path):
+        return _get_master_image_path(master_path, uuid)
+
+    if not image_service:
+        image_service = service.Service(version=1, context=ctx)
+    checksum = image_service.show(uuid).get('checksum')
+    if not checksum:
+        return os.path.join(master_path, image_id)
+
+    name = 'md5-%s' % checksum
+    fileutils.ensure_tree(os.path.dirname(index_path))
+    try:
+        os.symlink(os.path.join('..', name), index_path)
+    except OSError as e:
+        # Another deploy of the same image indexed it first.
+        if e.errno != errno.EEXIST:
+            raise
+    return os.path.join(master_path, name)
+
+
+def _get_image(ctx, path, uuid, master_path=None, image_service=None,
+               decompress=True):
     #TODO(ghe): Revise this logic and cdocument process Bug #1199665
     # When master_path defined, we save the images in this dir using the iamge
     # uuid as the file name. Deployments that use this images, creates a hard
@@ -283,23 +638,44 @@ def _get_image(ctx, path, uuid, master_path=None, image_service=None):
 
     if master_path is None:
         #NOTE(ghe): We don't share images between instances/hosts
-        images.fetch_to_raw(ctx, uuid, path, image_service)
+        images.fetch_to_raw(ctx, uuid, path, image_service, decompress)
 
     else:
-        master_uuid = os.path.join(master_path,
-                                   service_utils.parse_image_ref(uuid)[0])
+        fileutils.ensure_tree(master_path)
+        master_uuid = _lookup_master_image_path(ctx, master_path, uuid,
+                                                image_service)
         lock_file = os.path.join(master_path, master_uuid + '.lock')
         _link_master_image(master_uuid, path)
         if not os.path.exists(path):
-            fileutils.ensure_tree(master_path)
             if not _download_in_progress(lock_file):
                 with fileutils.remove_path_on_error(lock_file):
                     #TODO(ghe): logging when image cannot be created
                     fd, tmp_path = tempfile.mkstemp(dir=master_path)
                     os.close(fd)
-                    images.fetch_to_raw(ctx, uuid, tmp_path, image_service)
+                    content_checksum = _fetch_master_image_from_peers(
+                                                    master_uuid, tmp_path)
+                    if content_checksum is not None:
+                        # the download matched the image service checksum
+                        _remember_image_checksum(
+                                tmp_path, 'md5',
+                                os.path.basename(master_uuid)[len('md5-'):])
+                        _remember_image_checksum(tmp_path, 'sha1',
+                                                 content_checksum)
+                    else:
+                        unchanged = images.fetch_to_raw(ctx, uuid, tmp_path,
+                                                        image_service,
+                                                        decompress)
+                        name = os.path.basename(master_uuid)
+                        if unchanged and name.startswith('md5-'):
+                            # the image is stored as the image service
+                            # gave it, its checksum is the one of the file
+                            _remember_image_checksum(tmp_path, 'md5',
+                                                     name[len('md5-'):])
                     _create_master_image(tmp_path, master_uuid, path)
                 _remove_download_in_progress_lock(lock_file)
+                # the deploys waiting for the image go on while its sha1
+                # is computed, if the download did not give it
+                _advertise_master_image(master_uuid)
             else:
                 #TODO(ghe): expiration time
                 timer = loopingcall.FixedIntervalLoopingCall(
@@ -307,18 +683,67 @@ def _get_image(ctx, path, uuid, master_path=None, image_service=None):
                 timer.start(interval=1).wait()
                 _link_master_image(master_uuid, path)
 
+        prefetched_path = _get_prefetched_image_path(master_path, uuid)
+        if path != prefetched_path:
+            # the deploy keeps the master image from now on
+            utils.unlink_without_raise(prefetched_path)
+
+
+def _get_prefetched_image_path(master_path, uuid):
+    """Path of the link keeping the prefetched master image of uuid.
+
+    A prefetched master image is linked to by no deploy yet; this link
+    keeps _unlink_master_image() from deleting it until a deploy of the
+    image links to it.
+    """
+    image_id = service_utils.parse_image_ref(uuid)[0]
+    return os.path.join(master_path, 'prefetched', image_id)
+
+
+def _prefetch_image(ctx, uuid, kind):
+    """Fetch an image into a master image directory ahead of deploys.
+
+    :param ctx: context.
+    :param uuid: the image reference.
+    :param kind: 'tftp' for kernels and ramdisks, which are stored in
+                 CONF.pxe.tftp_master_path, or 'instance' for instance
+                 images, stored in CONF.pxe.instance_master_path.
+    :raises: InvalidParameterValue if kind is unknown or the master
+             directory for it is not configured.
+    """
+    master_paths = {'tftp': CONF.pxe.tftp_master_path,
+                    'instance': CONF.pxe.instance_master_path}
+    if kind not in master_paths:
+        raise exception.InvalidParameterValue(_(
+            "Unknown image kind %s, expected 'tftp' or 'instance'.") % kind)
+    master_path = master_paths[kind]
+    if not master_path:
+        raise exception.InvalidParameterValue(_(
+            "Master images are disabled for %s images, there is nothing "
+            "to prefetch.") % kind)
+
+    path = _get_prefetched_image_path(master_path, uuid)
+    if os.path.exists(path):
+        return
+    fileutils.ensure_tree(os.path.dirname(path))
+    # kernels and ramdisks are served as they are stored, a gzip
+    # compressed initramfs stays compressed
+    _get_image(ctx, path, uuid, master_path,
+               decompress=(kind == 'instance'))
+
 
 def _cache_tftp_images(ctx, node, pxe_info):
     """Fetch the necessary kernels and ramdisks for the instance."""
     d_info = _parse_driver_info(node)
-    fileutils.ensure_tree(
-        os.path.join(CONF.pxe.tftp_root, node['instance_uuid']))
+    for (uuid, path) in pxe_info.values():
+        fileutils.ensure_tree(os.path.dirname(path))
     LOG.debug(_("Fetching kernel and ramdisk for instance %s") %
               d_info['instance_name'])
     for label in pxe_info:
         (uuid, path) = pxe_info[label]
         if not os.path.exists(path):
-            _get_image(ctx, path, uuid, CONF.pxe.tftp_master_path, None)
+            _get_image(ctx, path, uuid, CONF.pxe.tftp_master_path, None,
+                       decompress=False)
 
 
 def _cache_instance_image(ctx, node):
@@ -352,9 +777,12 @@ def _cache_instance_image(ctx, node):
     return (uuid, image_path)
 
 
-def _get_tftp_image_info(node):
+def _get_tftp_image_info(node, protocol='tftp'):
     """Generate the paths for tftp files for this instance
 
+    With protocol 'http' the files are placed under CONF.pxe.http_root
+    instead of CONF.pxe.tftp_root.
+
     Raises IronicException if
     - instance does not contain kernel_id or ramdisk_id
     - deploy_kernel_id or deploy_ramdisk_id can not be read from
@@ -370,7 +798,7 @@ def _get_tftp_image_info(node):
 
     for label in image_info:
         image_info[label][0] = str(d_info[label]).split('/')[-1]
-        image_info[label][1] = os.path.join(CONF.pxe.tftp_root,
+        image_info[label][1] = os.path.join(_get_boot_root(protocol),
                                             node['instance_uuid'], label)
 
     ctx = context.get_admin_context()
@@ -379,7 +807,7 @@ def _get_tftp_image_info(node):
     for label in ('kernel', 'ramdisk'):
         image_info[label] = [None, None]
         image_info[label][0] = str(iproperties[label + '_id']).split('/')[-1]
-        image_info[label][1] = os.path.join(CONF.pxe.tftp_root,
+        image_info[label][1] = os.path.join(_get_boot_root(protocol),
                                             node['instance_uuid'], label)
 
     return image_info
@@ -402,29 +830,137 @@ def _cache_images(node, pxe_info):
     # _inject_into_image(d_info, network_info, injected_files, admin_password)
 
 
+def _get_http_image_path(node):
+    """Generate the path an instance image is served at in pull mode."""
+    return os.path.join(CONF.pxe.http_root, node['instance_uuid'], 'disk')
+
+
+# Checksums of the content of image files, by inode; the values map
+# checksum types to checksums.
+_IMAGE_CHECKSUMS = utils.LRUCache(64)
+
+
+def _get_image_checksums(path):
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+    checksums = _IMAGE_CHECKSUMS.get(key)
+    if checksums is None:
+        checksums = {}
+        _IMAGE_CHECKSUMS[key] = checksums
+    return checksums
+
+
+def _remember_image_checksum(path, checksum_type, checksum):
+    """Record a checksum of the image file at path known when fetching it."""
+    _get_image_checksums(path)[checksum_type] = checksum
+
+
+def _hash_image(path):
+    """Return the sha1 checksum of the file at path.
+
+    Other greenthreads run between the chunks read, hashing an image of
+    several GB takes a while.
+    """
+    checksum = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ''):
+            checksum.update(chunk)
+            eventlet.sleep(0)
+    return checksum.hexdigest()
+
+
+def _get_image_checksum(path, checksum_type=None):
+    """Return a checksum of the image file at path.
+
+    Every node deploying the same image links the same master image, so
+    checksums are remembered per inode and each image is read only once.
+    The md5 checksum of the image service is used when the image was
+    stored as it was downloaded; the sha1 is computed otherwise.
+
+    :param checksum_type: 'sha1' to get the sha1 checksum, or None for
+                          any checksum known.
+    :returns: a tuple of the type of the checksum and the checksum.
+    """
+    checksums = _get_image_checksums(path)
+    for known_type in ('md5', 'sha1'):
+        if checksum_type in (None, known_type) and known_type in checksums:
+            return known_type, checksums[known_type]
+    checksum = _hash_image(path)
+    _remember_image_checksum(path, 'sha1', checksum)
+    return 'sha1', checksum
+
+
+def _publish_instance_image(node):
+    """Make the instance image of a node downloadable from http_url.
+
+    The checksum of the image is saved in the node's driver_info, the
+    deploy ramdisk gets it with the image url.
+    """
+    d_info = _parse_driver_info(node)
+    image_path = _get_image_file_path(d_info)
+    http_path = _get_http_image_path(node)
+    fileutils.ensure_tree(os.path.dirname(http_path))
+    utils.unlink_without_raise(http_path)
+    os.link(image_path, http_path)
+
+    driver_info = node['driver_info']
+    (driver_info['pxe_image_checksum_type'],
+     driver_info['pxe_image_checksum']) = _get_image_checksum(http_path)
+    node['driver_info'] = driver_info
+    node.save(context.get_admin_context())
+
+
 def _destroy_images(d_info):
     """Delete instance's image file."""
-    image_uuid = service_utils.parse_image_ref(d_info['image_source'])[0]
     utils.unlink_without_raise(_get_image_file_path(d_info))
     utils.rmtree_without_raise(_get_image_dir_path(d_info))
-    master_image = os.path.join(CONF.pxe.instance_master_path, image_uuid)
+    master_image = _get_master_image_path(CONF.pxe.instance_master_path,
+                                          d_info['image_source'])
     _unlink_master_image(master_image)
 
 
-def _create_pxe_config(task, node, pxe_info):
+def _install_ipxe_boot_script():
+    """Copy the iPXE boot script to http_root if it is not up to date."""
+    dest = os.path.join(CONF.pxe.http_root, 'boot.ipxe')
+    with open(CONF.pxe.ipxe_boot_script) as f:
+        script = f.read()
+    if os.path.exists(dest):
+        with open(dest) as f:
+            if f.read() == script:
+                return
+    utils.write_to_file(dest, script)
+
+
+def _fail_deploy(node_id, error):
+    """Mark a queued deploy which could not start as failed."""
+    msg = _('Deploy error: "%(error)s" for node %(node_id)s') % {
+            'error': error, 'node_id': node_id}
+    LOG.error(msg)
+    try:
+        dbapi.get_instance().update_node(
+                node_id, {'provision_state': states.DEPLOYFAIL,
+                          'last_error': msg},
+                expected={'provision_state': states.DEPLOYING})
+    except (exception.NodeNotFound, exception.NodeUpdateConflict):
+        pass
+
+
+def _create_pxe_config(task, node, pxe_info, protocol='tftp'):
     """Generate pxe configuration file and link mac ports to it for
     tftp booting.
     """
-    fileutils.ensure_tree(os.path.join(CONF.pxe.tftp_root,
-                                       node['instance_uuid']))
-    fileutils.ensure_tree(os.path.join(CONF.pxe.tftp_root,
-                                       'pxelinux.cfg'))
-
-    pxe_config_file_path = _get_pxe_config_file_path(node['instance_uuid'])
-    pxe_config = _build_pxe_config(node, pxe_info)
+    boot_root = _get_boot_root(protocol)
+    fileutils.ensure_tree(os.path.join(boot_root, node['instance_uuid']))
+    fileutils.ensure_tree(os.path.join(boot_root, 'pxelinux.cfg'))
+    if protocol == 'http':
+        _install_ipxe_boot_script()
+
+    pxe_config_file_path = _get_pxe_config_file_path(node['instance_uuid'],
+                                                     protocol)
+    pxe_config = _build_pxe_config(node, pxe_info, protocol)
     utils.write_to_file(pxe_config_file_path, pxe_config)
     for port in _get_node_mac_addresses(task, node):
-        mac_path = _get_pxe_mac_path(port)
+        mac_path = _get_pxe_mac_path(port, protocol)
         utils.unlink_without_raise(mac_path)
         utils.create_link_without_raise(pxe_config_file_path, mac_path)
 
@@ -432,6 +968,21 @@ def _create_pxe_config(task, node, pxe_info):
 class PXEDeploy(base.DeployInterface):
     """PXE Deploy Interface: just a stub until the real driver is ported."""
 
+    def __init__(self, boot_protocol=None, deploy_mode=None):
+        """Constructor.
+
+        :param boot_protocol: 'tftp' or 'http', how the nodes of this
+                              driver fetch their boot files unless their
+                              driver_info says otherwise. Defaults to
+                              CONF.pxe.boot_protocol.
+        :param deploy_mode: 'iscsi' or 'pull', how the instance image is
+                            written to the nodes of this driver unless
+                            their driver_info says otherwise. Defaults to
+                            CONF.pxe.deploy_mode.
+        """
+        self.boot_protocol = boot_protocol
+        self.deploy_mode = deploy_mode
+
     def validate(self, node):
         """Validate the driver-specific Node deployment info.
 
@@ -443,6 +994,21 @@ class PXEDeploy(base.DeployInterface):
         :returns: InvalidParameterValue.
         """
         _parse_driver_info(node)
+        _get_boot_protocol(node, self.boot_protocol)
+        _get_deploy_mode(node, self.deploy_mode)
+
+    def prefetch_image(self, context, image_ref, kind):
+        """Fetch an image into the master image directories.
+
+        :param context: context.
+        :param image_ref: the reference of the image.
+        :param kind: 'tftp' for kernels and ramdisks, or 'instance'.
+        :returns: True.
+        :raises: InvalidParameterValue if kind is unknown or the master
+                 directory for it is not configured.
+        """
+        _prefetch_image(context, image_ref, kind)
+        return True
 
     @task_manager.require_exclusive_lock
     def deploy(self, task, node):
@@ -456,10 +1022,13 @@ class PXEDeploy(base.DeployInterface):
         :returns: deploy state DEPLOYING.
         """
 
-        pxe_info = _get_tftp_image_info(node)
+        protocol = _get_boot_protocol(node, self.boot_protocol)
+        pxe_info = _get_tftp_image_info(node, protocol)
 
-        _create_pxe_config(task, node, pxe_info)
+        _create_pxe_config(task, node, pxe_info, protocol)
         _cache_images(node, pxe_info)
+        if _get_deploy_mode(node, self.deploy_mode) == 'pull':
+            _publish_instance_image(node)
 
         return states.DEPLOYING
 
@@ -477,22 +1046,27 @@ class PXEDeploy(base.DeployInterface):
         #FIXME(ghe): Possible error to get image info if eliminated from glance
         # Retrieve image info and store in db
         # If we keep master images, no need to get the info, we may ignore this
-        pxe_info = _get_tftp_image_info(node)
+        protocol = _get_boot_protocol(node, self.boot_protocol)
+        pxe_info = _get_tftp_image_info(node, protocol)
         d_info = _parse_driver_info(node)
         for label in pxe_info:
             (uuid, path) = pxe_info[label]
-            master_path = os.path.join(CONF.pxe.tftp_master_path, uuid)
+            master_path = _get_master_image_path(CONF.pxe.tftp_master_path,
+                                                 uuid)
             utils.unlink_without_raise(path)
             _unlink_master_image(master_path)
 
         utils.unlink_without_raise(_get_pxe_config_file_path(
-                node['instance_uuid']))
+                node['instance_uuid'], protocol))
         for port in _get_node_mac_addresses(task, node):
-            mac_path = _get_pxe_mac_path(port)
+            mac_path = _get_pxe_mac_path(port, protocol)
             utils.unlink_without_raise(mac_path)
 
         utils.rmtree_without_raise(
-                os.path.join(CONF.pxe.tftp_root, node['instance_uuid']))
+                os.path.join(_get_boot_root(protocol), node['instance_uuid']))
+        if _get_deploy_mode(node, self.deploy_mode) == 'pull':
+            utils.rmtree_without_raise(
+                    os.path.dirname(_get_http_image_path(node)))
 
         _destroy_images(d_info)
 
@@ -514,12 +1088,27 @@ class PXERescue(base.RescueInterface):
 class VendorPassthru(base.VendorInterface):
     """Interface to mix IPMI and PXE vendor-specific interfaces."""
 
-    def _get_deploy_info(self, node, **kwargs):
-        d_info = _parse_driver_info(node)
+    def __init__(self, boot_protocol=None, deploy_mode=None):
+        """Constructor.
 
+        :param boot_protocol: the boot_protocol of the PXEDeploy interface
+                              of the driver.
+        :param deploy_mode: the deploy_mode of the PXEDeploy interface of
+                            the driver.
+        """
+        self.boot_protocol = boot_protocol
+        self.deploy_mode = deploy_mode
+
+    def _check_deploy_key(self, node, **kwargs):
+        d_info = _parse_driver_info(node)
         deploy_key = kwargs.get('key')
         if d_info['deploy_key'] != deploy_key:
             raise exception.InvalidParameterValue(_("Deploy key is not match"))
+        return d_info
+
+    def _get_deploy_info(self, node, **kwargs):
+        d_info = self._check_deploy_key(node, **kwargs)
+        protocol = _get_boot_protocol(node, self.boot_protocol)
 
         params = {'address': kwargs.get('address'),
                   'port': kwargs.get('port', '3260'),
@@ -527,7 +1116,8 @@ class VendorPassthru(base.VendorInterface):
                   'lun': kwargs.get('lun', '1'),
                   'image_path': _get_image_file_path(d_info),
                   'pxe_config_path': _get_pxe_config_file_path(
-                                                    node['instance_uuid']),
+                                                    node['instance_uuid'],
+                                                    protocol),
                   'root_mb': 1024 * int(d_info['root_gb']),
                   'swap_mb': int(d_info['swap_mb'])
 
@@ -541,10 +1131,45 @@ class VendorPassthru(base.VendorInterface):
 
         return params
 
+    def _get_pull_info(self, node, **kwargs):
+        """Tell the deploy ramdisk where to download the image from.
+
+        :returns: a dict with the url and sha1 checksum of the image and
+                  the sizes of the partitions to create, in MiB.
+        """
+        d_info = self._check_deploy_key(node, **kwargs)
+        checksum = node['driver_info'].get('pxe_image_checksum')
+        if checksum is None:
+            raise exception.InvalidParameterValue(_(
+                    "The image of node %s is not published for download.") %
+                    node['uuid'])
+        image_path = _get_http_image_path(node)
+        root_mb = max(1024 * int(d_info['root_gb']),
+                      deploy_utils.get_image_mb(image_path))
+        return {'image_url': _get_http_url(image_path),
+                'image_checksum': checksum,
+                'image_checksum_type': node['driver_info'].get(
+                                        'pxe_image_checksum_type', 'sha1'),
+                'root_mb': root_mb,
+                'swap_mb': int(d_info['swap_mb'])}
+
+    def _get_deploy_result(self, node, **kwargs):
+        self._check_deploy_key(node, **kwargs)
+        if kwargs.get('error') is None and kwargs.get('root_uuid') is None:
+            raise exception.InvalidParameterValue(_(
+                    "Parameter root_uuid was not passed to ironic for "
+                    "deploy."))
+        return {'root_uuid': kwargs.get('root_uuid'),
+                'error': kwargs.get('error')}
+
     def validate(self, node, **kwargs):
         method = kwargs['method']
         if method == 'pass_deploy_info':
+            if _get_deploy_mode(node, self.deploy_mode) == 'pull':
+                return self._get_pull_info(node, **kwargs)
             self._get_deploy_info(node, **kwargs)
+        elif method == 'pass_deploy_result':
+            self._get_deploy_result(node, **kwargs)
         elif method == 'set_boot_device':
             # todo
             pass
@@ -556,6 +1181,13 @@ class VendorPassthru(base.VendorInterface):
         return True
 
     def _continue_deploy(self, task, node, **kwargs):
+        """Queue the deployment of a node which passed its deploy info.
+
+        The image is written by the deploy executor, which bounds the
+        number of deploys running at the same time on this conductor.
+
+        :returns: the queued job, an eventlet Event.
+        """
         params = self._get_deploy_info(node, **kwargs)
         ctx = task.context
         node_id = node['uuid']
@@ -565,26 +1197,73 @@ class VendorPassthru(base.VendorInterface):
             LOG.error(_('Node %(node_id)s deploy error message: %(error)s') %
                         {'node_id': node_id, 'error': err_msg})
 
+        node['provision_state'] = states.DEPLOYING
+        node.save(ctx)
+
+        executor = deploy_executor.get_executor()
+        LOG.info(_('queueing deployment for node %(node_id)s, '
+                   '%(depth)d deployments already waiting') %
+                   {'node_id': node_id, 'depth': executor.queue_depth})
+        job = executor.submit(self._do_deploy, ctx, node_id, params)
+        # the node stays reserved by this conductor while the job waits,
+        # so that a restart finds the deploys it interrupted
+        task.hand_over()
+        return job
+
+    def _do_deploy(self, ctx, node_id, params):
+        started = False
+        try:
+            with task_manager.acquire(ctx, node_id, shared=False,
+                                      reserved=True) as task:
+                started = True
+                self._write_image(ctx, task.node, params)
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                if not started:
+                    _fail_deploy(node_id, e)
+
+    def _write_image(self, ctx, node, params):
+        node_id = node['uuid']
         LOG.info(_('start deployment for node %(node_id)s, '
                    'params %(params)s') %
                    {'node_id': node_id, 'params': params})
 
         try:
-            node['provision_state'] = states.DEPLOYING
-            node.save(ctx)
             deploy_utils.deploy(**params)
         except Exception as e:
-            LOG.error(_('deployment to node %s failed') % node_id)
+            msg = _('Deploy error: "%(error)s" for node %(node_id)s') % {
+                    'error': e.message, 'node_id': node_id}
+            LOG.error(msg)
             node['provision_state'] = states.DEPLOYFAIL
+            node['last_error'] = msg
             node.save(ctx)
-            raise exception.InstanceDeployFailure(_(
-                    'Deploy error: "%(error)s" for node %(node_id)s') %
-                     {'error': e.message, 'node_id': node_id})
+            raise exception.InstanceDeployFailure(msg)
         else:
             LOG.info(_('deployment to node %s done') % node_id)
             node['provision_state'] = states.DEPLOYDONE
             node.save(ctx)
 
+    def _finish_pull_deploy(self, task, node, **kwargs):
+        """Record the result the deploy ramdisk reported in pull mode."""
+        result = self._get_deploy_result(node, **kwargs)
+        ctx = task.context
+        node_id = node['uuid']
+
+        if result['error']:
+            LOG.error(_('deployment to node %(node_id)s failed: %(error)s') %
+                      {'node_id': node_id, 'error': result['error']})
+            node['provision_state'] = states.DEPLOYFAIL
+            node['last_error'] = result['error']
+        else:
+            protocol = _get_boot_protocol(node, self.boot_protocol)
+            deploy_utils.switch_pxe_config(
+                    _get_pxe_config_file_path(node['instance_uuid'],
+                                              protocol),
+                    result['root_uuid'])
+            LOG.info(_('deployment to node %s done') % node_id)
+            node['provision_state'] = states.DEPLOYDONE
+        node.save(ctx)
+
     def vendor_passthru(self, task, node, **kwargs):
         method = kwargs['method']
         if method == 'set_boot_device':
@@ -594,6 +1273,17 @@ class VendorPassthru(base.VendorInterface):
                         kwargs.get('persistent'))
 
         elif method == 'pass_deploy_info':
+            if _get_deploy_mode(node, self.deploy_mode) == 'pull':
+                # the ramdisk got the image url from validate() and
+                # writes the disk itself
+                LOG.info(_('node %s is downloading its image') %
+                         node['uuid'])
+                return
+            ctx = context.get_admin_context()
+            with task_manager.acquire(ctx, node['uuid'], shared=False) as cdt:
+                return self._continue_deploy(cdt, node, **kwargs)
+
+        elif method == 'pass_deploy_result':
             ctx = context.get_admin_context()
             with task_manager.acquire(ctx, node['uuid'], shared=False) as cdt:
-                self._continue_deploy(cdt, node, **kwargs)
+                return self._finish_pull_deploy(cdt, node, **kwargs)
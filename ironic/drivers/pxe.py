@@ -76,3 +76,17 @@ class PXEAndIPMINativeDriver(base.BaseDriver):
         self.deploy = pxe.PXEDeploy()
         self.rescue = self.deploy
         self.vendor = pxe.VendorPassthru()
+
+
+class IPXEAndIPMIToolDriver(base.BaseDriver):
+    """iPXE + IPMITool driver.
+
+    Same as :class:PXEAndIPMIToolDriver, except that nodes boot with iPXE
+    and fetch their kernels and ramdisks over HTTP rather than TFTP.
+    """
+
+    def __init__(self):
+        self.power = ipmitool.IPMIPower()
+        self.deploy = pxe.PXEDeploy(boot_protocol='http')
+        self.rescue = self.deploy
+        self.vendor = pxe.VendorPassthru(boot_protocol='http')
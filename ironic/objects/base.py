@@ -19,6 +19,7 @@ import collections
 import six
 
 from ironic.common import exception
+from ironic.common import lazy_json
 from ironic.objects import utils as obj_utils
 from ironic.openstack.common import context
 from ironic.openstack.common import log as logging
@@ -43,7 +44,12 @@ def make_class_properties(cls):
             attrname = get_attrname(name)
             if not hasattr(self, attrname):
                 self.obj_load_attr(name)
-            return getattr(self, attrname)
+            value = getattr(self, attrname)
+            if isinstance(value, lazy_json.LazyJSONDict):
+                # decode a JSON field the first time it is read
+                value = value.load()
+                setattr(self, attrname, value)
+            return value
 
         def setter(self, value, name=name, typefn=typefn):
             self._changed_fields.add(name)
@@ -25,7 +25,7 @@ class Chassis(base.IronicObject):
     fields = {
         'id': int,
         'uuid': utils.str_or_none,
-        'extra': utils.dict_or_none,
+        'extra': utils.lazy_dict_or_none,
         'description': utils.str_or_none,
     }
 
@@ -55,19 +55,23 @@ class Chassis(base.IronicObject):
         return Chassis._from_db_object(cls(), db_chassis)
 
     @base.remotable
-    def save(self, context):
+    def save(self, context, expected=None):
         """Save updates to this Chassis.
 
         Updates will be made column by column based on the result
         of self.what_changed().
 
         :param context: Security context
+        :param expected: Optional dict of the values some fields must
+                         still have in the database for the updates to
+                         be made.
+        :raises: ChassisUpdateConflict if they no longer have them.
         """
         updates = {}
         changes = self.obj_what_changed()
         for field in changes:
             updates[field] = self[field]
-        self.dbapi.update_chassis(self.uuid, updates)
+        self.dbapi.update_chassis(self.uuid, updates, expected=expected)
 
         self.obj_reset_changes()
 
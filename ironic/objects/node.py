@@ -31,9 +31,9 @@ class Node(base.IronicObject):
             'instance_uuid': utils.str_or_none,
 
             'driver': utils.str_or_none,
-            'driver_info': utils.dict_or_none,
+            'driver_info': utils.lazy_dict_or_none,
 
-            'properties': utils.dict_or_none,
+            'properties': utils.lazy_dict_or_none,
             'reservation': utils.str_or_none,
 
             # One of states.POWER_ON|POWER_OFF|NOSTATE|ERROR
@@ -51,7 +51,7 @@ class Node(base.IronicObject):
             # that started but failed to finish.
             'last_error': utils.str_or_none,
 
-            'extra': utils.dict_or_none,
+            'extra': utils.lazy_dict_or_none,
             }
 
     @staticmethod
@@ -74,7 +74,7 @@ class Node(base.IronicObject):
         return Node._from_db_object(cls(), db_node)
 
     @base.remotable
-    def save(self, context):
+    def save(self, context, expected=None):
         """Save updates to this Node.
 
         Column-wise updates will be made based on the result of
@@ -83,12 +83,16 @@ class Node(base.IronicObject):
         node before updates are made.
 
         :param context: Security context
+        :param expected: Optional dict of the values some fields must
+                         still have in the database for the updates to
+                         be made.
+        :raises: NodeUpdateConflict if they no longer have them.
         """
         updates = {}
         changes = self.obj_what_changed()
         for field in changes:
             updates[field] = self[field]
-        self.dbapi.update_node(self.uuid, updates)
+        self.dbapi.update_node(self.uuid, updates, expected=expected)
 
         self.obj_reset_changes()
 
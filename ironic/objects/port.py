@@ -27,7 +27,7 @@ class Port(base.IronicObject):
         'uuid': utils.str_or_none,
         'node_id': utils.int_or_none,
         'address': utils.str_or_none,
-        'extra': utils.dict_or_none,
+        'extra': utils.lazy_dict_or_none,
     }
 
     @staticmethod
@@ -50,19 +50,23 @@ class Port(base.IronicObject):
         return Port._from_db_object(cls(), db_port)
 
     @base.remotable
-    def save(self, context):
+    def save(self, context, expected=None):
         """Save updates to this Port.
 
         Updates will be made column by column based on the result
         of self.what_changed().
 
         :param context: Security context
+        :param expected: Optional dict of the values some fields must
+                         still have in the database for the updates to
+                         be made.
+        :raises: PortUpdateConflict if they no longer have them.
         """
         updates = {}
         changes = self.obj_what_changed()
         for field in changes:
             updates[field] = self[field]
-        self.dbapi.update_port(self.uuid, updates)
+        self.dbapi.update_port(self.uuid, updates, expected=expected)
 
         self.obj_reset_changes()
 
@@ -21,6 +21,7 @@ import iso8601
 import netaddr
 import six
 
+from ironic.common import lazy_json
 from ironic.openstack.common import timeutils
 
 
@@ -74,6 +75,16 @@ def dict_or_none(val):
             return {}
 
 
+def lazy_dict_or_none(val):
+    """Keep a dict which is not decoded yet as it is, or dictify a value.
+
+    The object decodes the dict when the field is first read.
+    """
+    if isinstance(val, lazy_json.LazyJSONDict):
+        return val
+    return dict_or_none(val)
+
+
 def list_or_none(val):
     """Attempt to listify a value, or None."""
     if val is None:
@@ -24,9 +24,11 @@
 from oslo.config import cfg
 import pecan
 import pecan.testing
+import sqlalchemy
 
 from ironic.api import acl
 from ironic.db import api as dbapi
+from ironic.openstack.common.db.sqlalchemy import session as db_session
 from ironic.tests.db import base
 
 PATH_PREFIX = '/v1'
@@ -175,6 +177,25 @@ class FunctionalTest(base.DbTestCase):
         print('GOT:%s' % response)
         return response
 
+    def _count_queries(self, url):
+        """Return the number of SQL statements run by a GET of url."""
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if recording:
+                statements.append(statement)
+
+        # NOTE: listeners can not be removed from an engine with this
+        #       version of SQLAlchemy, so this one is only switched off
+        recording = [True]
+        sqlalchemy.event.listen(db_session.get_engine(),
+                                'before_cursor_execute', record)
+        try:
+            self.get_json(url)
+        finally:
+            recording.pop()
+        return len(statements)
+
     def get_json(self, path, expect_errors=False, headers=None,
                  extra_environ=None, q=[], path_prefix=PATH_PREFIX, **params):
         """Sends simulated HTTP GET request to Pecan test app.
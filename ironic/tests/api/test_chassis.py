@@ -16,8 +16,10 @@
 Tests for the API /chassis/ methods.
 """
 
+import mock
 import webtest.app
 
+from ironic.api.controllers.v1 import etag as api_etag
 from ironic.common import utils
 from ironic.tests.api import base
 from ironic.tests.db import utils as dbutils
@@ -37,6 +39,35 @@ class TestListChassis(base.FunctionalTest):
         self.assertNotIn('extra', data['chassis'][0])
         self.assertNotIn('nodes', data['chassis'][0])
 
+    def test_fields(self):
+        ndict = dbutils.get_test_chassis()
+        chassis = self.dbapi.create_chassis(ndict)
+        for url in ('/chassis', '/chassis/detail',
+                    '/chassis/%s' % chassis['uuid']):
+            data = self.get_json(url + '?fields=uuid,nodes')
+            if 'chassis' in data:
+                self.assertEqual(1, len(data['chassis']))
+                data = data['chassis'][0]
+            self.assertEqual(['nodes', 'uuid'], sorted(data))
+            self.assertIn(chassis['uuid'] + '/nodes',
+                          data['nodes'][0]['href'])
+
+    def test_fields_invalid(self):
+        response = self.get_json('/chassis?fields=uuid,nonexistent',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertTrue(response.json['error_message'])
+
+    def test_not_modified(self):
+        cdict = dbutils.get_test_chassis()
+        chassis = self.dbapi.create_chassis(cdict)
+        for url in ('/v1/chassis', '/v1/chassis/detail',
+                    '/v1/chassis/%s' % chassis['uuid']):
+            etag = self.app.get(url).etag
+            response = self.app.get(url,
+                                    headers={'If-None-Match': '"%s"' % etag})
+            self.assertEqual(304, response.status_int)
+
     def test_detail(self):
         cdict = dbutils.get_test_chassis()
         chassis = self.dbapi.create_chassis(cdict)
@@ -85,9 +116,11 @@ class TestListChassis(base.FunctionalTest):
             chassis.append(ch['uuid'])
         data = self.get_json('/chassis/?limit=3')
         self.assertEqual(len(data['chassis']), 3)
+        self.assertIn('cursor=', data['next'])
 
-        next_marker = data['chassis'][-1]['uuid']
-        self.assertIn(next_marker, data['next'])
+        next_page = data['next'].split('/v1', 1)[1]
+        data = self.get_json(next_page)
+        self.assertEqual(chassis[3:], [ch['uuid'] for ch in data['chassis']])
 
     def test_nodes_subresource_link(self):
         ndict = dbutils.get_test_chassis()
@@ -158,6 +191,39 @@ class TestPatch(base.FunctionalTest):
         result = self.get_json('/chassis/%s' % cdict['uuid'])
         self.assertEqual(result['description'], description)
 
+    def test_replace_if_match(self):
+        cdict = dbutils.get_test_chassis()
+        etag = self.app.get('/v1/chassis/%s' % cdict['uuid']).etag
+        patch = [{'path': '/description', 'value': 'new', 'op': 'replace'}]
+        response = self.patch_json('/chassis/%s' % cdict['uuid'], patch,
+                                   headers={'If-Match': '"%s"' % etag})
+        self.assertEqual(200, response.status_code)
+        # the tag read before the first change no longer matches
+        response = self.patch_json('/chassis/%s' % cdict['uuid'], patch,
+                                   headers={'If-Match': '"%s"' % etag},
+                                   expect_errors=True)
+        self.assertEqual(412, response.status_int)
+
+    def test_replace_if_match_modified_after_check(self):
+        cdict = dbutils.get_test_chassis()
+        etag = self.app.get('/v1/chassis/%s' % cdict['uuid']).etag
+        object_etag = api_etag.object_etag
+
+        def check_then_modify(obj):
+            # another request updates the chassis right after the check
+            tag = object_etag(obj)
+            self.dbapi.update_chassis(cdict['uuid'], {'description': 'other'})
+            return tag
+
+        patch = [{'path': '/description', 'value': 'new', 'op': 'replace'}]
+        with mock.patch.object(api_etag, 'object_etag', check_then_modify):
+            response = self.patch_json('/chassis/%s' % cdict['uuid'], patch,
+                                       headers={'If-Match': '"%s"' % etag},
+                                       expect_errors=True)
+        self.assertEqual(412, response.status_int)
+        result = self.get_json('/chassis/%s' % cdict['uuid'])
+        self.assertEqual('other', result['description'])
+
     def test_replace_multi(self):
         extra = {"foo1": "bar1", "foo2": "bar2", "foo3": "bar3"}
         cdict = dbutils.get_test_chassis(extra=extra,
@@ -16,17 +16,28 @@
 Tests for the API /nodes/ methods.
 """
 
+import base64
+import datetime
+import json
+
 import mock
+from oslo.config import cfg
 from testtools.matchers import HasLength
+import webob
 import webtest.app
 
+from ironic.api.controllers.v1 import node as api_node
+from ironic.api.controllers.v1 import streaming
 from ironic.common import exception
 from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import rpcapi
+from ironic.db.sqlalchemy import api as sqlalchemy_api
 from ironic import objects
+from ironic.openstack.common import timeutils
 
 from ironic.tests.api import base
+from ironic.tests import base as tests_base
 from ironic.tests.db import utils as dbutils
 
 
@@ -73,6 +84,19 @@ class TestListNodes(base.FunctionalTest):
         self.assertNotIn('properties', data['nodes'][0])
         self.assertNotIn('chassis_id', data['nodes'][0])
 
+    def test_one_loads_listed_columns(self):
+        ndict = dbutils.get_test_node()
+        self.dbapi.create_node(ndict)
+        with mock.patch.object(self.dbapi, 'get_nodes',
+                               wraps=self.dbapi.get_nodes) as get_nodes:
+            self.get_json('/nodes?sort_key=created_at')
+            columns = get_nodes.call_args[0][0]
+        self.assertIn('uuid', columns)
+        self.assertIn('created_at', columns)
+        self.assertNotIn('driver_info', columns)
+        self.assertNotIn('properties', columns)
+        self.assertNotIn('extra', columns)
+
     def test_detail(self):
         ndict = dbutils.get_test_node()
         node = self.dbapi.create_node(ndict)
@@ -84,6 +108,166 @@ class TestListNodes(base.FunctionalTest):
         self.assertIn('properties', data['nodes'][0])
         self.assertIn('chassis_id', data['nodes'][0])
 
+    def test_detail_query_count(self):
+        # the chassis of a page are looked up at once, not for each node
+        counts = []
+        for id in xrange(20):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid(),
+                                          chassis_id=self.chassis['id'])
+            self.dbapi.create_node(ndict)
+            if id in (1, 19):
+                counts.append(self._count_queries('/nodes/detail'))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_fields(self):
+        ndict = dbutils.get_test_node()
+        node = self.dbapi.create_node(ndict)
+        for url in ('/nodes', '/nodes/detail'):
+            data = self.get_json(url + '?fields=uuid,driver')
+            self.assertEqual([{'uuid': node['uuid'], 'driver': 'fake'}],
+                             data['nodes'])
+
+    def test_fields_loads_listed_columns(self):
+        ndict = dbutils.get_test_node()
+        self.dbapi.create_node(ndict)
+        with mock.patch.object(self.dbapi, 'get_nodes',
+                               wraps=self.dbapi.get_nodes) as get_nodes:
+            self.get_json('/nodes/detail?fields=driver,links')
+            columns = get_nodes.call_args[0][0]
+        self.assertIn('driver', columns)
+        self.assertNotIn('driver_info', columns)
+        self.assertNotIn('links', columns)
+
+    def test_fields_get_one(self):
+        ndict = dbutils.get_test_node()
+        node = self.dbapi.create_node(ndict)
+        data = self.get_json('/nodes/%s?fields=chassis_id,links'
+                             % node['uuid'])
+        self.assertEqual(['chassis_id', 'links'], sorted(data))
+        self.assertEqual(self.chassis['uuid'], data['chassis_id'])
+        self.assertIn(node['uuid'], data['links'][0]['href'])
+
+    def test_fields_etag(self):
+        ndict = dbutils.get_test_node()
+        node = self.dbapi.create_node(ndict)
+        url = '/v1/nodes/%s' % node['uuid']
+        self.assertEqual(self.app.get(url).etag,
+                         self.app.get(url + '?fields=uuid').etag)
+
+    def test_etag_same_second(self):
+        ndict = dbutils.get_test_node()
+        node = self.dbapi.create_node(ndict)
+        url = '/v1/nodes/%s' % node['uuid']
+        timeutils.set_time_override(datetime.datetime(2000, 1, 1, 0, 0))
+        self.addCleanup(timeutils.clear_time_override)
+        self.dbapi.update_node(node['id'], {'extra': {'foo': 'bar'}})
+        etag = self.app.get(url).etag
+        self.dbapi.update_node(node['id'], {'extra': {'foo': 'baz'}})
+        self.assertNotEqual(etag, self.app.get(url).etag)
+
+    def test_fields_next_link(self):
+        for id in xrange(3):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid())
+            self.dbapi.create_node(ndict)
+        data = self.get_json('/nodes/detail?fields=uuid,power_state&limit=2')
+        self.assertEqual(['power_state', 'uuid'], sorted(data['nodes'][0]))
+        self.assertIn('fields=uuid%2Cpower_state', data['next'])
+
+    def test_fields_invalid(self):
+        for fields in ('uuid,nonexistent', ','):
+            response = self.get_json('/nodes?fields=%s' % fields,
+                                     expect_errors=True)
+            self.assertEqual(400, response.status_int)
+            self.assertTrue(response.json['error_message'])
+
+    def test_stream(self):
+        for id in xrange(3):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid())
+            self.dbapi.create_node(ndict)
+        urls = ['/nodes?limit=2&sort_key=uuid', '/nodes/detail',
+                '/nodes/detail?limit=2&fields=uuid,chassis_id,links']
+        expected = [self.get_json(url) for url in urls]
+
+        cfg.CONF.set_override('stream_min_limit', 2, group='api')
+        with mock.patch.object(self.dbapi, 'get_nodes',
+                               wraps=self.dbapi.get_nodes) as get_nodes:
+            for url, data in zip(urls, expected):
+                self.assertEqual(data, self.get_json(url))
+                self.assertTrue(get_nodes.call_args[1]['stream'])
+
+    @mock.patch.object(sqlalchemy_api, '_STREAM_BATCH_SIZE', 2)
+    @mock.patch.object(streaming, '_BATCH_SIZE', 2)
+    def test_stream_client_gone(self):
+        for id in xrange(5):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid())
+            self.dbapi.create_node(ndict)
+        cfg.CONF.set_override('stream_min_limit', 2, group='api')
+        connections = self.useFixture(tests_base.CheckedOutConnections())
+
+        with mock.patch.object(sqlalchemy_api, '_paginate_query',
+                               wraps=sqlalchemy_api._paginate_query) as query:
+            request = webob.Request.blank('/v1/nodes?limit=5')
+            status, headers, body = request.call_application(self.app.app)
+            self.assertEqual('200 OK', status)
+            chunks = iter(body)
+            self.assertEqual('{"nodes": [', next(chunks))
+            next(chunks)
+            self.assertEqual(0, connections.count)
+            # the server closes the body when the client goes away
+            body.close()
+            self.assertRaises(StopIteration, next, chunks)
+
+        # the page and the two items read
+        self.assertEqual(2, query.call_count)
+        self.assertEqual(0, connections.count)
+
+    def test_stream_no_etag(self):
+        self.dbapi.create_node(dbutils.get_test_node())
+        cfg.CONF.set_override('stream_min_limit', 2, group='api')
+        self.assertIsNone(self.app.get('/v1/nodes').etag)
+        self.assertIsNotNone(self.app.get('/v1/nodes?limit=1').etag)
+
+    def test_get_one_not_modified(self):
+        ndict = dbutils.get_test_node()
+        node = self.dbapi.create_node(ndict)
+        response = self.app.get('/v1/nodes/%s' % node['uuid'])
+        self.assertTrue(response.etag)
+
+        with mock.patch.object(api_node.Node,
+                               'convert_with_links') as convert:
+            response = self.app.get('/v1/nodes/%s' % node['uuid'],
+                                    headers={'If-None-Match':
+                                             '"%s"' % response.etag})
+            self.assertEqual(304, response.status_int)
+            self.assertEqual('', response.body)
+            self.assertFalse(convert.called)
+
+        self.dbapi.update_node(node['id'], {'extra': {'foo': 'bar'}})
+        response = self.app.get('/v1/nodes/%s' % node['uuid'],
+                                headers={'If-None-Match':
+                                         '"%s"' % response.etag})
+        self.assertEqual(200, response.status_int)
+
+    def test_collection_not_modified(self):
+        for id in xrange(3):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid())
+            self.dbapi.create_node(ndict)
+        for url in ('/v1/nodes', '/v1/nodes/detail'):
+            etag = self.app.get(url).etag
+            response = self.app.get(url,
+                                    headers={'If-None-Match': '"%s"' % etag})
+            self.assertEqual(304, response.status_int)
+            # another page of the collection has another tag
+            self.assertNotEqual(etag, self.app.get(url + '?limit=2').etag)
+
+        etag = self.app.get('/v1/nodes').etag
+        self.dbapi.update_node(1, {'instance_uuid': utils.generate_uuid()})
+        self.assertNotEqual(etag, self.app.get('/v1/nodes').etag)
+        self.dbapi.destroy_node(2)
+        response = self.app.get('/v1/nodes',
+                                headers={'If-None-Match': '"%s"' % etag})
+        self.assertEqual(200, response.status_int)
+
     def test_detail_against_single(self):
         ndict = dbutils.get_test_node()
         node = self.dbapi.create_node(ndict)
@@ -124,9 +308,81 @@ class TestListNodes(base.FunctionalTest):
             nodes.append(node['uuid'])
         data = self.get_json('/nodes/?limit=3')
         self.assertEqual(len(data['nodes']), 3)
+        self.assertIn('cursor=', data['next'])
 
-        next_marker = data['nodes'][-1]['uuid']
-        self.assertIn(next_marker, data['next'])
+        next_page = data['next'].split('/v1', 1)[1]
+        data = self.get_json(next_page)
+        self.assertEqual(nodes[3:], [n['uuid'] for n in data['nodes']])
+
+    def test_collection_cursor_sorted(self):
+        nodes = []
+        for id in xrange(7):
+            ndict = dbutils.get_test_node(id=id,
+                                          uuid=utils.generate_uuid())
+            nodes.append(self.dbapi.create_node(ndict)['uuid'])
+
+        uuids = []
+        url = '/nodes/?limit=2&sort_key=uuid&sort_dir=desc'
+        with mock.patch.object(objects.Node, 'get_by_uuid') as get_mock:
+            while url:
+                data = self.get_json(url)
+                uuids.extend(n['uuid'] for n in data['nodes'])
+                url = data.get('next', '').split('/v1', 1)[-1]
+            # the cursor replaces the lookup of the marker node
+            self.assertFalse(get_mock.called)
+        self.assertEqual(sorted(nodes, reverse=True), uuids)
+
+    def test_collection_invalid_cursor(self):
+        response = self.get_json('/nodes/?cursor=foo', expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+    def test_collection_invalid_cursor_types(self):
+        for fields in (['id', 'value', 'not-an-id'], ['id', {}, 1],
+                       ['id', None, True], [1, None, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(fields))
+            response = self.get_json('/nodes/?cursor=%s' % cursor,
+                                     expect_errors=True)
+            self.assertEqual(400, response.status_int)
+
+    def test_collection_cursor_null_sort_key(self):
+        for id in xrange(4):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid(),
+                                          instance_uuid=None if id % 2 else
+                                          utils.generate_uuid())
+            self.dbapi.create_node(ndict)
+        for sort_dir in ('asc', 'desc'):
+            ids = []
+            url = '/nodes/?limit=1&sort_key=instance_uuid&sort_dir=%s' % (
+                                                                    sort_dir)
+            while url:
+                data = self.get_json(url)
+                ids.extend(n['uuid'] for n in data['nodes'])
+                url = data.get('next', '').split('/v1', 1)[-1]
+            self.assertEqual(4, len(set(ids)))
+
+    def test_collection_sort_by_capacity_column(self):
+        for id in xrange(3):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid(),
+                                          properties={'cpus': 4 - id})
+            self.dbapi.create_node(ndict)
+        # a second page would need the cpus of the last node in its cursor
+        for url in ('/nodes/?limit=2&sort_key=cpus',
+                    '/nodes/detail?limit=2&sort_key=cpus',
+                    '/nodes/?sort_key=not_a_column'):
+            response = self.get_json(url, expect_errors=True)
+            self.assertEqual(400, response.status_int)
+            self.assertTrue(response.json['error_message'])
+
+    def test_collection_cursor_other_sort_key(self):
+        for id in xrange(3):
+            ndict = dbutils.get_test_node(id=id,
+                                          uuid=utils.generate_uuid())
+            self.dbapi.create_node(ndict)
+        data = self.get_json('/nodes/?limit=2')
+        cursor = data['next'].split('cursor=')[1]
+        response = self.get_json('/nodes/?sort_key=uuid&cursor=%s' % cursor,
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
 
     def test_ports_subresource_link(self):
         ndict = dbutils.get_test_node()
@@ -274,6 +530,72 @@ class TestListNodes(base.FunctionalTest):
         self.assertThat(data['nodes'], HasLength(3))
         self.assertIn('associated=true', data['next'])
 
+    def test_state_filters(self):
+        uuids = []
+        for id in xrange(4):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid(),
+                                          power_state=states.POWER_ON,
+                                          provision_state=states.DEPLOYFAIL,
+                                          last_error='boom')
+            uuids.append(self.dbapi.create_node(ndict)['uuid'])
+        ndict = dbutils.get_test_node(id=4, uuid=utils.generate_uuid(),
+                                      driver='pxe_ipmitool')
+        other = self.dbapi.create_node(ndict)['uuid']
+        self.dbapi.reserve_nodes('conductor-1', [other])
+
+        data = self.get_json('/nodes/detail?driver=pxe_ipmitool')
+        self.assertEqual([other], [n['uuid'] for n in data['nodes']])
+        data = self.get_json('/nodes?reservation=conductor-1')
+        self.assertEqual([other], [n['uuid'] for n in data['nodes']])
+        data = self.get_json('/nodes?has_last_error=false')
+        self.assertEqual([other], [n['uuid'] for n in data['nodes']])
+
+        data = self.get_json('/nodes?provision_state=deploy%20failed'
+                             '&power_state=power%20on&has_last_error=true'
+                             '&sort_dir=desc&limit=3')
+        self.assertEqual(uuids[:0:-1], [n['uuid'] for n in data['nodes']])
+        next_page = data['next'].split('/v1', 1)[1]
+        self.assertIn('power_state=power%20on', next_page)
+        data = self.get_json(next_page)
+        self.assertEqual(uuids[:1], [n['uuid'] for n in data['nodes']])
+
+    def test_has_last_error_invalid(self):
+        self.assertRaises(webtest.app.AppError, self.get_json,
+                          '/nodes?has_last_error=blah')
+
+    def _create_capacity_test_nodes(self):
+        uuids = []
+        for id, memory_mb in enumerate([4096, 65536, 131072]):
+            ndict = dbutils.get_test_node(id=id, uuid=utils.generate_uuid(),
+                                          properties={'cpus': 8,
+                                                      'memory_mb': memory_mb,
+                                                      'cpu_arch': 'x86_64'})
+            uuids.append(self.dbapi.create_node(ndict)['uuid'])
+        ndict = dbutils.get_test_node(id=3, uuid=utils.generate_uuid(),
+                                      instance_uuid=utils.generate_uuid(),
+                                      properties={'memory_mb': 131072})
+        self.dbapi.create_node(ndict)
+        return uuids
+
+    def test_capacity_filters(self):
+        uuids = self._create_capacity_test_nodes()
+        data = self.get_json('/nodes?associated=false&min_memory_mb=65536')
+        self.assertEqual(uuids[1:], [n['uuid'] for n in data['nodes']])
+        data = self.get_json('/nodes/detail?min_memory_mb=8192'
+                             '&max_memory_mb=65536&cpu_arch=x86_64')
+        self.assertEqual(uuids[1:2], [n['uuid'] for n in data['nodes']])
+        data = self.get_json('/nodes?min_cpus=16')
+        self.assertEqual([], data['nodes'])
+
+    def test_next_link_with_capacity_filters(self):
+        uuids = self._create_capacity_test_nodes()
+        data = self.get_json('/nodes?associated=false&min_memory_mb=4096'
+                             '&limit=2')
+        self.assertIn('min_memory_mb=4096', data['next'])
+        next_page = data['next'].split('/v1', 1)[1]
+        data = self.get_json(next_page)
+        self.assertEqual(uuids[2:], [n['uuid'] for n in data['nodes']])
+
     def test_detail_with_association_filter(self):
         associated_nodes = self._create_association_test_nodes().\
                 get('associated')
@@ -330,7 +652,54 @@ class TestPatch(base.FunctionalTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertEqual(response.status_code, 200)
 
-        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY)
+        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY,
+                                                      expected=None)
+
+    def test_update_if_match(self):
+        self.mock_update_node.return_value = self.node
+        etag = self.app.get('/v1/nodes/%s' % self.node['uuid']).etag
+        response = self.patch_json('/nodes/%s' % self.node['uuid'],
+                                   [{'path': '/extra/foo', 'value': 'bar',
+                                     'op': 'add'}],
+                                   headers={'If-Match': '"%s"' % etag})
+        self.assertEqual(200, response.status_code)
+
+    def test_update_if_match_conditional(self):
+        self.mock_update_node.side_effect = exception.NodeUpdateConflict(
+                node=self.node['uuid'], fields='extra')
+        etag = self.app.get('/v1/nodes/%s' % self.node['uuid']).etag
+        response = self.patch_json('/nodes/%s' % self.node['uuid'],
+                                   [{'path': '/extra/foo', 'value': 'bar',
+                                     'op': 'add'}],
+                                   headers={'If-Match': '"%s"' % etag},
+                                   expect_errors=True)
+        # the node was modified between the check and the update
+        self.assertEqual(412, response.status_code)
+        expected = self.mock_update_node.call_args[1]['expected']
+        self.assertEqual(self.node['extra'], expected['extra'])
+        self.assertNotIn('reservation', expected)
+
+    def test_update_if_match_fields(self):
+        self.mock_update_node.return_value = self.node
+        etag = self.app.get('/v1/nodes/%s?fields=uuid'
+                            % self.node['uuid']).etag
+        response = self.patch_json('/nodes/%s' % self.node['uuid'],
+                                   [{'path': '/extra/foo', 'value': 'bar',
+                                     'op': 'add'}],
+                                   headers={'If-Match': '"%s"' % etag})
+        self.assertEqual(200, response.status_code)
+
+    def test_update_if_match_modified(self):
+        etag = self.app.get('/v1/nodes/%s' % self.node['uuid']).etag
+        self.dbapi.update_node(self.node['id'], {'extra': {'foo': 'baz'}})
+        response = self.patch_json('/nodes/%s' % self.node['uuid'],
+                                   [{'path': '/extra/foo', 'value': 'bar',
+                                     'op': 'add'}],
+                                   headers={'If-Match': '"%s"' % etag},
+                                   expect_errors=True)
+        self.assertEqual(412, response.status_code)
+        self.assertTrue(response.json['error_message'])
+        self.assertFalse(self.mock_update_node.called)
 
     def test_update_state(self):
         self.assertRaises(webtest.app.AppError, self.patch_json,
@@ -353,7 +722,8 @@ class TestPatch(base.FunctionalTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertEqual(response.status_code, 400)
 
-        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY)
+        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY,
+                                                      expected=None)
 
     def test_update_fails_bad_state(self):
         fake_err = 'Fake Power State'
@@ -368,7 +738,8 @@ class TestPatch(base.FunctionalTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertEqual(response.status_code, 409)
 
-        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY)
+        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY,
+                                                      expected=None)
 
     def test_add_ok(self):
         self.mock_update_node.return_value = self.node
@@ -380,7 +751,8 @@ class TestPatch(base.FunctionalTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertEqual(response.status_code, 200)
 
-        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY)
+        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY,
+                                                      expected=None)
 
     def test_add_fail(self):
         self.assertRaises(webtest.app.AppError, self.patch_json,
@@ -396,7 +768,8 @@ class TestPatch(base.FunctionalTest):
         self.assertEqual(response.content_type, 'application/json')
         self.assertEqual(response.status_code, 200)
 
-        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY)
+        self.mock_update_node.assert_called_once_with(mock.ANY, mock.ANY,
+                                                      expected=None)
 
     def test_remove_fail(self):
         self.assertRaises(webtest.app.AppError, self.patch_json,
@@ -453,6 +826,41 @@ class TestPost(base.FunctionalTest):
         self.assertRaises(webtest.app.AppError, self.post_json, '/nodes',
                           ndict)
 
+    def test_create_nodes_bulk(self):
+        ndicts = [dbutils.get_test_node(uuid=utils.generate_uuid(),
+                                        chassis_id=self.chassis['uuid'])
+                  for i in range(3)]
+        response = self.post_json('/nodes/bulk', ndicts)
+        self.assertEqual(3, response.json['created'])
+        self.assertEqual(0, response.json['failed'])
+        self.assertEqual([n['uuid'] for n in ndicts],
+                         [i['uuid'] for i in response.json['items']])
+        result = self.get_json('/nodes/%s' % ndicts[1]['uuid'])
+        self.assertEqual(self.chassis['uuid'], result['chassis_id'])
+
+    def test_create_nodes_bulk_partial(self):
+        existing = dbutils.get_test_node()
+        self.post_json('/nodes', existing)
+        ndicts = [dbutils.get_test_node(uuid='not-a-uuid'),
+                  dbutils.get_test_node(),
+                  dbutils.get_test_node(uuid=utils.generate_uuid(),
+                                        chassis_id=utils.generate_uuid()),
+                  dbutils.get_test_node(uuid=utils.generate_uuid())]
+        response = self.post_json('/nodes/bulk', ndicts)
+        self.assertEqual(1, response.json['created'])
+        self.assertEqual(3, response.json['failed'])
+        items = response.json['items']
+        self.assertIn('not-a-uuid', items[0]['error'])
+        self.assertIn(existing['uuid'], items[1]['error'])
+        self.assertIn(ndicts[2]['chassis_id'], items[2]['error'])
+        self.assertEqual(ndicts[3]['uuid'], items[3]['uuid'])
+        self.assertNotIn('error', items[3])
+        self.assertThat(self.get_json('/nodes')['nodes'], HasLength(2))
+
+    def test_create_nodes_bulk_empty(self):
+        response = self.post_json('/nodes/bulk', [], expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
     def test_vendor_passthru_ok(self):
         ndict = dbutils.get_test_node()
         self.post_json('/nodes', ndict)
@@ -553,25 +961,56 @@ class TestPut(base.FunctionalTest):
         self.mock_cnps.assert_called_once_with(mock.ANY, mock.ANY, mock.ANY)
 
     def test_power_state_in_progress(self):
-        manager = mock.MagicMock()
-        with mock.patch.object(objects.Node, 'get_by_uuid') as mock_get_node:
-            mock_get_node.return_value = self.node
-            manager.attach_mock(mock_get_node, 'get_by_uuid')
-            manager.attach_mock(self.mock_cnps, 'change_node_power_state')
-            expected = [mock.call.get_by_uuid(mock.ANY, self.node['uuid']),
-                        mock.call.change_node_power_state(mock.ANY, mock.ANY,
-                                                          mock.ANY)]
-
-            self.put_json('/nodes/%s/state/power' % self.node['uuid'],
-                          {'target': states.POWER_ON})
-            self.assertEqual(manager.mock_calls, expected)
-
-        self.dbapi.update_node(self.node['uuid'],
-                               {'target_power_state': 'fake'})
-        self.assertRaises(webtest.app.AppError, self.put_json,
-                          '/nodes/%s/state/power' % self.node['uuid'],
-                          {'target': states.POWER_ON})
+        self.put_json('/nodes/%s/state/power' % self.node['uuid'],
+                      {'target': states.POWER_ON})
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(states.POWER_ON, node['target_power_state'])
+
+        # the first operation is still in progress
         response = self.put_json('/nodes/%s/state/power' % self.node['uuid'],
-                                 {'target': states.POWER_ON},
+                                 {'target': states.POWER_OFF},
                                  expect_errors=True)
         self.assertEqual(response.status_code, 409)
+        self.mock_cnps.assert_called_once_with(mock.ANY, mock.ANY,
+                                               states.POWER_ON)
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(states.POWER_ON, node['target_power_state'])
+
+    def test_power_state_invalid_target(self):
+        response = self.put_json('/nodes/%s/state/power' % self.node['uuid'],
+                                 {'target': 'not-supported'},
+                                 expect_errors=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.mock_cnps.called)
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(None, node['target_power_state'])
+
+    def test_power_state_never_taken(self):
+        # the cast is accepted, but no conductor ever processes it
+        self.put_json('/nodes/%s/state/power' % self.node['uuid'],
+                      {'target': states.POWER_ON})
+        self.assertEqual(0, self.dbapi.clear_stale_power_targets(300))
+        response = self.put_json('/nodes/%s/state/power' % self.node['uuid'],
+                                 {'target': states.POWER_OFF},
+                                 expect_errors=True)
+        self.assertEqual(response.status_code, 409)
+
+        # the conductors clear the claim once it is stale
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(seconds=301))
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(1, self.dbapi.clear_stale_power_targets(300))
+        response = self.put_json('/nodes/%s/state/power' % self.node['uuid'],
+                                 {'target': states.POWER_OFF})
+        self.assertEqual(response.status_code, 202)
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(states.POWER_OFF, node['target_power_state'])
+
+    def test_power_state_rpc_failure(self):
+        self.mock_cnps.side_effect = exception.IronicException()
+        response = self.put_json('/nodes/%s/state/power' % self.node['uuid'],
+                                 {'target': states.POWER_ON},
+                                 expect_errors=True)
+        self.assertEqual(response.status_code, 500)
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(None, node['target_power_state'])
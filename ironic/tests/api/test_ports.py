@@ -16,8 +16,11 @@
 Tests for the API /ports/ methods.
 """
 
+import mock
+from oslo.config import cfg
 import webtest.app
 
+from ironic.api.controllers.v1 import etag as api_etag
 from ironic.common import utils
 from ironic.tests.api import base
 from ironic.tests.db import utils as dbutils
@@ -48,6 +51,69 @@ class TestListPorts(base.FunctionalTest):
         self.assertEqual(port['uuid'], data['ports'][0]["uuid"])
         self.assertIn('extra', data['ports'][0])
 
+    def test_fields(self):
+        pdict = dbutils.get_test_port()
+        port = self.dbapi.create_port(pdict)
+        for url in ('/ports', '/ports/detail'):
+            data = self.get_json(url + '?fields=uuid,extra')
+            self.assertEqual([{'uuid': port['uuid'], 'extra': {}}],
+                             data['ports'])
+        data = self.get_json('/ports/%s?fields=node_id' % port['uuid'])
+        self.assertEqual({'node_id': self.node['uuid']}, data)
+
+    def test_fields_node_id(self):
+        pdict = dbutils.get_test_port()
+        port = self.dbapi.create_port(pdict)
+        data = self.get_json('/ports?fields=uuid,node_id')
+        self.assertEqual([{'uuid': port['uuid'],
+                           'node_id': self.node['uuid']}],
+                         data['ports'])
+
+    def test_detail_query_count(self):
+        # the nodes of a page are looked up at once, not for each port
+        counts = []
+        for id in xrange(20):
+            pdict = dbutils.get_test_port(id=id, uuid=utils.generate_uuid(),
+                                          address='52:54:00:cf:2d:%02x' % id)
+            self.dbapi.create_port(pdict)
+            if id in (1, 19):
+                counts.append(self._count_queries('/ports/detail'))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_sort_key_invalid(self):
+        response = self.get_json('/ports?sort_key=not_a_column',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertTrue(response.json['error_message'])
+
+    def test_fields_invalid(self):
+        response = self.get_json('/ports?fields=uuid,nonexistent',
+                                 expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertTrue(response.json['error_message'])
+
+    def test_stream(self):
+        for id in xrange(3):
+            pdict = dbutils.get_test_port(id=id, uuid=utils.generate_uuid(),
+                                          address='52:54:00:cf:2d:%02x' % id)
+            self.dbapi.create_port(pdict)
+        urls = ['/ports?limit=2', '/ports/detail', '/ports/detail?limit=3']
+        expected = [self.get_json(url) for url in urls]
+
+        cfg.CONF.set_override('stream_min_limit', 2, group='api')
+        for url, data in zip(urls, expected):
+            self.assertEqual(data, self.get_json(url))
+
+    def test_not_modified(self):
+        pdict = dbutils.get_test_port()
+        port = self.dbapi.create_port(pdict)
+        for url in ('/v1/ports', '/v1/ports/%s' % port['uuid']):
+            etag = self.app.get(url).etag
+            response = self.app.get(url,
+                                    headers={'If-None-Match': '"%s"' % etag})
+            self.assertEqual(304, response.status_int)
+            self.assertEqual(etag, response.etag)
+
     def test_detail_against_single(self):
         pdict = dbutils.get_test_port()
         port = self.dbapi.create_port(pdict)
@@ -88,9 +154,11 @@ class TestListPorts(base.FunctionalTest):
             ports.append(port['uuid'])
         data = self.get_json('/ports/?limit=3')
         self.assertEqual(len(data['ports']), 3)
+        self.assertIn('cursor=', data['next'])
 
-        next_marker = data['ports'][-1]['uuid']
-        self.assertIn(next_marker, data['next'])
+        next_page = data['next'].split('/v1', 1)[1]
+        data = self.get_json(next_page)
+        self.assertEqual(ports[3:], [p['uuid'] for p in data['ports']])
 
 
 class TestPatch(base.FunctionalTest):
@@ -114,6 +182,40 @@ class TestPatch(base.FunctionalTest):
         result = self.get_json('/ports/%s' % pdict['uuid'])
         self.assertEqual(result['extra'], extra)
 
+    def test_update_if_match_modified(self):
+        pdict = dbutils.get_test_port()
+        etag = self.app.get('/v1/ports/%s' % pdict['uuid']).etag
+        self.dbapi.update_port(pdict['uuid'], {'extra': {'foo': 'baz'}})
+        response = self.patch_json('/ports/%s' % pdict['uuid'],
+                                   [{'path': '/extra/foo', 'value': 'bar',
+                                     'op': 'add'}],
+                                   headers={'If-Match': '"%s"' % etag},
+                                   expect_errors=True)
+        self.assertEqual(412, response.status_int)
+        result = self.get_json('/ports/%s' % pdict['uuid'])
+        self.assertEqual({'foo': 'baz'}, result['extra'])
+
+    def test_update_if_match_modified_after_check(self):
+        pdict = dbutils.get_test_port()
+        etag = self.app.get('/v1/ports/%s' % pdict['uuid']).etag
+        object_etag = api_etag.object_etag
+
+        def check_then_modify(obj):
+            # another request updates the port right after the check
+            tag = object_etag(obj)
+            self.dbapi.update_port(pdict['uuid'], {'extra': {'foo': 'baz'}})
+            return tag
+
+        with mock.patch.object(api_etag, 'object_etag', check_then_modify):
+            response = self.patch_json('/ports/%s' % pdict['uuid'],
+                                       [{'path': '/extra/foo', 'value': 'bar',
+                                         'op': 'add'}],
+                                       headers={'If-Match': '"%s"' % etag},
+                                       expect_errors=True)
+        self.assertEqual(412, response.status_int)
+        result = self.get_json('/ports/%s' % pdict['uuid'])
+        self.assertEqual({'foo': 'baz'}, result['extra'])
+
     def test_update_byaddress(self):
         pdict = dbutils.get_test_port()
         extra = {'foo': 'bar'}
@@ -291,6 +393,41 @@ class TestPost(base.FunctionalTest):
         self.assertEqual(pdict['address'], result['address'])
         self.assertTrue(utils.is_uuid_like(result['uuid']))
 
+    def test_create_ports_bulk(self):
+        pdicts = [dbutils.get_test_port(uuid=utils.generate_uuid(),
+                                        node_id=self.node['uuid'],
+                                        address='52:54:00:cf:2d:%02x' % i)
+                  for i in range(3)]
+        response = self.post_json('/ports/bulk', pdicts)
+        self.assertEqual(3, response.json['created'])
+        self.assertEqual([p['uuid'] for p in pdicts],
+                         [i['uuid'] for i in response.json['items']])
+        result = self.get_json('/ports/%s' % pdicts[2]['uuid'])
+        self.assertEqual(pdicts[2]['address'], result['address'])
+        self.assertEqual(self.node['uuid'], result['node_id'])
+
+    def test_create_ports_bulk_partial(self):
+        pdicts = [dbutils.get_test_port(node_id=self.node['uuid']),
+                  dbutils.get_test_port(uuid=utils.generate_uuid(),
+                                        address='invalid-format'),
+                  dbutils.get_test_port(uuid=utils.generate_uuid(),
+                                        address=None),
+                  dbutils.get_test_port(uuid=utils.generate_uuid(),
+                                        node_id=self.node['uuid'])]
+        response = self.post_json('/ports/bulk', pdicts)
+        self.assertEqual(1, response.json['created'])
+        items = response.json['items']
+        self.assertEqual(pdicts[0]['uuid'], items[0]['uuid'])
+        self.assertIn('invalid-format', items[1]['error'])
+        self.assertIn('address', items[2]['error'])
+        self.assertIn(pdicts[3]['address'], items[3]['error'])
+
+    def test_create_ports_bulk_subresource(self):
+        pdicts = [dbutils.get_test_port()]
+        response = self.post_json('/nodes/ports/bulk', pdicts,
+                                  expect_errors=True)
+        self.assertEqual(403, response.status_int)
+
     def test_create_port_valid_extra(self):
         pdict = dbutils.get_test_port(extra={'foo': 123})
         self.post_json('/ports', pdict)
@@ -0,0 +1,125 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests for the API /prefetch/ methods.
+"""
+
+import eventlet
+import mock
+from oslo.config import cfg
+
+from ironic.common import exception
+from ironic.common import utils
+from ironic.conductor import rpcapi
+from ironic.openstack.common.rpc import common as rpc_common
+from ironic.tests.api import base
+
+
+class TestPrefetch(base.FunctionalTest):
+
+    IMAGES = [{'image_ref': 'deploy-kernel', 'kind': 'tftp'},
+              {'image_ref': 'glance://image', 'kind': 'instance'}]
+
+    def setUp(self):
+        super(TestPrefetch, self).setUp()
+        p = mock.patch.object(rpcapi.ConductorAPI, 'prefetch_images')
+        self.mock_prefetch = p.start()
+        self.addCleanup(p.stop)
+        p = mock.patch.object(rpcapi.ConductorAPI, 'get_prefetch_status')
+        self.mock_status = p.start()
+        self.addCleanup(p.stop)
+        for host in ('host1', 'host2'):
+            self.dbapi.register_conductor({'hostname': host,
+                                           'drivers': ['fake']})
+
+    def test_post(self):
+        uuid = utils.generate_uuid()
+        with mock.patch.object(utils, 'generate_uuid') as mock_uuid:
+            mock_uuid.return_value = uuid
+            response = self.post_json('/prefetch', {'images': self.IMAGES})
+
+        self.assertEqual(202, response.status_int)
+        self.assertEqual(uuid, response.json['uuid'])
+        self.assertEqual(['queued', 'queued'],
+                         [i['status'] for i in response.json['images']])
+        self.mock_prefetch.assert_called_once_with(mock.ANY, uuid,
+                                                   self.IMAGES)
+
+    def test_post_no_images(self):
+        response = self.post_json('/prefetch', {'images': []},
+                                  expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertFalse(self.mock_prefetch.called)
+
+    def test_post_bad_kind(self):
+        response = self.post_json('/prefetch',
+                                  {'images': [{'image_ref': 'image',
+                                               'kind': 'swap'}]},
+                                  expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.assertFalse(self.mock_prefetch.called)
+
+    def test_get_one(self):
+        uuid = utils.generate_uuid()
+
+        def fake_status(context, prefetch_id, host, timeout):
+            self.assertEqual(uuid, prefetch_id)
+            if host == 'host1':
+                raise exception.PrefetchNotFound(prefetch=prefetch_id)
+            return [{'image_ref': 'deploy-kernel', 'kind': 'tftp',
+                     'status': 'cached', 'error': None},
+                    {'image_ref': 'glance://image', 'kind': 'instance',
+                     'status': 'fetching', 'error': None}]
+
+        self.mock_status.side_effect = fake_status
+        data = self.get_json('/prefetch/%s' % uuid)
+
+        self.assertEqual(uuid, data['uuid'])
+        self.assertEqual([('host2', 'deploy-kernel', 'cached'),
+                          ('host2', 'glance://image', 'fetching')],
+                         [(i['conductor'], i['image_ref'], i['status'])
+                          for i in data['images']])
+        self.assertEqual(2, self.mock_status.call_count)
+
+    def test_get_one_concurrent(self):
+        cfg.CONF.set_override('prefetch_status_timeout', 3, 'api')
+        self.addCleanup(cfg.CONF.clear_override, 'prefetch_status_timeout',
+                        'api')
+        asked = []
+
+        def fake_status(context, prefetch_id, host, timeout):
+            self.assertEqual(3, timeout)
+            asked.append(host)
+            # every conductor is asked before any answers
+            eventlet.sleep(0)
+            self.assertEqual(['host1', 'host2'], sorted(asked))
+            if host == 'host1':
+                raise rpc_common.Timeout()
+            return [{'image_ref': 'deploy-kernel', 'kind': 'tftp',
+                     'status': 'cached', 'error': None}]
+
+        self.mock_status.side_effect = fake_status
+        data = self.get_json('/prefetch/%s' % utils.generate_uuid())
+
+        self.assertEqual([('host2', 'deploy-kernel', 'cached')],
+                         [(i['conductor'], i['image_ref'], i['status'])
+                          for i in data['images']])
+
+    def test_get_one_not_found(self):
+        self.mock_status.side_effect = exception.PrefetchNotFound(
+                                                        prefetch='fake')
+        response = self.get_json('/prefetch/%s' % utils.generate_uuid(),
+                                 expect_errors=True)
+        self.assertEqual(404, response.status_int)
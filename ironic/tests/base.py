@@ -32,6 +32,7 @@ import shutil
 import sys
 
 import fixtures
+from sqlalchemy import event
 import testtools
 
 from oslo.config import cfg
@@ -109,6 +110,32 @@ class Database(fixtures.Fixture):
         """Any addition steps that are needed outside of the migrations."""
 
 
+class CheckedOutConnections(fixtures.Fixture):
+    """Count the connections checked out of the pool of the DB engine.
+
+    count is the number of connections checked out since the fixture was
+    set up, and not checked in yet.
+    """
+
+    def setUp(self):
+        super(CheckedOutConnections, self).setUp()
+        self.count = 0
+        # the engine outlives the test, and its listeners with it
+        self._counting = True
+        self.addCleanup(setattr, self, '_counting', False)
+        engine = session.get_engine()
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def _checkout(self, *args):
+        if self._counting:
+            self.count += 1
+
+    def _checkin(self, *args):
+        if self._counting:
+            self.count -= 1
+
+
 class ReplaceModule(fixtures.Fixture):
     """Replace a module with a fake module."""
 
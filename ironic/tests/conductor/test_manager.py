@@ -24,9 +24,11 @@ import mock
 from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common import states
+from ironic.common import utils as ironic_utils
 from ironic.conductor import manager
 from ironic.conductor import task_manager
 from ironic.db import api as dbapi
+from ironic.drivers.modules import pxe
 from ironic import objects
 from ironic.openstack.common import context
 from ironic.tests.conductor import utils as mgr_utils
@@ -51,6 +53,32 @@ class ManagerTestCase(base.DbTestCase):
         res = self.dbapi.get_conductor('test-host')
         self.assertEqual(res['hostname'], 'test-host')
 
+    def test_start_recovers_reserved_nodes(self):
+        deploying = self.dbapi.create_node(utils.get_test_node(
+                                id=1, uuid=ironic_utils.generate_uuid(),
+                                provision_state=states.DEPLOYING))
+        active = self.dbapi.create_node(utils.get_test_node(
+                                id=2, uuid=ironic_utils.generate_uuid(),
+                                provision_state=states.ACTIVE))
+        other = self.dbapi.create_node(utils.get_test_node(
+                                id=3, uuid=ironic_utils.generate_uuid(),
+                                provision_state=states.DEPLOYING))
+        self.dbapi.reserve_nodes('test-host', [deploying.id, active.id])
+        self.dbapi.reserve_nodes('other-host', [other.id])
+        self.service.start()
+
+        deploying = self.dbapi.get_node(deploying.uuid)
+        self.assertIsNone(deploying.reservation)
+        self.assertEqual(states.DEPLOYFAIL, deploying.provision_state)
+        self.assertIsNotNone(deploying.last_error)
+        active = self.dbapi.get_node(active.uuid)
+        self.assertIsNone(active.reservation)
+        self.assertEqual(states.ACTIVE, active.provision_state)
+        self.assertIsNone(active.last_error)
+        other = self.dbapi.get_node(other.uuid)
+        self.assertEqual('other-host', other.reservation)
+        self.assertEqual(states.DEPLOYING, other.provision_state)
+
     def test_start_registers_driver_names(self):
         init_names = ['fake1', 'fake2']
         restart_names = ['fake3', 'fake4']
@@ -70,11 +98,23 @@ class ManagerTestCase(base.DbTestCase):
             self.assertEqual(res['drivers'], restart_names)
 
     def test_periodic_keepalive(self):
-        self.service.start()
+        # only run the periodic tasks called by the test
+        with mock.patch.object(self.service.tg, 'add_timer'):
+            self.service.start()
         with mock.patch.object(self.dbapi, 'touch_conductor') as mock_touch:
             self.service.periodic_tasks(self.context)
             mock_touch.assert_called_once_with('test-host')
 
+    def test_periodic_clear_stale_power_targets(self):
+        # only run the periodic tasks called by the test
+        with mock.patch.object(self.service.tg, 'add_timer'):
+            self.service.start()
+        with mock.patch.object(self.dbapi,
+                               'clear_stale_power_targets') as mock_clear:
+            mock_clear.return_value = 0
+            self.service.periodic_tasks(self.context)
+            mock_clear.assert_called_once_with(300)
+
     def test_get_power_state(self):
         n = utils.get_test_node(driver='fake')
         self.dbapi.create_node(n)
@@ -109,6 +149,22 @@ class ManagerTestCase(base.DbTestCase):
         res = self.service.update_node(self.context, node)
         self.assertEqual(res['extra'], {'test': 'two'})
 
+    def test_update_node_expected(self):
+        ndict = utils.get_test_node(driver='fake', extra={'test': 'one'})
+        node = self.dbapi.create_node(ndict)
+        self.dbapi.update_node(node['id'], {'extra': {'test': 'other'}})
+
+        # check that it fails if the node changed since it was read
+        node['extra'] = {'test': 'two'}
+        self.assertRaises(exception.NodeUpdateConflict,
+                          self.service.update_node,
+                          self.context,
+                          node,
+                          expected={'extra': {'test': 'one'}})
+
+        res = objects.Node.get_by_uuid(self.context, node['uuid'])
+        self.assertEqual(res['extra'], {'test': 'other'})
+
     def test_update_node_already_locked(self):
         ndict = utils.get_test_node(driver='fake', extra={'test': 'one'})
         node = self.dbapi.create_node(ndict)
@@ -275,6 +331,23 @@ class ManagerTestCase(base.DbTestCase):
             self.assertEqual(node['target_power_state'], None)
             self.assertEqual(node['last_error'], None)
 
+    def test_change_node_power_state_locked_clears_target(self):
+        ndict = utils.get_test_node(driver='fake',
+                                    power_state=states.POWER_ON,
+                                    target_power_state=states.POWER_OFF)
+        node = self.dbapi.create_node(ndict)
+        node = objects.Node.get_by_uuid(self.context, node['uuid'])
+
+        with task_manager.acquire(self.context, node['id'], shared=False):
+            self.assertRaises(exception.NodeLocked,
+                              self.service.change_node_power_state,
+                              self.context,
+                              node,
+                              states.POWER_OFF)
+        node.refresh()
+        self.assertEqual(node['power_state'], states.POWER_ON)
+        self.assertEqual(node['target_power_state'], None)
+
     def test_change_node_power_state_already_being_processed(self):
         """The target_power_state is expected to be None so it isn't
         checked in the code. This is what happens if it is not None.
@@ -530,3 +603,19 @@ class ManagerTestCase(base.DbTestCase):
             self.assertEqual(node['target_provision_state'], states.DELETED)
             self.assertIsNone(node['last_error'])
             deploy.assert_called_once()
+
+    def test_prefetch_images(self):
+        images = [{'image_ref': 'fake-image', 'kind': 'instance'}]
+        mgr_utils.get_mocked_node_manager(driver='fake_pxe')
+        with mock.patch.object(self.service.tg, 'add_timer'):
+            self.service.start()
+        with mock.patch.object(pxe.PXEDeploy,
+                               'prefetch_image') as prefetch_mock:
+            self.service.prefetch_images(self.context, 'fake-uuid', images)
+            self.service.tg.wait()
+
+        prefetch_mock.assert_called_once_with(self.context, 'fake-image',
+                                              'instance')
+        status = self.service.get_prefetch_status(self.context, 'fake-uuid')
+        self.assertEqual([{'image_ref': 'fake-image', 'kind': 'instance',
+                           'status': 'cached', 'error': None}], status)
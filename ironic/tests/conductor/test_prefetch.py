@@ -0,0 +1,91 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# coding=utf-8
+
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the conductor image prefetcher."""
+
+import mock
+
+from ironic.common import exception
+from ironic.conductor import prefetch
+from ironic.drivers.modules import fake
+from ironic.drivers.modules import pxe
+from ironic.tests import base
+
+IMAGES = [{'image_ref': 'deploy-kernel', 'kind': 'tftp'},
+          {'image_ref': 'glance://image', 'kind': 'instance'}]
+
+
+def _run(func, *args):
+    return func(*args)
+
+
+@mock.patch.object(pxe.PXEDeploy, 'prefetch_image')
+class ImagePrefetcherTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ImagePrefetcherTestCase, self).setUp()
+        # the second PXE deploy interface shares the caches of the first
+        self.prefetcher = prefetch.ImagePrefetcher([fake.FakeDeploy(),
+                                                    pxe.PXEDeploy(),
+                                                    pxe.PXEDeploy()])
+
+    def test_start_queues_images(self, prefetch_mock):
+        spawn = mock.Mock()
+        self.prefetcher.start('ctx', 'fake-uuid', IMAGES, spawn)
+
+        self.assertEqual([prefetch.QUEUED, prefetch.QUEUED],
+                         [i['status'] for i in
+                          self.prefetcher.status('fake-uuid')])
+        self.assertEqual(1, spawn.call_count)
+        self.assertFalse(prefetch_mock.called)
+
+    def test_fetch(self, prefetch_mock):
+        prefetch_mock.side_effect = [True, exception.ImageNotFound(
+                                                        image_id='image')]
+        self.prefetcher.start('ctx', 'fake-uuid', IMAGES, _run)
+
+        status = self.prefetcher.status('fake-uuid')
+        self.assertEqual([prefetch.CACHED, prefetch.FAILED],
+                         [i['status'] for i in status])
+        self.assertIsNone(status[0]['error'])
+        self.assertEqual('Image image could not be found.',
+                         status[1]['error'])
+        self.assertEqual([mock.call('ctx', 'deploy-kernel', 'tftp'),
+                          mock.call('ctx', 'glance://image', 'instance')],
+                         prefetch_mock.call_args_list)
+
+    def test_fetch_no_image_caches(self, prefetch_mock):
+        prefetcher = prefetch.ImagePrefetcher([fake.FakeDeploy()])
+        prefetcher.start('ctx', 'fake-uuid', IMAGES[:1], _run)
+
+        status = prefetcher.status('fake-uuid')
+        self.assertEqual(prefetch.FAILED, status[0]['status'])
+        self.assertTrue(status[0]['error'])
+        self.assertFalse(prefetch_mock.called)
+
+    def test_status_not_found(self, prefetch_mock):
+        self.assertRaises(exception.PrefetchNotFound,
+                          self.prefetcher.status, 'fake-uuid')
+
+    def test_old_prefetches_forgotten(self, prefetch_mock):
+        for i in range(prefetch.MAX_PREFETCHES + 1):
+            self.prefetcher.start('ctx', 'uuid-%d' % i, IMAGES, _run)
+
+        self.assertRaises(exception.PrefetchNotFound,
+                          self.prefetcher.status, 'uuid-0')
+        self.prefetcher.status('uuid-1')
@@ -20,6 +20,7 @@ Unit Tests for :py:class:`ironic.conductor.rpcapi.ConductorAPI`.
 """
 
 import fixtures
+import mock
 
 from oslo.config import cfg
 
@@ -91,7 +92,14 @@ class RPCAPITestCase(base.DbTestCase):
     def test_update_node(self):
         self._test_rpcapi('update_node',
                           'call',
-                          node_obj=self.fake_node)
+                          node_obj=self.fake_node,
+                          expected=None)
+
+    def test_update_node_expected(self):
+        self._test_rpcapi('update_node',
+                          'call',
+                          node_obj=self.fake_node,
+                          expected={'instance_uuid': None})
 
     def test_change_node_power_state(self):
         self._test_rpcapi('change_node_power_state',
@@ -122,3 +130,26 @@ class RPCAPITestCase(base.DbTestCase):
         self._test_rpcapi('do_node_tear_down',
                           'cast',
                           node_obj=self.fake_node)
+
+    def test_prefetch_images(self):
+        self._test_rpcapi('prefetch_images',
+                          'fanout_cast',
+                          prefetch_id='fake-uuid',
+                          images=[{'image_ref': 'fake-image',
+                                   'kind': 'instance'}])
+
+    def test_get_prefetch_status(self):
+        rpcapi = conductor_rpcapi.ConductorAPI(topic='fake-topic')
+        expected_msg = rpcapi.make_msg('get_prefetch_status',
+                                       prefetch_id='fake-uuid')
+        expected_msg['version'] = rpcapi.RPC_API_VERSION
+
+        with mock.patch('ironic.openstack.common.rpc.call') as call_mock:
+            call_mock.return_value = []
+            retval = rpcapi.get_prefetch_status(self.context, 'fake-uuid',
+                                                'fake-host', timeout=5)
+
+        self.assertEqual([], retval)
+        call_mock.assert_called_once_with(self.context,
+                                          'fake-topic.fake-host',
+                                          expected_msg, 5)
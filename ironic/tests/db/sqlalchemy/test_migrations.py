@@ -42,6 +42,7 @@ postgres=# create database openstack_citest with owner openstack_citest;
 
 import ConfigParser
 import fixtures
+import json
 import os
 import subprocess
 import urlparse
@@ -736,3 +737,73 @@ class TestMigrations(BaseMigrationTestCase, WalkVersionsMixin):
         self.assertEqual(len(col_names_pre), len(col_names) - 1)
         self.assertTrue(isinstance(nodes.c['last_error'].type,
                                    getattr(sqlalchemy.types, 'Text')))
+
+    def _check_014(self, engine, data):
+        self.assertTrue(engine.dialect.has_table(engine.connect(),
+                                                 'master_images'))
+        master_images = db_utils.get_table(engine, 'master_images')
+        image = {'hostname': 'test-host', 'checksum': 'abc',
+                 'content_checksum': 'def', 'url': 'http://test/abc'}
+        master_images.insert().values(image).execute()
+        self.assertRaises(sqlalchemy.exc.IntegrityError,
+                          master_images.insert().execute, image)
+        # another conductor can serve the same image
+        master_images.insert().execute(dict(image, hostname='other-host'))
+
+    def _check_015(self, engine, data):
+        expected = {
+            'nodes': set(['nodes_reservation_idx', 'nodes_chassis_id_idx',
+                          'nodes_provision_state_power_state_idx']),
+            'ports': set(['ports_node_id_idx']),
+            'conductors': set(['conductors_updated_at_idx']),
+        }
+        for table_name, names in expected.items():
+            table = db_utils.get_table(engine, table_name)
+            index_names = set(index.name for index in table.indexes)
+            self.assertTrue(names.issubset(index_names))
+
+    def _pre_upgrade_016(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        data = [{'uuid': 'ea0a8b3c-3ea5-4d4b-a3a7-cf1ba9a4f3e1',
+                 'properties': json.dumps({'cpus': '8', 'memory_mb': 65536,
+                                           'local_gb': 'many',
+                                           'cpu_arch': 'x86_64'})},
+                {'uuid': '6b7fe2ba-3a4e-4b0b-8e8c-0f2e3a1bd3c2',
+                 'properties': json.dumps('{}')},
+                {'uuid': '0c7bd1a4-5e6f-4b1a-9d2c-3f4e5a6b7c8d',
+                 'properties': json.dumps({'cpus': 4,
+                                           'cpu_arch': u'x86_64\u00e9'})}]
+        nodes.insert().execute(data)
+        return data
+
+    def _check_016(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        for name in ('cpus', 'memory_mb', 'local_gb'):
+            self.assertIsInstance(nodes.c[name].type,
+                                  sqlalchemy.types.Integer)
+        self.assertIsInstance(nodes.c['cpu_arch'].type,
+                              sqlalchemy.types.String)
+        index_names = set(index.name for index in nodes.indexes)
+        self.assertTrue(set(['nodes_cpus_idx', 'nodes_memory_mb_idx',
+                             'nodes_local_gb_idx', 'nodes_cpu_arch_idx'])
+                        .issubset(index_names))
+
+        # the new columns are filled from the properties of existing nodes
+        rows = dict((row['uuid'], row) for row in nodes.select().execute())
+        row = rows[data[0]['uuid']]
+        self.assertEqual((8, 65536, None, 'x86_64'),
+                         (row['cpus'], row['memory_mb'], row['local_gb'],
+                          row['cpu_arch']))
+        row = rows[data[1]['uuid']]
+        self.assertEqual((None, None, None, None),
+                         (row['cpus'], row['memory_mb'], row['local_gb'],
+                          row['cpu_arch']))
+        # a non-ASCII value is copied as it is
+        row = rows[data[2]['uuid']]
+        self.assertEqual((4, u'x86_64\u00e9'), (row['cpus'], row['cpu_arch']))
+
+    def _check_017(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        index_names = set(index.name for index in nodes.indexes)
+        self.assertTrue(set(['nodes_driver_idx', 'nodes_power_state_idx'])
+                        .issubset(index_names))
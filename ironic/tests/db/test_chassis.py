@@ -64,6 +64,25 @@ class DbChassisTestCase(base.DbTestCase):
 
         self.assertEqual(chassis['id'], ch['id'])
 
+    def test_get_chassis_uuids(self):
+        ch1 = self._create_test_chassis(id=1,
+                                        uuid=ironic_utils.generate_uuid())
+        ch2 = self._create_test_chassis(id=2,
+                                        uuid=ironic_utils.generate_uuid())
+        res = self.dbapi.get_chassis_uuids([1, 2, 2, 3])
+        self.assertEqual({1: ch1['uuid'], 2: ch2['uuid']}, res)
+
+    def test_get_all_chassis_columns(self):
+        ch = self._create_test_chassis()
+        res = self.dbapi.get_all_chassis(['uuid', 'description'])
+        self.assertEqual(ch['description'], res[0].description)
+        self.assertEqual(['description', 'id', 'uuid'],
+                         sorted(res[0].as_dict()))
+
+    def test_get_all_chassis_unknown_column(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          self.dbapi.get_all_chassis, ['uuid', 'foo'])
+
     def test_get_chassis_that_does_not_exist(self):
         self.assertRaises(exception.ChassisNotFound,
                           self.dbapi.get_chassis, 666)
@@ -77,6 +96,20 @@ class DbChassisTestCase(base.DbTestCase):
 
         self.assertEqual(res['uuid'], new_uuid)
 
+    def test_update_chassis_expected(self):
+        ch = self._create_test_chassis(extra={'foo': 'bar'})
+
+        res = self.dbapi.update_chassis(ch['id'], {'description': 'one'},
+                                        expected={'extra': {'foo': 'bar'}})
+        self.assertEqual('one', res['description'])
+
+        self.assertRaises(exception.ChassisUpdateConflict,
+                          self.dbapi.update_chassis, ch['id'],
+                          {'description': 'two'},
+                          expected={'description': 'other'})
+        res = self.dbapi.get_chassis(ch['id'])
+        self.assertEqual('one', res['description'])
+
     def test_update_chassis_that_does_not_exist(self):
         new_uuid = ironic_utils.generate_uuid()
 
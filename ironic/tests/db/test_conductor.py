@@ -109,3 +109,18 @@ class DbConductorTestCase(base.DbTestCase):
         res = self.dbapi.list_active_conductor_drivers(interval=7200)
         drivers = d1 + d2 + d3
         self.assertEqual(sorted(res), sorted(drivers))
+
+    def test_list_active_conductors(self):
+        now = datetime.datetime(2000, 1, 1, 0, 0)
+        then = now + datetime.timedelta(hours=1)
+
+        timeutils.set_time_override(override_time=now)
+        self._create_test_cdr(id=1, hostname='h1')
+        timeutils.set_time_override(override_time=then)
+        self._create_test_cdr(id=2, hostname='h2')
+
+        res = self.dbapi.list_active_conductors(interval=60)
+        self.assertEqual(['h2'], res)
+
+        res = self.dbapi.list_active_conductors(interval=7200)
+        self.assertEqual(['h1', 'h2'], sorted(res))
@@ -0,0 +1,81 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for manipulating advertised master images via the DB API"""
+
+import datetime
+
+from ironic.openstack.common import timeutils
+
+from ironic.db import api as dbapi
+from ironic.tests.db import base
+from ironic.tests.db import utils
+
+
+class DbMasterImageTestCase(base.DbTestCase):
+
+    def setUp(self):
+        super(DbMasterImageTestCase, self).setUp()
+        self.dbapi = dbapi.get_instance()
+        timeutils.set_time_override(datetime.datetime(2000, 1, 1, 0, 0))
+        self.addCleanup(timeutils.clear_time_override)
+        for i, host in enumerate(('host1', 'host2')):
+            self.dbapi.register_conductor(
+                    utils.get_test_conductor(id=i, hostname=host))
+
+    def _peer_hosts(self, checksum='c46b4d1a5ab11ae7b3af5eb0e5df94f6'):
+        peers = self.dbapi.get_master_image_peers(checksum, 60)
+        return sorted(p['hostname'] for p in peers)
+
+    def test_register_master_image(self):
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host1'))
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host2'))
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host2',
+                                            checksum='other'))
+        self.assertEqual(['host1', 'host2'], self._peer_hosts())
+        self.assertEqual(['host2'], self._peer_hosts('other'))
+
+    def test_register_master_image_again(self):
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host1'))
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host1',
+                                            url='http://new/'))
+        peers = self.dbapi.get_master_image_peers(
+                'c46b4d1a5ab11ae7b3af5eb0e5df94f6', 60)
+        self.assertEqual(['http://new/'], [p['url'] for p in peers])
+
+    def test_unregister_master_image(self):
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host1'))
+        self.dbapi.unregister_master_image(
+                'host1', 'c46b4d1a5ab11ae7b3af5eb0e5df94f6')
+        self.assertEqual([], self._peer_hosts())
+        # unregistering an image which is not advertised is a no-op
+        self.dbapi.unregister_master_image(
+                'host1', 'c46b4d1a5ab11ae7b3af5eb0e5df94f6')
+
+    def test_get_master_image_peers_skips_inactive_conductors(self):
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host1'))
+        self.dbapi.register_master_image(
+                utils.get_test_master_image(hostname='host2'))
+
+        timeutils.set_time_override(datetime.datetime(2000, 1, 1, 0, 2))
+        self.dbapi.touch_conductor('host2')
+        self.assertEqual(['host2'], self._peer_hosts())
@@ -17,12 +17,21 @@
 
 """Tests for manipulating Nodes via the DB API"""
 
+import datetime
+
+import mock
 import six
 
 from ironic.common import exception
+from ironic.common import lazy_json
+from ironic.common import states
 from ironic.common import utils as ironic_utils
 from ironic.db import api as dbapi
+from ironic.db.sqlalchemy import api as sqlalchemy_api
+from ironic.openstack.common.db import exception as db_exc
+from ironic.openstack.common import timeutils
 
+from ironic.tests import base as tests_base
 from ironic.tests.db import base
 from ironic.tests.db import utils
 
@@ -71,6 +80,109 @@ class DbNodeTestCase(base.DbTestCase):
     def test_create_node(self):
         self._create_test_node()
 
+    def test_create_nodes(self):
+        ch = self.dbapi.create_chassis(utils.get_test_chassis())
+        values = [utils.get_test_node(uuid=ironic_utils.generate_uuid(),
+                                      chassis_id=ch['uuid']),
+                  utils.get_test_node(uuid=ironic_utils.generate_uuid(),
+                                      chassis_id=ch['id']),
+                  utils.get_test_node(uuid=None, chassis_id=None)]
+
+        res = self.dbapi.create_nodes(values)
+
+        self.assertEqual(3, len(res))
+        self.assertEqual([values[0]['uuid'], values[1]['uuid']],
+                         [res[0].uuid, res[1].uuid])
+        self.assertTrue(ironic_utils.is_uuid_like(res[2].uuid))
+        self.assertEqual([ch['id'], ch['id'], None],
+                         [n.chassis_id for n in res])
+        self.assertEqual(res[0].id, self.dbapi.get_node(res[0].uuid).id)
+        self.assertEqual(3, len(self.dbapi.get_node_list()))
+
+    def test_create_nodes_errors(self):
+        existing = self._create_test_node()
+        uuid = ironic_utils.generate_uuid()
+        values = [utils.get_test_node(uuid=existing['uuid'],
+                                      chassis_id=None),
+                  utils.get_test_node(uuid=ironic_utils.generate_uuid(),
+                                      chassis_id=ironic_utils.generate_uuid()),
+                  utils.get_test_node(uuid=uuid, chassis_id=None),
+                  utils.get_test_node(uuid=uuid, chassis_id=None)]
+
+        res = self.dbapi.create_nodes(values)
+
+        self.assertIsInstance(res[0], exception.NodeAlreadyExists)
+        self.assertIsInstance(res[1], exception.ChassisNotFound)
+        self.assertEqual(uuid, res[2].uuid)
+        self.assertIsInstance(res[3], exception.NodeAlreadyExists)
+        self.assertEqual(2, len(self.dbapi.get_node_list()))
+
+    def test_create_nodes_concurrent_duplicate(self):
+        existing = self._create_test_node()
+        values = [utils.get_test_node(id=1, chassis_id=None,
+                                      uuid=ironic_utils.generate_uuid()),
+                  utils.get_test_node(id=2, chassis_id=None,
+                                      uuid=existing['uuid']),
+                  utils.get_test_node(id=3, chassis_id=None,
+                                      uuid=ironic_utils.generate_uuid())]
+        create_node = self.dbapi.create_node
+
+        def fake_create_node(values):
+            if values['uuid'] == existing['uuid']:
+                raise db_exc.DBDuplicateEntry(['uuid'])
+            return create_node(values)
+
+        # the node is created by another request once the uuids were
+        # checked
+        with mock.patch.object(sqlalchemy_api, '_existing_values') as \
+                existing_mock:
+            existing_mock.return_value = set()
+            with mock.patch.object(sqlalchemy_api, '_bulk_insert') as \
+                    insert_mock:
+                insert_mock.side_effect = db_exc.DBDuplicateEntry(['uuid'])
+                with mock.patch.object(sqlalchemy_api.Connection,
+                                       'create_node') as create_mock:
+                    create_mock.side_effect = fake_create_node
+                    res = self.dbapi.create_nodes(values)
+
+        self.assertEqual(values[0]['uuid'], res[0].uuid)
+        self.assertIsInstance(res[1], exception.NodeAlreadyExists)
+        self.assertEqual(values[2]['uuid'], res[2].uuid)
+        self.assertEqual(3, len(self.dbapi.get_node_list()))
+
+    def test_create_nodes_inserts_given_columns(self):
+        values = [utils.get_test_node(uuid=ironic_utils.generate_uuid(),
+                                      chassis_id=None),
+                  utils.get_test_node(uuid=ironic_utils.generate_uuid(),
+                                      chassis_id=None)]
+        del values[0]['last_error']
+        session = sqlalchemy_api.get_session()
+        with mock.patch.object(sqlalchemy_api, 'get_session') as \
+                session_mock:
+            session_mock.return_value = session
+            with mock.patch.object(session, 'execute',
+                                   wraps=session.execute) as execute_mock:
+                self.dbapi.create_nodes(values)
+
+        inserted = [row for args, kwargs in execute_mock.call_args_list
+                    if len(args) > 1 for row in args[1]]
+        self.assertEqual(2, len(inserted))
+        self.assertNotIn('last_error', inserted[0])
+        self.assertIn('last_error', inserted[1])
+        for row in inserted:
+            self.assertNotIn('id', row)
+            self.assertEqual('{}', row['extra'])
+
+    def test_create_nodes_many(self):
+        values = [utils.get_test_node(uuid=ironic_utils.generate_uuid(),
+                                      chassis_id=None)
+                  for i in range(1200)]
+
+        res = self.dbapi.create_nodes(values)
+
+        self.assertEqual([v['uuid'] for v in values], [n.uuid for n in res])
+        self.assertEqual(1200, len(self.dbapi.get_node_list()))
+
     def test_get_nodes_by_chassis_id(self):
         ch = utils.get_test_chassis()
         ch = self.dbapi.create_chassis(ch)
@@ -93,6 +205,193 @@ class DbNodeTestCase(base.DbTestCase):
                           self.dbapi.get_nodes_by_chassis,
                           '12345678-9999-0000-aaaa-123456789012')
 
+    def test_get_nodes_columns(self):
+        uuids = self._create_many_test_nodes()
+        res = self.dbapi.get_nodes(['uuid', 'power_state'])
+        self.assertEqual(uuids, sorted(n.uuid for n in res))
+        self.assertEqual(range(1, 6), [n.id for n in res])
+        self.assertIn('power_state', res[0])
+        self.assertNotIn('driver_info', res[0])
+        self.assertNotIn('properties', res[0])
+        self.assertEqual(['id', 'power_state', 'uuid'],
+                         sorted(res[0].as_dict()))
+
+    def test_get_nodes_all_columns(self):
+        n = self._create_test_node()
+        res = self.dbapi.get_nodes(None)
+        self.assertEqual(n['driver_info'], res[0].driver_info)
+
+    def test_get_nodes_unknown_column(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          self.dbapi.get_nodes, ['uuid', 'foo'])
+
+    def test_get_nodes_paginated(self):
+        self._create_many_test_nodes()
+        res = self.dbapi.get_nodes(['uuid'], limit=2,
+                                   marker=dbapi.Cursor('id', 2, 2))
+        self.assertEqual([3, 4], [n.id for n in res])
+
+    def test_get_nodes_stream(self):
+        uuids = self._create_many_test_nodes()
+        res = self.dbapi.get_nodes(['uuid'], limit=4, sort_key='uuid',
+                                   stream=True)
+        self.assertNotIsInstance(res, list)
+        self.assertEqual(uuids[:4], [n.uuid for n in res])
+
+    @mock.patch.object(sqlalchemy_api, '_STREAM_BATCH_SIZE', 2)
+    def test_get_nodes_stream_batches(self):
+        uuids = self._create_many_test_nodes()
+        connections = self.useFixture(tests_base.CheckedOutConnections())
+
+        res = self.dbapi.get_nodes(['uuid'], limit=4, sort_key='uuid',
+                                   sort_dir='desc', stream=True)
+        result = []
+        for node in res:
+            # no connection is held between the rows
+            self.assertEqual(0, connections.count)
+            result.append(node.uuid)
+        self.assertEqual(uuids[::-1][:4], result)
+
+    def test_get_nodes_filters(self):
+        ch = self.dbapi.create_chassis(utils.get_test_chassis())
+        instance_uuid = ironic_utils.generate_uuid()
+        in_chassis = self._create_test_node(id=1,
+                                            uuid=ironic_utils.generate_uuid(),
+                                            chassis_id=ch['id'])
+        associated = self._create_test_node(id=2,
+                                            uuid=ironic_utils.generate_uuid(),
+                                            chassis_id=None,
+                                            instance_uuid=instance_uuid)
+
+        def uuids(filters):
+            return [n.uuid for n in self.dbapi.get_nodes(['uuid'], filters)]
+
+        self.assertEqual([in_chassis['uuid']],
+                         uuids({'chassis_id': ch['uuid']}))
+        self.assertEqual([associated['uuid']],
+                         uuids({'instance_uuid': instance_uuid}))
+        self.assertEqual([associated['uuid']], uuids({'associated': True}))
+        self.assertEqual([in_chassis['uuid']], uuids({'associated': False}))
+        self.assertRaises(exception.ChassisNotFound,
+                          self.dbapi.get_nodes, ['uuid'], {'chassis_id': 33})
+        self.assertRaises(exception.InvalidUUID,
+                          self.dbapi.get_nodes, ['uuid'],
+                          {'instance_uuid': 'fake'})
+
+    def test_get_nodes_state_filters(self):
+        failed = self._create_test_node(id=1,
+                                        uuid=ironic_utils.generate_uuid(),
+                                        driver='pxe_ipmitool',
+                                        provision_state=states.DEPLOYFAIL,
+                                        last_error='boom')
+        active = self._create_test_node(id=2,
+                                        uuid=ironic_utils.generate_uuid(),
+                                        power_state=states.POWER_ON,
+                                        provision_state=states.ACTIVE)
+        self.dbapi.reserve_nodes('conductor-1', [active['id']])
+
+        def uuids(filters, **kwargs):
+            return [n.uuid for n in self.dbapi.get_nodes(['uuid'], filters,
+                                                         **kwargs)]
+
+        self.assertEqual([failed['uuid']], uuids({'driver': 'pxe_ipmitool'}))
+        self.assertEqual([active['uuid']],
+                         uuids({'power_state': states.POWER_ON}))
+        self.assertEqual([failed['uuid']],
+                         uuids({'provision_state': states.DEPLOYFAIL}))
+        self.assertEqual([active['uuid']],
+                         uuids({'reservation': 'conductor-1'}))
+        self.assertEqual([failed['uuid']], uuids({'has_last_error': True}))
+        self.assertEqual([active['uuid']], uuids({'has_last_error': False}))
+        self.assertEqual([], uuids({'driver': 'fake',
+                                    'has_last_error': True}))
+        self.assertEqual([active['uuid'], failed['uuid']],
+                         uuids({'driver': None}, sort_key='id',
+                               sort_dir='desc'))
+
+    def _create_capacity_nodes(self):
+        small = self._create_test_node(id=1,
+                                       uuid=ironic_utils.generate_uuid(),
+                                       properties={'cpus': 4,
+                                                   'memory_mb': 8192,
+                                                   'local_gb': 100,
+                                                   'cpu_arch': 'x86_64'})
+        big = self._create_test_node(id=2, uuid=ironic_utils.generate_uuid(),
+                                     properties={'cpus': '32',
+                                                 'memory_mb': '131072',
+                                                 'local_gb': '2000',
+                                                 'cpu_arch': 'x86_64'})
+        used = self._create_test_node(id=3, uuid=ironic_utils.generate_uuid(),
+                                      instance_uuid=
+                                          ironic_utils.generate_uuid(),
+                                      properties={'cpus': 32,
+                                                  'memory_mb': 131072,
+                                                  'local_gb': 2000,
+                                                  'cpu_arch': 'x86_64'})
+        unknown = self._create_test_node(id=4,
+                                         uuid=ironic_utils.generate_uuid(),
+                                         properties={'memory_mb': 'lots'})
+        return small, big, used, unknown
+
+    def test_get_nodes_capacity_filters(self):
+        small, big, used, unknown = self._create_capacity_nodes()
+
+        def uuids(filters):
+            return [n.uuid for n in self.dbapi.get_nodes(['uuid'], filters)]
+
+        self.assertEqual([big['uuid']],
+                         uuids({'associated': False,
+                                'min_memory_mb': 65536}))
+        self.assertEqual([big['uuid'], used['uuid']],
+                         uuids({'min_cpus': 8, 'max_local_gb': 2000}))
+        self.assertEqual([small['uuid']],
+                         uuids({'max_memory_mb': 8192, 'cpus': 4}))
+        self.assertEqual([small['uuid'], big['uuid']],
+                         uuids({'associated': False, 'cpu_arch': 'x86_64'}))
+        self.assertEqual([], uuids({'cpu_arch': 'armhf'}))
+
+    def test_get_node_list_filters(self):
+        small, big, used, unknown = self._create_capacity_nodes()
+        res = self.dbapi.get_node_list(filters={'associated': False,
+                                                'min_local_gb': 500})
+        self.assertEqual([big['uuid']], [n.uuid for n in res])
+
+    def test_update_node_syncs_capacity_columns(self):
+        small, big, used, unknown = self._create_capacity_nodes()
+        self.dbapi.update_node(small['id'],
+                               {'properties': {'memory_mb': 262144}})
+        res = self.dbapi.get_nodes(['uuid'], {'min_memory_mb': 200000})
+        self.assertEqual([small['uuid']], [n.uuid for n in res])
+        res = self.dbapi.get_nodes(['uuid'], {'cpus': 4})
+        self.assertEqual([], res)
+
+    def test_create_nodes_syncs_capacity_columns(self):
+        n = utils.get_test_node(id=1, chassis_id=None,
+                                properties={'cpus': 16})
+        self.dbapi.create_nodes([n])
+        res = self.dbapi.get_nodes(['uuid'], {'min_cpus': 16})
+        self.assertEqual([n['uuid']], [r.uuid for r in res])
+
+    def test_get_node_json_fields_decoded_lazily(self):
+        n = self._create_test_node()
+        res = self.dbapi.get_node(n['id'])
+        self.assertIsInstance(res._driver_info, lazy_json.LazyJSONDict)
+        self.assertFalse(res._driver_info.loaded)
+        self.assertEqual(n['driver_info'], res.driver_info)
+        self.assertIsInstance(res._driver_info, dict)
+        self.assertFalse(res._properties.loaded)
+
+    def test_update_node_keeps_json_text(self):
+        n = self._create_test_node()
+        ref = self.dbapi.get_node(n['id'])
+        # an undecoded dict is written back as the text it was read from
+        self.dbapi.update_node(n['id'], {'extra': {'foo': 'bar'},
+                                         'properties': ref._properties})
+        self.assertFalse(ref._properties.loaded)
+        res = self.dbapi.get_node(n['id'])
+        self.assertEqual({'foo': 'bar'}, res.extra)
+        self.assertEqual(n['properties'], res.properties)
+
     def test_get_node_by_id(self):
         n = self._create_test_node()
         res = self.dbapi.get_node(n['id'])
@@ -103,6 +402,12 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node(n['uuid'])
         self.assertEqual(n['id'], res['id'])
 
+    def test_get_node_uuids(self):
+        n1 = self._create_test_node(id=1, uuid=ironic_utils.generate_uuid())
+        n2 = self._create_test_node(id=2, uuid=ironic_utils.generate_uuid())
+        res = self.dbapi.get_node_uuids([1, 2, 2, 3])
+        self.assertEqual({1: n1['uuid'], 2: n2['uuid']}, res)
+
     def test_get_node_that_does_not_exist(self):
         self.assertRaises(exception.NodeNotFound,
                           self.dbapi.get_node, 99)
@@ -122,6 +427,92 @@ class DbNodeTestCase(base.DbTestCase):
         res_uuids = [r.uuid for r in res]
         self.assertEqual(uuids.sort(), res_uuids.sort())
 
+    def test_get_node_list_cursor(self):
+        for i in xrange(1, 6):
+            n = utils.get_test_node(id=i, uuid=ironic_utils.generate_uuid())
+            self.dbapi.create_node(n)
+
+        res = self.dbapi.get_node_list(2, dbapi.Cursor('id', 2, 2))
+        self.assertEqual([3, 4], [r.id for r in res])
+        res = self.dbapi.get_node_list(None, dbapi.Cursor('id', 4, 4),
+                                       sort_key='id', sort_dir='desc')
+        self.assertEqual([3, 2, 1], [r.id for r in res])
+
+    def _create_nodes_with_instances(self):
+        # sorted by instance_uuid: nodes 1 and 3 have none, then 2 and 4
+        for i in xrange(1, 5):
+            instance = None if i % 2 else 'instance-%d' % i
+            n = utils.get_test_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                    instance_uuid=instance)
+            self.dbapi.create_node(n)
+
+    def test_get_node_list_cursor_null_asc(self):
+        self._create_nodes_with_instances()
+        res = self.dbapi.get_node_list(None,
+                                       dbapi.Cursor('instance_uuid', None, 1),
+                                       sort_key='instance_uuid')
+        self.assertEqual([3, 2, 4], [r.id for r in res])
+        res = self.dbapi.get_node_list(None,
+                                       dbapi.Cursor('instance_uuid', None, 3),
+                                       sort_key='instance_uuid')
+        self.assertEqual([2, 4], [r.id for r in res])
+        res = self.dbapi.get_node_list(None,
+                                       dbapi.Cursor('instance_uuid',
+                                                    'instance-2', 2),
+                                       sort_key='instance_uuid')
+        self.assertEqual([4], [r.id for r in res])
+
+    def test_get_node_list_cursor_null_desc(self):
+        self._create_nodes_with_instances()
+        res = self.dbapi.get_node_list(None,
+                                       dbapi.Cursor('instance_uuid',
+                                                    'instance-2', 2),
+                                       sort_key='instance_uuid',
+                                       sort_dir='desc')
+        self.assertEqual([3, 1], [r.id for r in res])
+        res = self.dbapi.get_node_list(None,
+                                       dbapi.Cursor('instance_uuid', None, 3),
+                                       sort_key='instance_uuid',
+                                       sort_dir='desc')
+        self.assertEqual([1], [r.id for r in res])
+
+    def test_get_node_list_cursor_null_pages(self):
+        self._create_nodes_with_instances()
+        for sort_dir, expected in (('asc', [1, 3, 2, 4]),
+                                   ('desc', [4, 2, 3, 1])):
+            ids = []
+            cursor = None
+            while True:
+                res = self.dbapi.get_node_list(1, cursor,
+                                               sort_key='instance_uuid',
+                                               sort_dir=sort_dir)
+                if not res:
+                    break
+                ids.extend(r.id for r in res)
+                cursor = dbapi.Cursor('instance_uuid', res[-1].instance_uuid,
+                                      res[-1].id)
+            self.assertEqual(expected, ids)
+
+    def test_get_node_list_cursor_datetime(self):
+        t = datetime.datetime(2000, 1, 1)
+        # nodes 1 and 2 were created at the same time
+        for i, minutes in ((1, 1), (2, 1), (3, 0), (4, 2)):
+            timeutils.set_time_override(t + datetime.timedelta(
+                                                        minutes=minutes))
+            n = utils.get_test_node(id=i, uuid=ironic_utils.generate_uuid())
+            self.dbapi.create_node(n)
+        timeutils.clear_time_override()
+
+        cursor = dbapi.Cursor('created_at',
+                              timeutils.strtime(t + datetime.timedelta(
+                                                        minutes=1)), 1)
+        res = self.dbapi.get_node_list(None, cursor, sort_key='created_at')
+        self.assertEqual([2, 4], [r.id for r in res])
+
+        self.assertRaises(exception.InvalidParameterValue,
+                          self.dbapi.get_node_list, None, cursor,
+                          sort_key='uuid')
+
     def test_get_node_by_instance(self):
         n = self._create_test_node(
                 instance_uuid='12345678-9999-0000-aaaa-123456789012')
@@ -205,6 +596,57 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.update_node(n['id'], {'extra': new_extra})
         self.assertEqual(new_extra, res['extra'])
 
+    def test_update_node_expected(self):
+        n = self._create_test_node(target_power_state=None)
+
+        res = self.dbapi.update_node(n['uuid'],
+                                     {'target_power_state': states.POWER_ON},
+                                     expected={'target_power_state': None})
+        self.assertEqual(states.POWER_ON, res['target_power_state'])
+
+        self.assertRaises(exception.NodeUpdateConflict,
+                          self.dbapi.update_node, n['uuid'],
+                          {'target_power_state': states.POWER_OFF},
+                          expected={'target_power_state': None})
+        res = self.dbapi.get_node(n['id'])
+        self.assertEqual(states.POWER_ON, res['target_power_state'])
+
+    def test_update_node_expected_json(self):
+        n = self._create_test_node(extra={'a': 1, 'b': 2})
+
+        # a JSON field matches whatever the order of its keys
+        res = self.dbapi.update_node(n['id'], {'extra': {'a': 3}},
+                                     expected={'extra': {'b': 2, 'a': 1}})
+        self.assertEqual({'a': 3}, res['extra'])
+
+        self.assertRaises(exception.NodeUpdateConflict,
+                          self.dbapi.update_node, n['id'],
+                          {'extra': {'a': 4}},
+                          expected={'extra': {'b': 2, 'a': 1}})
+        res = self.dbapi.get_node(n['id'])
+        self.assertEqual({'a': 3}, res['extra'])
+
+    def test_update_node_expected_not_found(self):
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.update_node, 99, {'extra': {}},
+                          expected={'target_power_state': None})
+
+    def test_update_node_not_found(self):
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.update_node,
+                          '12345678-9999-0000-aaaa-123456789012',
+                          {'extra': {}})
+
+    def test_update_node_deleted_concurrently(self):
+        n = self._create_test_node()
+
+        # the UPDATE misses the row as if the node had just been deleted
+        with mock.patch.object(sqlalchemy_api, 'add_identity_clause',
+                               lambda table, value: table.c.id == -1):
+            self.assertRaises(exception.NodeNotFound,
+                              self.dbapi.update_node, n['uuid'],
+                              {'extra': {'foo': 'bar'}})
+
     def test_reserve_one_node(self):
         n = self._create_test_node()
         uuid = n['uuid']
@@ -336,6 +778,27 @@ class DbNodeTestCase(base.DbTestCase):
             res = self.dbapi.get_node(uuid)
             self.assertEqual(None, res['reservation'])
 
+    def test_clear_stale_power_targets(self):
+        uuids = self._create_many_test_nodes()
+        t = timeutils.utcnow()
+        timeutils.set_time_override(t)
+        self.addCleanup(timeutils.clear_time_override)
+        for uuid in uuids[:3]:
+            self.dbapi.update_node(uuid,
+                                   {'target_power_state': states.POWER_ON})
+        self.dbapi.reserve_nodes('fake-reservation', [uuids[1]])
+        timeutils.set_time_override(t + datetime.timedelta(seconds=5))
+        self.assertEqual(0, self.dbapi.clear_stale_power_targets(10))
+
+        timeutils.set_time_override(t + datetime.timedelta(seconds=30))
+        self.dbapi.update_node(uuids[2], {'target_power_state': states.REBOOT})
+        timeutils.set_time_override(t + datetime.timedelta(seconds=35))
+        # node 0 is stale, node 1 is reserved and node 2 was just updated
+        self.assertEqual(1, self.dbapi.clear_stale_power_targets(10))
+        self.assertEqual([None, states.POWER_ON, states.REBOOT],
+                         [self.dbapi.get_node(uuid).target_power_state
+                          for uuid in uuids[:3]])
+
     def test_get_associated_nodes(self):
         (uuids, uuids_with_instance) = self._create_associated_nodes()
 
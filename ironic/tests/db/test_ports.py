@@ -17,11 +17,14 @@
 
 """Tests for manipulating Ports via the DB API"""
 
+import mock
 import six
 
 from ironic.common import exception
 from ironic.common import utils as ironic_utils
 from ironic.db import api as dbapi
+from ironic.db.sqlalchemy import api as sqlalchemy_api
+from ironic.openstack.common.db import exception as db_exc
 
 from ironic.tests.db import base
 from ironic.tests.db import utils
@@ -58,6 +61,96 @@ class DbPortTestCase(base.DbTestCase):
         res_uuids = [r.uuid for r in res]
         self.assertEqual(uuids.sort(), res_uuids.sort())
 
+    def test_get_ports_columns(self):
+        self.dbapi.create_port(self.p)
+        other = self.dbapi.create_node(utils.get_test_node(
+                                            id=2,
+                                            uuid=ironic_utils.generate_uuid()))
+        self.dbapi.create_port(utils.get_test_port(
+                                            id=2,
+                                            uuid=ironic_utils.generate_uuid(),
+                                            node_id=other['id'],
+                                            address='52:54:00:cf:2d:01'))
+        res = self.dbapi.get_ports(['uuid', 'address'])
+        self.assertEqual([2, 987], sorted(p.id for p in res))
+        self.assertEqual(['address', 'id', 'uuid'], sorted(res[0].as_dict()))
+        res = self.dbapi.get_ports(['uuid'], {'node_id': self.n['uuid']})
+        self.assertEqual([self.p['uuid']], [p.uuid for p in res])
+
+    def test_get_ports_unknown_column(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          self.dbapi.get_ports, ['uuid', 'foo'])
+
+    def test_create_ports(self):
+        values = [utils.get_test_port(uuid=ironic_utils.generate_uuid(),
+                                      node_id=self.n['uuid'],
+                                      address='52:54:00:cf:2d:%02x' % i)
+                  for i in range(3)]
+
+        res = self.dbapi.create_ports(values)
+
+        self.assertEqual([v['uuid'] for v in values], [p.uuid for p in res])
+        self.assertEqual([self.n['id']] * 3, [p.node_id for p in res])
+        self.assertEqual(values[1]['address'],
+                         self.dbapi.get_port(res[1].id).address)
+
+    def test_create_ports_errors(self):
+        self.dbapi.create_port(self.p)
+        values = [utils.get_test_port(uuid=self.p['uuid'],
+                                      address='52:54:00:cf:2d:01'),
+                  utils.get_test_port(uuid=ironic_utils.generate_uuid()),
+                  utils.get_test_port(uuid=ironic_utils.generate_uuid(),
+                                      node_id=ironic_utils.generate_uuid(),
+                                      address='52:54:00:cf:2d:02'),
+                  utils.get_test_port(uuid=ironic_utils.generate_uuid(),
+                                      address='52:54:00:cf:2d:03'),
+                  utils.get_test_port(uuid=ironic_utils.generate_uuid(),
+                                      address='52:54:00:cf:2d:03')]
+
+        res = self.dbapi.create_ports(values)
+
+        self.assertIsInstance(res[0], exception.PortAlreadyExists)
+        self.assertIsInstance(res[1], exception.MACAlreadyExists)
+        self.assertIsInstance(res[2], exception.NodeNotFound)
+        self.assertEqual(values[3]['uuid'], res[3].uuid)
+        self.assertIsInstance(res[4], exception.MACAlreadyExists)
+        self.assertEqual(2, len(self.dbapi.get_port_list()))
+
+    def test_create_ports_concurrent_duplicate(self):
+        self.dbapi.create_port(self.p)
+        values = [utils.get_test_port(id=1, address='52:54:00:cf:2d:01',
+                                      uuid=ironic_utils.generate_uuid()),
+                  utils.get_test_port(id=2, address='52:54:00:cf:2d:02',
+                                      uuid=self.p['uuid']),
+                  utils.get_test_port(id=3,
+                                      uuid=ironic_utils.generate_uuid())]
+        create_port = self.dbapi.create_port
+
+        def fake_create_port(values):
+            if values['uuid'] == self.p['uuid']:
+                raise db_exc.DBDuplicateEntry(['uuid'])
+            if values['address'] == self.p['address']:
+                raise db_exc.DBDuplicateEntry(['iface_address_ux'])
+            return create_port(values)
+
+        # the port is created by another request once the uuids and
+        # addresses were checked
+        with mock.patch.object(sqlalchemy_api, '_existing_values') as \
+                existing_mock:
+            existing_mock.return_value = set()
+            with mock.patch.object(sqlalchemy_api, '_bulk_insert') as \
+                    insert_mock:
+                insert_mock.side_effect = db_exc.DBDuplicateEntry(['uuid'])
+                with mock.patch.object(sqlalchemy_api.Connection,
+                                       'create_port') as create_mock:
+                    create_mock.side_effect = fake_create_port
+                    res = self.dbapi.create_ports(values)
+
+        self.assertEqual(values[0]['uuid'], res[0].uuid)
+        self.assertIsInstance(res[1], exception.PortAlreadyExists)
+        self.assertIsInstance(res[2], exception.MACAlreadyExists)
+        self.assertEqual(2, len(self.dbapi.get_port_list()))
+
     def test_get_port_by_address(self):
         self.dbapi.create_port(self.p)
 
@@ -108,6 +201,20 @@ class DbPortTestCase(base.DbTestCase):
         res = self.dbapi.update_port(self.p['id'], {'address': new_address})
         self.assertEqual(new_address, res['address'])
 
+    def test_update_port_expected(self):
+        self.dbapi.create_port(self.p)
+
+        res = self.dbapi.update_port(self.p['id'], {'extra': {'foo': 'bar'}},
+                                     expected={'extra': {}})
+        self.assertEqual({'foo': 'bar'}, res['extra'])
+
+        self.assertRaises(exception.PortUpdateConflict,
+                          self.dbapi.update_port, self.p['id'],
+                          {'extra': {'foo': 'baz'}},
+                          expected={'extra': {}})
+        res = self.dbapi.get_port(self.p['id'])
+        self.assertEqual({'foo': 'bar'}, res['extra'])
+
     def test_destroy_port_on_reserved_node(self):
         p = self.dbapi.create_port(utils.get_test_port(node_id=self.n['id']))
         uuid = self.n['uuid']
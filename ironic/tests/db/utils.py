@@ -122,3 +122,16 @@ def get_test_conductor(**kw):
             }
 
     return conductor
+
+
+def get_test_master_image(**kw):
+    image = {
+            'hostname': kw.get('hostname', 'test-conductor-node'),
+            'checksum': kw.get('checksum', 'c46b4d1a5ab11ae7b3af5eb0e5df94f6'),
+            'content_checksum': kw.get('content_checksum',
+                                   'e5ca8e1a3b2ab0b0c3d26e38d1d2d4b1f4c2b7c1'),
+            'url': kw.get('url', 'http://192.0.2.1:8080/'
+                                 'md5-c46b4d1a5ab11ae7b3af5eb0e5df94f6'),
+            }
+
+    return image
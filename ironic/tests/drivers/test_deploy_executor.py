@@ -0,0 +1,75 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# coding=utf-8
+
+# Copyright 2013 Hewlett-Packard Development Company, L.P.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the deploy executor."""
+
+import eventlet
+from eventlet import event
+import fixtures
+
+from ironic.drivers.modules import deploy_executor
+from ironic.tests import base
+
+
+class DeployExecutorTestCase(base.TestCase):
+
+    def test_result(self):
+        executor = deploy_executor.DeployExecutor(2)
+        job = executor.submit(lambda a, b=0: a + b, 1, b=2)
+        self.assertEqual(3, job.wait())
+
+    def test_exception(self):
+        def fail():
+            raise ValueError('boom')
+
+        executor = deploy_executor.DeployExecutor(2)
+        job = executor.submit(fail)
+        self.assertRaises(ValueError, job.wait)
+        # the worker survives a failed job
+        self.assertEqual('ok', executor.submit(lambda: 'ok').wait())
+
+    def test_bounded_fifo(self):
+        executor = deploy_executor.DeployExecutor(2)
+        release = event.Event()
+        started = []
+
+        def work(n):
+            started.append(n)
+            release.wait()
+            return n
+
+        jobs = [executor.submit(work, n) for n in range(5)]
+        eventlet.sleep(0)
+
+        self.assertEqual([0, 1], started)
+        self.assertEqual(2, executor.running)
+        self.assertEqual(3, executor.queue_depth)
+
+        release.send()
+        self.assertEqual(range(5), [job.wait() for job in jobs])
+        self.assertEqual(range(5), started)
+        self.assertEqual(0, executor.running)
+        self.assertEqual(0, executor.queue_depth)
+
+    def test_get_executor(self):
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.deploy_executor._EXECUTOR', None))
+        self.config(workers=3, group='deploy')
+        executor = deploy_executor.get_executor()
+        self.assertEqual(3, executor.workers)
+        self.assertIs(executor, deploy_executor.get_executor())
@@ -16,11 +16,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
 import fixtures
 import mock
 import os
+import socket
 import tempfile
 
+from ironic.common import exception
 from ironic.drivers.modules import deploy_utils as utils
 from ironic.tests import base as tests_base
 
@@ -51,6 +54,36 @@ kernel kernel
 append initrd=ramdisk root=UUID=12345678-1234-1234-1234-1234567890abcdef
 """
 
+_IPXECONF_DEPLOY = """#!ipxe
+
+goto deploy
+
+:deploy
+kernel deploy_kernel
+initrd deploy_ramdisk
+boot
+
+:boot
+kernel kernel root={{ ROOT }}
+initrd ramdisk
+boot
+"""
+
+_IPXECONF_BOOT = """#!ipxe
+
+goto boot
+
+:deploy
+kernel deploy_kernel
+initrd deploy_ramdisk
+boot
+
+:boot
+kernel kernel root=UUID=12345678-1234-1234-1234-1234567890abcdef
+initrd ramdisk
+boot
+"""
+
 
 class PhysicalWorkTestCase(tests_base.TestCase):
     def setUp(self):
@@ -78,9 +111,9 @@ class PhysicalWorkTestCase(tests_base.TestCase):
         root_uuid = '12345678-1234-1234-12345678-12345678abcdef'
 
         name_list = ['get_dev', 'get_image_mb', 'discovery', 'login_iscsi',
-                     'logout_iscsi', 'make_partitions', 'is_block_device',
-                     'dd', 'mkswap', 'block_uuid', 'switch_pxe_config',
-                     'notify']
+                     'logout_iscsi', 'make_partitions', 'wait_for_path',
+                     'is_block_device', 'write_image', 'mkswap',
+                     'block_uuid', 'switch_pxe_config', 'notify']
         patch_list = [mock.patch.object(utils, name) for name in name_list]
         mock_list = [patcher.start() for patcher in patch_list]
 
@@ -90,17 +123,21 @@ class PhysicalWorkTestCase(tests_base.TestCase):
 
         parent_mock.get_dev.return_value = dev
         parent_mock.get_image_mb.return_value = 1
+        parent_mock.wait_for_path.return_value = True
         parent_mock.is_block_device.return_value = True
         parent_mock.block_uuid.return_value = root_uuid
         calls_expected = [mock.call.get_dev(address, port, iqn, lun),
                           mock.call.get_image_mb(image_path),
                           mock.call.discovery(address, port),
                           mock.call.login_iscsi(address, port, iqn),
+                          mock.call.wait_for_path(dev),
                           mock.call.is_block_device(dev),
                           mock.call.make_partitions(dev, root_mb, swap_mb),
+                          mock.call.wait_for_path(root_part),
                           mock.call.is_block_device(root_part),
+                          mock.call.wait_for_path(swap_part),
                           mock.call.is_block_device(swap_part),
-                          mock.call.dd(image_path, root_part),
+                          mock.call.write_image(image_path, root_part),
                           mock.call.mkswap(swap_part),
                           mock.call.block_uuid(root_part),
                           mock.call.logout_iscsi(address, port, iqn),
@@ -163,6 +200,86 @@ class PhysicalWorkTestCase(tests_base.TestCase):
             patcher.stop()
 
 
+class ReadinessTestCase(tests_base.TestCase):
+
+    def setUp(self):
+        super(ReadinessTestCase, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.deploy_utils.POLL_INTERVAL', 0))
+
+    def test_wait_for_ready(self):
+        results = [False, False, True]
+        self.assertTrue(utils.wait_for(lambda: results.pop(0)))
+        self.assertEqual([], results)
+
+    def test_wait_for_timeout(self):
+        condition = mock.Mock(return_value=False)
+        self.assertFalse(utils.wait_for(condition, timeout=0))
+        condition.assert_called_once_with()
+
+    @mock.patch.object(os.path, 'exists')
+    def test_wait_for_path(self, exists_mock):
+        exists_mock.side_effect = [False, True]
+        self.assertTrue(utils.wait_for_path('/dev/fake'))
+        self.assertEqual(2, exists_mock.call_count)
+
+    @mock.patch.object(os.path, 'exists')
+    def test_wait_for_path_timeout(self, exists_mock):
+        self.config(ready_timeout=0, group='deploy')
+        exists_mock.return_value = False
+        self.assertFalse(utils.wait_for_path('/dev/fake'))
+
+    @mock.patch.object(utils.utils, 'execute')
+    def test_login_iscsi_settles_udev(self, execute_mock):
+        utils.login_iscsi('1.2.3.4', 3260, 'iqn.fake')
+        execute_mock.assert_called_with('udevadm', 'settle',
+                                        '--timeout=60',
+                                        check_exit_code=[0])
+
+    @mock.patch.object(utils.utils, 'execute')
+    def test_udev_settle_failure_not_fatal(self, execute_mock):
+        execute_mock.side_effect = exception.ProcessExecutionError()
+        utils.udev_settle()
+        self.assertEqual(1, execute_mock.call_count)
+
+    @mock.patch.object(utils, '_try_notify')
+    def test_notify_retries_until_listening(self, try_mock):
+        try_mock.side_effect = [False, False, True]
+        utils.notify('1.2.3.4', 10000)
+        self.assertEqual(3, try_mock.call_count)
+        for call in try_mock.call_args_list:
+            self.assertTrue(0 < call[0][2] <= 60)
+
+    @mock.patch.object(utils, '_try_notify')
+    def test_notify_timeout(self, try_mock):
+        self.config(ready_timeout=0, group='deploy')
+        try_mock.return_value = False
+        self.assertRaises(exception.InstanceDeployFailure,
+                          utils.notify, '1.2.3.4', 10000)
+
+    @mock.patch('socket.socket')
+    def test__try_notify_refused(self, socket_mock):
+        sock = socket_mock.return_value
+        sock.connect.side_effect = socket.error(errno.ECONNREFUSED, 'no')
+        self.assertFalse(utils._try_notify('1.2.3.4', 10000))
+        sock.close.assert_called_once_with()
+
+    @mock.patch('socket.socket')
+    def test__try_notify_timeout(self, socket_mock):
+        sock = socket_mock.return_value
+        sock.connect.side_effect = socket.timeout()
+        self.assertFalse(utils._try_notify('1.2.3.4', 10000, 5))
+        sock.settimeout.assert_called_once_with(5)
+        sock.close.assert_called_once_with()
+
+    @mock.patch('socket.socket')
+    def test__try_notify(self, socket_mock):
+        sock = socket_mock.return_value
+        self.assertTrue(utils._try_notify('1.2.3.4', 10000))
+        sock.connect.assert_called_once_with(('1.2.3.4', 10000))
+        sock.send.assert_called_once_with('done')
+
+
 class SwitchPxeConfigTestCase(tests_base.TestCase):
     def setUp(self):
         super(SwitchPxeConfigTestCase, self).setUp()
@@ -182,6 +299,15 @@ class SwitchPxeConfigTestCase(tests_base.TestCase):
             pxeconf = f.read()
         self.assertEqual(pxeconf, _PXECONF_BOOT)
 
+    def test_switch_ipxe_config(self):
+        with open(self.fname, 'w') as f:
+            f.write(_IPXECONF_DEPLOY)
+        utils.switch_pxe_config(self.fname,
+                               '12345678-1234-1234-1234-1234567890abcdef')
+        with open(self.fname, 'r') as f:
+            ipxeconf = f.read()
+        self.assertEqual(ipxeconf, _IPXECONF_BOOT)
+
 
 class OtherFunctionTestCase(tests_base.TestCase):
     def test_get_dev(self):
@@ -205,3 +331,268 @@ class OtherFunctionTestCase(tests_base.TestCase):
         self.assertEqual(utils.get_image_mb('x'), 1)
         size = mb + 1
         self.assertEqual(utils.get_image_mb('x'), 2)
+
+    @mock.patch.object(os.path, 'realpath')
+    def test__queue_limit_of_partition(self, realpath_mock):
+        realpath_mock.side_effect = {
+            '/dev/fake-part1': '/dev/sdb1',
+            '/sys/class/block/sdb1': '/sys/devices/fake/block/sdb/sdb1'}.get
+        queue = '/sys/devices/fake/block/sdb/queue/discard_zeroes_data'
+
+        def fake_open(path):
+            if path != queue:
+                raise IOError(errno.ENOENT, 'no')
+            return mock.mock_open(read_data='1\n')()
+
+        with mock.patch('__builtin__.open', fake_open):
+            self.assertEqual(1, utils._queue_limit('/dev/fake-part1',
+                                                   'discard_zeroes_data'))
+            self.assertIsNone(utils._queue_limit('/dev/fake-part1',
+                                                 'write_same_max_bytes'))
+
+
+class ImageExtentsTestCase(tests_base.TestCase):
+    MB = utils.BLOCK_SIZE
+
+    def test_align_extents(self):
+        extents = [(self.MB + 10, 20), (100 * self.MB, self.MB + 1)]
+        self.assertEqual([(self.MB, self.MB), (100 * self.MB, 2 * self.MB)],
+                         utils._align_extents(extents, 200 * self.MB))
+
+    def test_align_extents_merges_small_holes(self):
+        extents = [(0, self.MB), (4 * self.MB, self.MB),
+                   (40 * self.MB, self.MB)]
+        self.assertEqual([(0, 5 * self.MB), (40 * self.MB, self.MB)],
+                         utils._align_extents(extents, 100 * self.MB))
+
+    def test_align_extents_clips_to_image(self):
+        extents = [(0, 10)]
+        self.assertEqual([(0, self.MB)], utils._align_extents(extents, 10))
+
+    def test_seek_data_extents(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        size = 3 * self.MB
+
+        def fake_lseek(fd, offset, whence):
+            data = [(0, 100), (2 * self.MB, self.MB)]
+            for start, length in data:
+                if whence == utils.SEEK_DATA and offset < start + length:
+                    return max(offset, start)
+                if whence == utils.SEEK_HOLE and offset < start + length:
+                    return start + length
+            raise OSError(errno.ENXIO, 'no more data')
+
+        with mock.patch.object(os, 'fstat') as fstat_mock:
+            fstat_mock.return_value.st_size = size
+            with mock.patch.object(os, 'lseek', side_effect=fake_lseek):
+                self.assertEqual([(0, 100), (2 * self.MB, self.MB)],
+                                 utils._seek_data_extents(path))
+
+    @mock.patch.object(os.path, 'getsize')
+    @mock.patch.object(utils, '_seek_data_extents')
+    @mock.patch.object(utils.utils, 'execute')
+    def test_get_image_extents_qemu_img_fallback(self, execute_mock,
+                                                 seek_mock, getsize_mock):
+        getsize_mock.return_value = 64 * self.MB
+        seek_mock.side_effect = OSError(errno.EINVAL, 'unsupported')
+        execute_mock.return_value = (
+            '[{"start": 0, "length": 1048576, "data": true},'
+            ' {"start": 1048576, "length": 33554432, "data": false},'
+            ' {"start": 34603008, "length": 1048576, "data": true}]', '')
+        self.assertEqual([(0, self.MB), (33 * self.MB, self.MB)],
+                         utils.get_image_extents('/fake/image'))
+        execute_mock.assert_called_once_with('qemu-img', 'map',
+                                             '--output=json', '-f', 'raw',
+                                             '/fake/image')
+
+    @mock.patch.object(os.path, 'getsize')
+    @mock.patch.object(utils, '_qemu_img_map_extents')
+    @mock.patch.object(utils, '_seek_data_extents')
+    def test_get_image_extents_whole_image(self, seek_mock, map_mock,
+                                           getsize_mock):
+        getsize_mock.return_value = 2 * self.MB
+        seek_mock.side_effect = OSError(errno.EINVAL, 'unsupported')
+        map_mock.side_effect = exception.ProcessExecutionError()
+        self.assertEqual([(0, 2 * self.MB)],
+                         utils.get_image_extents('/fake/image'))
+
+
+@mock.patch.object(os.path, 'getsize')
+@mock.patch.object(utils, 'get_image_extents')
+@mock.patch.object(utils.utils, 'execute')
+class WriteImageTestCase(tests_base.TestCase):
+    MB = utils.BLOCK_SIZE
+
+    def test_write_image_sparse(self, execute_mock, extents_mock,
+                                getsize_mock):
+        self.config(image_hole_policy='zeroout', group='deploy')
+        getsize_mock.return_value = 100 * self.MB - 10
+        extents_mock.return_value = [(0, self.MB), (50 * self.MB, self.MB)]
+
+        written = utils.write_image('/fake/image', '/dev/fake')
+
+        self.assertEqual(2 * self.MB, written)
+        calls = [mock.call('dd', 'if=/fake/image', 'of=/dev/fake',
+                           'bs=%d' % self.MB, 'skip=0', 'seek=0', 'count=1',
+                           'oflag=direct', 'conv=notrunc',
+                           run_as_root=True, check_exit_code=[0]),
+                 mock.call('dd', 'if=/fake/image', 'of=/dev/fake',
+                           'bs=%d' % self.MB, 'skip=50', 'seek=50',
+                           'count=1', 'oflag=direct', 'conv=notrunc',
+                           run_as_root=True, check_exit_code=[0]),
+                 mock.call('blkdiscard', '-z', '-o', self.MB,
+                           '-l', 49 * self.MB, '/dev/fake',
+                           run_as_root=True, check_exit_code=[0]),
+                 mock.call('blkdiscard', '-z', '-o', 51 * self.MB,
+                           '-l', 49 * self.MB, '/dev/fake',
+                           run_as_root=True, check_exit_code=[0])]
+        self.assertEqual(calls, execute_mock.call_args_list)
+
+    def test_write_image_discard(self, execute_mock, extents_mock,
+                                 getsize_mock):
+        self.config(image_hole_policy='discard', group='deploy')
+        getsize_mock.return_value = 50 * self.MB
+        extents_mock.return_value = [(20 * self.MB, self.MB)]
+
+        utils.write_image('/fake/image', '/dev/fake')
+
+        self.assertEqual(mock.call('blkdiscard', '-o', 0,
+                                   '-l', 20 * self.MB, '/dev/fake',
+                                   run_as_root=True, check_exit_code=[0]),
+                         execute_mock.call_args_list[1])
+        self.assertEqual(3, execute_mock.call_count)
+
+    def test_write_image_no_hole_policy(self, execute_mock, extents_mock,
+                                        getsize_mock):
+        self.config(image_hole_policy='none', group='deploy')
+        getsize_mock.return_value = 50 * self.MB
+        extents_mock.return_value = [(20 * self.MB, self.MB)]
+
+        self.assertEqual(self.MB,
+                         utils.write_image('/fake/image', '/dev/fake'))
+        self.assertEqual(1, execute_mock.call_count)
+
+    def test_write_image_zeroout_fallback(self, execute_mock, extents_mock,
+                                          getsize_mock):
+        self.config(image_hole_policy='zeroout', group='deploy')
+        getsize_mock.return_value = 20 * self.MB
+        extents_mock.return_value = [(0, self.MB)]
+
+        def fake_execute(*args, **kwargs):
+            if args[0] == 'blkdiscard':
+                raise exception.ProcessExecutionError()
+            return ('', '')
+
+        execute_mock.side_effect = fake_execute
+
+        utils.write_image('/fake/image', '/dev/fake')
+
+        self.assertEqual(mock.call('dd', 'if=/dev/zero', 'of=/dev/fake',
+                                   'bs=%d' % self.MB, 'skip=1', 'seek=1',
+                                   'count=19', 'oflag=direct',
+                                   'conv=notrunc', run_as_root=True,
+                                   check_exit_code=[0]),
+                         execute_mock.call_args_list[-1])
+
+    @mock.patch.object(utils, '_queue_limit')
+    def test_write_image_auto_discard(self, limit_mock, execute_mock,
+                                      extents_mock, getsize_mock):
+        limit_mock.side_effect = lambda dev, name: {
+            'discard_zeroes_data': 1}.get(name)
+        getsize_mock.return_value = 20 * self.MB
+        extents_mock.return_value = [(0, self.MB)]
+
+        utils.write_image('/fake/image', '/dev/fake')
+
+        self.assertEqual(mock.call('blkdiscard', '-o', self.MB,
+                                   '-l', 19 * self.MB, '/dev/fake',
+                                   run_as_root=True, check_exit_code=[0]),
+                         execute_mock.call_args_list[-1])
+
+    @mock.patch.object(utils, '_queue_limit')
+    def test_write_image_auto_zeroout(self, limit_mock, execute_mock,
+                                      extents_mock, getsize_mock):
+        limit_mock.return_value = None
+        getsize_mock.return_value = 50 * self.MB
+        extents_mock.return_value = [(20 * self.MB, self.MB)]
+
+        def fake_execute(*args, **kwargs):
+            if args[0] == 'blkdiscard':
+                raise exception.ProcessExecutionError()
+            return ('', '')
+
+        execute_mock.side_effect = fake_execute
+
+        utils.write_image('/fake/image', '/dev/fake')
+
+        # every hole is zeroed, writing zeros when the target can not
+        self.assertEqual(['dd', 'blkdiscard', 'dd', 'blkdiscard', 'dd'],
+                         [c[0][0] for c in execute_mock.call_args_list])
+        self.assertEqual('-z', execute_mock.call_args_list[1][0][1])
+        self.assertEqual('if=/dev/zero',
+                         execute_mock.call_args_list[-1][0][1])
+
+    def test_write_image_zeroout_fails(self, execute_mock, extents_mock,
+                                       getsize_mock):
+        self.config(image_hole_policy='zeroout', group='deploy')
+        getsize_mock.return_value = 50 * self.MB
+        extents_mock.return_value = [(20 * self.MB, self.MB)]
+
+        def fake_execute(*args, **kwargs):
+            if args[0] == 'blkdiscard' or 'if=/dev/zero' in args:
+                raise exception.ProcessExecutionError()
+            return ('', '')
+
+        execute_mock.side_effect = fake_execute
+
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.write_image, '/fake/image', '/dev/fake')
+
+    def test_write_image_not_sparse(self, execute_mock, extents_mock,
+                                    getsize_mock):
+        self.config(sparse_image_write=False, group='deploy')
+        getsize_mock.return_value = 20 * self.MB
+
+        self.assertEqual(20 * self.MB,
+                         utils.write_image('/fake/image', '/dev/fake'))
+        execute_mock.assert_called_once_with('dd', 'if=/fake/image',
+                                             'of=/dev/fake', 'bs=1M',
+                                             'oflag=direct',
+                                             run_as_root=True,
+                                             check_exit_code=[0])
+        self.assertFalse(extents_mock.called)
+
+    def test_write_image_ionice(self, execute_mock, extents_mock,
+                                getsize_mock):
+        self.config(sparse_image_write=False, ionice_class=3,
+                    ionice_level=7, group='deploy')
+        getsize_mock.return_value = 20 * self.MB
+
+        utils.write_image('/fake/image', '/dev/fake')
+
+        execute_mock.assert_called_once_with('ionice', '-c', '3', '-n', '7',
+                                             'dd', 'if=/fake/image',
+                                             'of=/dev/fake', 'bs=1M',
+                                             'oflag=direct',
+                                             run_as_root=True,
+                                             check_exit_code=[0])
+
+    def test_write_image_sparse_ionice(self, execute_mock, extents_mock,
+                                       getsize_mock):
+        self.config(image_hole_policy='none', ionice_class=2,
+                    group='deploy')
+        getsize_mock.return_value = 20 * self.MB
+        extents_mock.return_value = [(self.MB, self.MB)]
+
+        utils.write_image('/fake/image', '/dev/fake')
+
+        execute_mock.assert_called_once_with('ionice', '-c', '2', '-n', '4',
+                                             'dd', 'if=/fake/image',
+                                             'of=/dev/fake',
+                                             'bs=%d' % self.MB, 'skip=1',
+                                             'seek=1', 'count=1',
+                                             'oflag=direct', 'conv=notrunc',
+                                             run_as_root=True,
+                                             check_exit_code=[0])
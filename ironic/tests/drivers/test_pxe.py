@@ -18,12 +18,17 @@
 
 """Test class for PXE driver."""
 
+import BaseHTTPServer
+import eventlet
 import fixtures
+import hashlib
 import mock
 import os
+import SimpleHTTPServer
 import tempfile
 import threading
 import time
+import urllib2
 
 from oslo.config import cfg
 
@@ -32,6 +37,7 @@ from ironic.common import exception
 from ironic.common.glance_service import base_image_service
 from ironic.common.glance_service import service_utils
 from ironic.common import images
+from ironic.common import keystone
 from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import task_manager
@@ -131,6 +137,11 @@ class PXEValidateParametersTestCase(base.TestCase):
         self.assertEqual(pxe._get_pxe_mac_path(mac),
                          '/tftpboot/pxelinux.cfg/01-00-11-22-33-44-55-66')
 
+    def test__get_pxe_mac_path_http(self):
+        mac = '00:11:22:33:44:55:66'
+        self.assertEqual(pxe._get_pxe_mac_path(mac, 'http'),
+                         '/httpboot/pxelinux.cfg/00-11-22-33-44-55-66')
+
     def test__link_master_image(self):
         temp_dir = tempfile.mkdtemp()
         orig_path = os.path.join(temp_dir, 'orig_path')
@@ -196,8 +207,10 @@ class PXEValidateParametersTestCase(base.TestCase):
 
         handler = handler_deploying(lock_file)
         handler.start()
-        pxe._get_image(ctx, os.path.join(instance_path, 'instance_uuid'),
-                       uuid, master_path)
+        with mock.patch.object(pxe.service, 'Service') as service_mock:
+            service_mock.return_value.show.return_value = {}
+            pxe._get_image(ctx, os.path.join(instance_path, 'instance_uuid'),
+                           uuid, master_path)
         self.assertFalse(os.path.exists(lock_file))
         self.assertTrue(os.path.exists(os.path.join(instance_path,
                                                     'instance_uuid')))
@@ -279,6 +292,211 @@ class PXEPrivateMethodsTestCase(base.TestCase):
         db_key = db_node['driver_info'].get('pxe_deploy_key')
         self.assertEqual(db_key, fake_key)
 
+    def test__build_pxe_config_http(self):
+        root = '/httpboot/instance_uuid_123/'
+        CONF.set_default('pxe_append_params', 'test_param', group='pxe')
+        CONF.set_default('api_url', 'http://192.168.122.184:6385')
+        self.config(http_url='http://192.0.2.1:8080/', group='pxe')
+
+        template = 'ironic/tests/drivers/ipxe_config.template'
+        ipxe_config_template = open(template, 'r').read()
+
+        fake_key = '0123456789ABCDEFGHIJKLMNOPQRSTUV'
+        with mock.patch.object(utils, 'random_alnum') as random_alnum_mock:
+            random_alnum_mock.return_value = fake_key
+
+            image_info = {'deploy_kernel': ['deploy_kernel',
+                                            root + 'deploy_kernel'],
+                          'deploy_ramdisk': ['deploy_ramdisk',
+                                             root + 'deploy_ramdisk'],
+                          'kernel': ['kernel_id', root + 'kernel'],
+                          'ramdisk': ['ramdisk_id', root + 'ramdisk']}
+            ipxe_config = pxe._build_pxe_config(self.node, image_info,
+                                                'http')
+
+        self.assertEqual(ipxe_config_template, ipxe_config)
+
+    def test__get_boot_protocol(self):
+        self.config(http_url='http://192.0.2.1:8080', group='pxe')
+        self.assertEqual('tftp', pxe._get_boot_protocol(self.node))
+        self.assertEqual('http', pxe._get_boot_protocol(self.node, 'http'))
+
+        info = dict(INFO_DICT, pxe_boot_protocol='tftp')
+        node = self._create_test_node(id=2, uuid=utils.generate_uuid(),
+                                      driver_info=info)
+        self.assertEqual('tftp', pxe._get_boot_protocol(node, 'http'))
+
+        self.config(boot_protocol='http', group='pxe')
+        self.assertEqual('http', pxe._get_boot_protocol(self.node))
+
+    def test__get_boot_protocol_invalid(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          pxe._get_boot_protocol, self.node, 'nfs')
+        # http needs the url the files are served at
+        self.assertRaises(exception.InvalidParameterValue,
+                          pxe._get_boot_protocol, self.node, 'http')
+
+    def test__get_deploy_mode(self):
+        self.config(http_url='http://192.0.2.1:8080', group='pxe')
+        self.assertEqual('iscsi', pxe._get_deploy_mode(self.node))
+        self.assertEqual('pull', pxe._get_deploy_mode(self.node, 'pull'))
+
+        info = dict(INFO_DICT, pxe_deploy_mode='iscsi')
+        node = self._create_test_node(id=2, uuid=utils.generate_uuid(),
+                                      driver_info=info)
+        self.assertEqual('iscsi', pxe._get_deploy_mode(node, 'pull'))
+
+    def test__get_deploy_mode_invalid(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          pxe._get_deploy_mode, self.node, 'nbd')
+        # pull needs the url the image is served at
+        self.assertRaises(exception.InvalidParameterValue,
+                          pxe._get_deploy_mode, self.node, 'pull')
+
+    def _write_image(self, name, data):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def test__get_image_checksum_cached(self):
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.pxe._IMAGE_CHECKSUMS',
+                utils.LRUCache(64)))
+        self.temp_dir = tempfile.mkdtemp()
+        path = self._write_image('image', 'image data')
+        os.link(path, os.path.join(self.temp_dir, 'link'))
+
+        expected = ('sha1', hashlib.sha1('image data').hexdigest())
+        self.assertEqual(expected, pxe._get_image_checksum(path))
+        with mock.patch.object(pxe, '_hash_image') as hash_mock:
+            self.assertEqual(expected, pxe._get_image_checksum(
+                                        os.path.join(self.temp_dir, 'link')))
+            self.assertFalse(hash_mock.called)
+
+    def test__get_image_checksum_cache_size(self):
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.pxe._IMAGE_CHECKSUMS',
+                utils.LRUCache(2)))
+        self.temp_dir = tempfile.mkdtemp()
+        paths = [self._write_image('image%d' % i, 'image data %d' % i)
+                 for i in range(3)]
+        for path in paths:
+            pxe._get_image_checksum(path)
+        self.assertEqual(2, len(pxe._IMAGE_CHECKSUMS))
+        with mock.patch.object(pxe, '_hash_image') as hash_mock:
+            hash_mock.return_value = 'rehashed'
+            pxe._get_image_checksum(paths[2])
+            self.assertFalse(hash_mock.called)
+            # the least recently used checksum was forgotten
+            self.assertEqual(('sha1', 'rehashed'),
+                             pxe._get_image_checksum(paths[0]))
+
+    def test__get_image_checksum_prefers_md5(self):
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.pxe._IMAGE_CHECKSUMS',
+                utils.LRUCache(64)))
+        self.temp_dir = tempfile.mkdtemp()
+        path = self._write_image('image', 'image data')
+        pxe._remember_image_checksum(path, 'md5', 'fake-md5')
+        with mock.patch.object(pxe, '_hash_image') as hash_mock:
+            hash_mock.return_value = 'fake-sha1'
+            self.assertEqual(('md5', 'fake-md5'),
+                             pxe._get_image_checksum(path))
+            self.assertFalse(hash_mock.called)
+            self.assertEqual(('sha1', 'fake-sha1'),
+                             pxe._get_image_checksum(path, 'sha1'))
+            self.assertEqual(('md5', 'fake-md5'),
+                             pxe._get_image_checksum(path))
+
+    @mock.patch.object(eventlet, 'sleep')
+    def test__hash_image_yields(self, sleep_mock):
+        self.temp_dir = tempfile.mkdtemp()
+        data = 'x' * (3 * 1024 * 1024)
+        path = self._write_image('image', data)
+        self.assertEqual(hashlib.sha1(data).hexdigest(),
+                         pxe._hash_image(path))
+        self.assertEqual(3, sleep_mock.call_count)
+
+    def test__get_tftp_image_info_http(self):
+        properties = {'properties': {u'kernel_id': u'instance_kernel_uuid',
+                     u'ramdisk_id': u'instance_ramdisk_uuid'}}
+        with mock.patch.object(base_image_service.BaseImageService, '_show') \
+                as show_mock:
+            show_mock.return_value = properties
+            image_info = pxe._get_tftp_image_info(self.node, 'http')
+
+        self.assertEqual('/httpboot/instance_uuid_123/kernel',
+                         image_info['kernel'][1])
+        self.assertEqual('/httpboot/instance_uuid_123/deploy_ramdisk',
+                         image_info['deploy_ramdisk'][1])
+
+    def test__install_ipxe_boot_script(self):
+        temp_dir = tempfile.mkdtemp()
+        self.config(http_root=temp_dir, group='pxe')
+        pxe._install_ipxe_boot_script()
+        with open(os.path.join(temp_dir, 'boot.ipxe')) as f:
+            with open(CONF.pxe.ipxe_boot_script) as orig:
+                self.assertEqual(orig.read(), f.read())
+
+    def test__get_pxe_template_cached(self):
+        temp_dir = tempfile.mkdtemp()
+        template_path = os.path.join(temp_dir, 'pxe_config.template')
+        with open(template_path, 'w') as f:
+            f.write('{{ pxe_options.value }} one')
+        os.utime(template_path, (1, 1))
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.pxe._PXE_TEMPLATES', {}))
+
+        template = pxe._get_pxe_template(template_path)
+        self.assertIs(template, pxe._get_pxe_template(template_path))
+        self.assertEqual('x one', template.render(pxe_options={'value': 'x'}))
+
+        with open(template_path, 'w') as f:
+            f.write('{{ pxe_options.value }} two')
+        os.utime(template_path, (2, 2))
+        template = pxe._get_pxe_template(template_path)
+        self.assertEqual('x two', template.render(pxe_options={'value': 'x'}))
+
+    @mock.patch.object(eventlet, 'spawn_n')
+    @mock.patch.object(time, 'time')
+    @mock.patch.object(keystone, 'get_service_url')
+    def test__api_url_cache(self, get_url_mock, time_mock, spawn_mock):
+        CONF.set_default('api_url_ttl', 60, group='pxe')
+        cache = pxe._ApiUrlCache()
+        get_url_mock.return_value = 'http://old:6385'
+        time_mock.return_value = 1000
+
+        self.assertEqual('http://old:6385', cache.get())
+        time_mock.return_value = 1059
+        self.assertEqual('http://old:6385', cache.get())
+        self.assertEqual(1, get_url_mock.call_count)
+        self.assertFalse(spawn_mock.called)
+
+        # once expired, the old url is used until the refresh is done
+        get_url_mock.return_value = 'http://new:6385'
+        time_mock.return_value = 1060
+        self.assertEqual('http://old:6385', cache.get())
+        self.assertEqual('http://old:6385', cache.get())
+        spawn_mock.assert_called_once_with(cache._background_refresh)
+
+        cache._background_refresh()
+        self.assertEqual('http://new:6385', cache.get())
+        self.assertEqual(1120, cache.expires)
+        self.assertFalse(cache.refreshing)
+
+    @mock.patch.object(keystone, 'get_service_url')
+    def test__api_url_cache_refresh_failure(self, get_url_mock):
+        cache = pxe._ApiUrlCache()
+        get_url_mock.return_value = 'http://old:6385'
+        cache.get()
+        cache.refreshing = True
+
+        get_url_mock.side_effect = exception.CatalogFailure()
+        cache._background_refresh()
+        self.assertEqual('http://old:6385', cache.url)
+        self.assertFalse(cache.refreshing)
+
     def test__get_pxe_config_file_path(self):
         self.assertEqual('/tftpboot/instance_uuid_123/config',
                          pxe._get_pxe_config_file_path('instance_uuid_123'))
@@ -316,18 +534,28 @@ class PXEPrivateMethodsTestCase(base.TestCase):
 
         with mock.patch.object(images, 'fetch_to_raw') as fetch_to_raw_mock:
             with mock.patch.object(tempfile, 'mkstemp') as mkstemp_mock:
-                fetch_to_raw_mock.return_value = None
-                mkstemp_mock.return_value = (fd, tmp_master_image)
+                with mock.patch.object(pxe.service, 'Service') as service_mock:
+                    fetch_to_raw_mock.return_value = None
+                    mkstemp_mock.return_value = (fd, tmp_master_image)
+                    service_mock.return_value.show.return_value = {
+                            'checksum': 'fake-checksum'}
 
-                pxe._cache_tftp_images(None, self.node, image_info)
+                    pxe._cache_tftp_images(None, self.node, image_info)
 
-                fetch_to_raw_mock.assert_called_once_with(None,
-                                                          'deploy_kernel',
-                                                          tmp_master_image,
-                                                          None)
-                mkstemp_mock.assert_called_once_with(
+                    fetch_to_raw_mock.assert_called_once_with(None,
+                                                        'deploy_kernel',
+                                                        tmp_master_image,
+                                                        None, False)
+                    mkstemp_mock.assert_called_once_with(
                                                 dir=CONF.pxe.tftp_master_path)
 
+        master_image = os.path.join(CONF.pxe.tftp_master_path,
+                                    'md5-fake-checksum')
+        self.assertEqual(2, os.stat(master_image).st_nlink)
+        self.assertEqual(master_image,
+                         pxe._get_master_image_path(
+                                CONF.pxe.tftp_master_path, 'deploy_kernel'))
+
     def test__cache_tftp_images_no_master_path(self):
         temp_dir = tempfile.mkdtemp()
         CONF.set_default('tftp_root', temp_dir, group='pxe')
@@ -344,7 +572,7 @@ class PXEPrivateMethodsTestCase(base.TestCase):
             fetch_to_raw_mock.assert_called_once_with(None,
                     'deploy_kernel',
                     os.path.join(temp_dir, 'instance_uuid_123/deploy_kernel'),
-                    None)
+                    None, False)
 
     def test__cache_instance_images_no_master_path(self):
         temp_dir = tempfile.mkdtemp()
@@ -359,7 +587,7 @@ class PXEPrivateMethodsTestCase(base.TestCase):
             fetch_to_raw_mock.assert_called_once_with(None,
                             'glance://image_uuid',
                             os.path.join(temp_dir, 'fake_instance_name/disk'),
-                            None)
+                            None, True)
             self.assertEqual(uuid, 'glance://image_uuid')
             self.assertEqual(image_path,
                              os.path.join(temp_dir, 'fake_instance_name/disk'))
@@ -378,23 +606,27 @@ class PXEPrivateMethodsTestCase(base.TestCase):
             with mock.patch.object(tempfile, 'mkstemp') as mkstemp_mock:
                 with mock.patch.object(service_utils, 'parse_image_ref') \
                         as parse_image_ref_mock:
-                    mkstemp_mock.return_value = (fd, tmp_master_image)
-                    fetch_to_raw_mock.return_value = None
-                    parse_image_ref_mock.return_value = ('image_uuid',
-                                                         None,
-                                                         None,
-                                                         None)
-
-                    (uuid, image_path) = pxe._cache_instance_image(None,
-                                                                   self.node)
+                    with mock.patch.object(pxe.service, 'Service') \
+                            as service_mock:
+                        mkstemp_mock.return_value = (fd, tmp_master_image)
+                        fetch_to_raw_mock.return_value = None
+                        parse_image_ref_mock.return_value = ('image_uuid',
+                                                             None,
+                                                             None,
+                                                             None)
+                        service_mock.return_value.show.return_value = {
+                                'checksum': 'fake-checksum'}
+
+                        (uuid, image_path) = pxe._cache_instance_image(None,
+                                                                  self.node)
 
-                    mkstemp_mock.assert_called_once_with(
-                         dir=CONF.pxe.instance_master_path)
-                    fetch_to_raw_mock.assert_called_once_with(None,
+                        mkstemp_mock.assert_called_once_with(
+                             dir=CONF.pxe.instance_master_path)
+                        fetch_to_raw_mock.assert_called_once_with(None,
                                                        'glance://image_uuid',
                                                        tmp_master_image,
-                                                       None)
-                    parse_image_ref_mock.assert_called_once_with(
+                                                       None, True)
+                        parse_image_ref_mock.assert_called_with(
                                                        'glance://image_uuid')
                     self.assertEqual(uuid, 'glance://image_uuid')
                     self.assertEqual(
@@ -413,13 +645,92 @@ class PXEPrivateMethodsTestCase(base.TestCase):
 
         with mock.patch.object(pxe, '_download_in_progress') \
                 as download_in_progress_mock:
-            download_in_progress_mock.side_effect = _create_instance_path
+            with mock.patch.object(pxe.service, 'Service') as service_mock:
+                download_in_progress_mock.side_effect = _create_instance_path
+                service_mock.return_value.show.return_value = {}
 
-            pxe._get_image(None, instance_path, master_uuid, temp_dir)
+                pxe._get_image(None, instance_path, master_uuid, temp_dir)
 
             download_in_progress_mock.assert_called_once_with(lock_file)
             self.assertTrue(os.path.exists(instance_path))
 
+    def test__get_image_shared_by_checksum(self):
+        temp_dir = tempfile.mkdtemp()
+        master_dir = os.path.join(temp_dir, 'master')
+
+        def fake_fetch_to_raw(ctx, uuid, path, image_service, decompress):
+            open(path, 'w').close()
+
+        with mock.patch.object(images, 'fetch_to_raw') as fetch_to_raw_mock:
+            with mock.patch.object(pxe.service, 'Service') as service_mock:
+                fetch_to_raw_mock.side_effect = fake_fetch_to_raw
+                show_mock = service_mock.return_value.show
+                show_mock.return_value = {'checksum': 'fake-checksum'}
+
+                pxe._get_image(None, os.path.join(temp_dir, 'a'),
+                               'glance://image_a', master_dir)
+                pxe._get_image(None, os.path.join(temp_dir, 'b'),
+                               'glance://image_b', master_dir)
+                pxe._get_image(None, os.path.join(temp_dir, 'c'),
+                               'glance://image_a', master_dir)
+
+        self.assertEqual(1, fetch_to_raw_mock.call_count)
+        # image_a is found in the index the second time
+        self.assertEqual(2, show_mock.call_count)
+        master_image = os.path.join(master_dir, 'md5-fake-checksum')
+        self.assertEqual(4, os.stat(master_image).st_nlink)
+        for uuid in ('image_a', 'glance://image_b'):
+            self.assertEqual(master_image,
+                             pxe._get_master_image_path(master_dir, uuid))
+
+    def test__get_master_image_path_not_indexed(self):
+        self.assertEqual('/master/image_uuid',
+                         pxe._get_master_image_path('/master',
+                                                    'glance://image_uuid'))
+
+    def test_prefetch_image(self):
+        temp_dir = tempfile.mkdtemp()
+        CONF.set_default('instance_master_path', temp_dir, group='pxe')
+        master_image = os.path.join(temp_dir, 'image_uuid')
+
+        def fake_fetch_to_raw(ctx, uuid, path, image_service, decompress):
+            open(path, 'w').close()
+            return False
+
+        with mock.patch.object(pxe.service, 'Service') as service_mock:
+            service_mock.return_value.show.return_value = {}
+            with mock.patch.object(images, 'fetch_to_raw') as fetch_mock:
+                fetch_mock.side_effect = fake_fetch_to_raw
+                pxe._prefetch_image(None, 'glance://image_uuid', 'instance')
+                # fetched once
+                pxe._prefetch_image(None, 'glance://image_uuid', 'instance')
+            self.assertEqual(1, fetch_mock.call_count)
+            self.assertTrue(fetch_mock.call_args[0][4])
+
+            # the master image is kept while no deploy links to it
+            pxe._unlink_master_image(master_image)
+            self.assertEqual(2, os.stat(master_image).st_nlink)
+
+            # a deploy of the image takes the place of the prefetch
+            deploy_path = os.path.join(temp_dir, 'deploy')
+            pxe._get_image(None, deploy_path, 'glance://image_uuid',
+                           temp_dir)
+        self.assertEqual(2, os.stat(master_image).st_nlink)
+        self.assertEqual([], os.listdir(os.path.join(temp_dir,
+                                                     'prefetched')))
+        os.unlink(deploy_path)
+        pxe._unlink_master_image(master_image)
+        self.assertFalse(os.path.exists(master_image))
+
+    def test_prefetch_image_bad_kind(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          pxe._prefetch_image, None, 'image_uuid', 'swap')
+
+    def test_prefetch_image_no_master_path(self):
+        CONF.set_default('tftp_master_path', None, group='pxe')
+        self.assertRaises(exception.InvalidParameterValue,
+                          pxe._prefetch_image, None, 'image_uuid', 'tftp')
+
 
 class PXEDriverTestCase(db_base.DbTestCase):
 
@@ -435,12 +746,21 @@ class PXEDriverTestCase(db_base.DbTestCase):
                 instance_uuid='instance_uuid_123')
         self.dbapi = dbapi.get_instance()
         self.node = self.dbapi.create_node(n)
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.deploy_executor._EXECUTOR', None))
 
     def test_validate_good(self):
         with task_manager.acquire(self.context, [self.node['uuid']],
                                   shared=True) as task:
             task.resources[0].driver.deploy.validate(self.node)
 
+    def test_prefetch_image(self):
+        with mock.patch.object(pxe, '_prefetch_image') as prefetch_mock:
+            self.assertTrue(pxe.PXEDeploy().prefetch_image(
+                                        self.context, 'image', 'instance'))
+        prefetch_mock.assert_called_once_with(self.context, 'image',
+                                              'instance')
+
     def test_validate_fail(self):
         info = dict(INFO_DICT)
         del info['pxe_image_source']
@@ -510,10 +830,11 @@ class PXEDriverTestCase(db_base.DbTestCase):
                         state = task.resources[0].driver.deploy.deploy(task,
                                                                     self.node)
                         get_tftp_image_info_mock.assert_called_once_with(
-                                                                  self.node)
+                                                          self.node, 'tftp')
                         create_pxe_config_mock.assert_called_once_with(task,
                                                                     self.node,
-                                                                    None)
+                                                                    None,
+                                                                    'tftp')
                         cache_images_mock.assert_called_once_with(self.node,
                                                                   None)
                         self.assertEqual(state, states.DEPLOYING)
@@ -527,10 +848,17 @@ class PXEDriverTestCase(db_base.DbTestCase):
                 'ironic.drivers.modules.deploy_utils.deploy', fake_deploy))
         with task_manager.acquire(self.context, [self.node['uuid']],
                                   shared=True) as task:
-            task.resources[0].driver.vendor.vendor_passthru(task, self.node,
-                    method='pass_deploy_info', address='123456', iqn='aaa-bbb',
-                    key='fake-56789')
-        self.assertEqual(self.node['provision_state'], states.DEPLOYDONE)
+            job = task.resources[0].driver.vendor.vendor_passthru(task,
+                    self.node, method='pass_deploy_info', address='123456',
+                    iqn='aaa-bbb', key='fake-56789')
+        self.assertEqual(self.node['provision_state'], states.DEPLOYING)
+        # the node stays reserved while the deploy is queued
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(CONF.host, node['reservation'])
+        job.wait()
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(node['provision_state'], states.DEPLOYDONE)
+        self.assertIsNone(node['reservation'])
 
     def test_continue_deploy_fail(self):
 
@@ -541,11 +869,29 @@ class PXEDriverTestCase(db_base.DbTestCase):
                 'ironic.drivers.modules.deploy_utils.deploy', fake_deploy))
         with task_manager.acquire(self.context, [self.node['uuid']],
                                   shared=True) as task:
-            self.assertRaises(exception.InstanceDeployFailure,
-                            task.resources[0].driver.vendor.vendor_passthru,
-                            task, self.node, method='pass_deploy_info',
-                            address='123456', iqn='aaa-bbb', key='fake-56789')
-        self.assertEqual(self.node['provision_state'], states.DEPLOYFAIL)
+            job = task.resources[0].driver.vendor.vendor_passthru(task,
+                    self.node, method='pass_deploy_info', address='123456',
+                    iqn='aaa-bbb', key='fake-56789')
+        self.assertRaises(exception.InstanceDeployFailure, job.wait)
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(node['provision_state'], states.DEPLOYFAIL)
+        self.assertTrue(node['last_error'])
+        self.assertIsNone(node['reservation'])
+
+    def test_do_deploy_can_not_start(self):
+        self.dbapi.update_node(self.node['uuid'],
+                               {'provision_state': states.DEPLOYING})
+        with task_manager.acquire(self.context, [self.node['uuid']],
+                                  shared=True) as task:
+            vendor = task.driver.vendor
+        with mock.patch.object(task_manager, 'acquire') as acquire_mock:
+            acquire_mock.side_effect = exception.DriverNotFound(
+                                                    driver_name='fake_pxe')
+            self.assertRaises(exception.DriverNotFound, vendor._do_deploy,
+                              self.context, self.node['uuid'], {})
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(states.DEPLOYFAIL, node['provision_state'])
+        self.assertIn('fake_pxe', node['last_error'])
 
     def test_lock_elevated(self):
         with task_manager.acquire(self.context, [self.node['uuid']],
@@ -660,3 +1006,381 @@ class PXEDriverTestCase(db_base.DbTestCase):
 
         self.assertTrue(os.path.exists(master_d_kernel_path))
         self.assertTrue(os.path.exists(master_instance_path))
+
+
+class _HTTPRootHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Serve CONF.pxe.http_root, like the conductor's HTTP server."""
+
+    def translate_path(self, path):
+        return os.path.join(CONF.pxe.http_root, path.lstrip('/'))
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve_http_root(test):
+    """Serve CONF.pxe.http_root until test ends, return its url."""
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _HTTPRootHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    test.addCleanup(server.shutdown)
+    return 'http://127.0.0.1:%d' % server.server_port
+
+
+class FakeAgent(object):
+    """A deploy ramdisk in pull mode, talking to the vendor interface."""
+
+    def __init__(self, context, node_uuid, key, disk_path):
+        self.context = context
+        self.node_uuid = node_uuid
+        self.key = key
+        self.disk_path = disk_path
+
+    def _call(self, method, **kwargs):
+        # what ConductorManager.validate_vendor_action and do_vendor_action
+        # do for a vendor passthru call
+        kwargs.update(method=method, key=self.key)
+        with task_manager.acquire(self.context, [self.node_uuid],
+                                  shared=True) as task:
+            vendor = task.resources[0].driver.vendor
+            data = vendor.validate(task.node, **kwargs)
+        with task_manager.acquire(self.context, [self.node_uuid],
+                                  shared=True) as task:
+            vendor = task.resources[0].driver.vendor
+            vendor.vendor_passthru(task, task.node, **kwargs)
+        return data
+
+    def run(self):
+        info = self._call('pass_deploy_info')
+
+        checksum = hashlib.new(info['image_checksum_type'])
+        image = urllib2.urlopen(info['image_url'])
+        with open(self.disk_path, 'wb') as disk:
+            for chunk in iter(lambda: image.read(4096), ''):
+                checksum.update(chunk)
+                disk.write(chunk)
+
+        if checksum.hexdigest() != info['image_checksum']:
+            self._call('pass_deploy_result', error='Image checksum mismatch')
+        else:
+            self._call('pass_deploy_result', root_uuid='12345678-1234')
+
+
+class PXEPullDeployTestCase(db_base.DbTestCase):
+
+    def setUp(self):
+        super(PXEPullDeployTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        mgr_utils.get_mocked_node_manager(driver='fake_pxe')
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.pxe._IMAGE_CHECKSUMS',
+                utils.LRUCache(64)))
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.config(http_root=os.path.join(self.temp_dir, 'httpboot'),
+                    tftp_root=os.path.join(self.temp_dir, 'tftpboot'),
+                    images_path=os.path.join(self.temp_dir, 'images'),
+                    group='pxe')
+
+        self.config(http_url=_serve_http_root(self), group='pxe')
+
+        driver_info = dict(INFO_DICT, pxe_deploy_mode='pull',
+                           pxe_deploy_key='fake-56789')
+        n = db_utils.get_test_node(driver='fake_pxe',
+                                   driver_info=driver_info,
+                                   instance_uuid='instance_uuid_123')
+        self.dbapi = dbapi.get_instance()
+        self.node = self.dbapi.create_node(n)
+        self.pxe_config_path = os.path.join(self.temp_dir, 'tftpboot',
+                                            'instance_uuid_123', 'config')
+
+    def _fake_cache_images(self, node, pxe_info):
+        d_info = pxe._parse_driver_info(node)
+        fileutils.ensure_tree(pxe._get_image_dir_path(d_info))
+        with open(pxe._get_image_file_path(d_info), 'w') as f:
+            f.write('instance image ' * 1000)
+
+    def _fake_create_pxe_config(self, task, node, pxe_info, protocol):
+        fileutils.ensure_tree(os.path.dirname(self.pxe_config_path))
+        with open(self.pxe_config_path, 'w') as f:
+            f.write('default deploy\nappend root={{ ROOT }}\n')
+
+    def _deploy(self):
+        with mock.patch.object(pxe, '_get_tftp_image_info') as info_mock:
+            info_mock.return_value = {}
+            with mock.patch.object(pxe, '_cache_images',
+                                   self._fake_cache_images):
+                with mock.patch.object(pxe, '_create_pxe_config',
+                                       self._fake_create_pxe_config):
+                    with task_manager.acquire(self.context,
+                                              [self.node['uuid']],
+                                              shared=False) as task:
+                        task.resources[0].driver.deploy.deploy(task,
+                                                               task.node)
+
+    def test_pull_deploy(self):
+        self._deploy()
+        http_path = os.path.join(self.temp_dir, 'httpboot',
+                                 'instance_uuid_123', 'disk')
+        self.assertTrue(os.path.exists(http_path))
+
+        disk_path = os.path.join(self.temp_dir, 'node_disk')
+        FakeAgent(self.context, self.node['uuid'], 'fake-56789',
+                  disk_path).run()
+
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(states.DEPLOYDONE, node['provision_state'])
+        with open(disk_path) as disk:
+            with open(http_path) as image:
+                self.assertEqual(image.read(), disk.read())
+        with open(self.pxe_config_path) as f:
+            self.assertEqual('default boot\nappend root=UUID=12345678-1234\n',
+                             f.read())
+
+    def test_pull_deploy_checksum_mismatch(self):
+        self._deploy()
+        node = self.dbapi.get_node(self.node['uuid'])
+        driver_info = node['driver_info']
+        driver_info['pxe_image_checksum'] = 'bad'
+        self.dbapi.update_node(node['uuid'], {'driver_info': driver_info})
+
+        FakeAgent(self.context, self.node['uuid'], 'fake-56789',
+                  os.path.join(self.temp_dir, 'node_disk')).run()
+
+        node = self.dbapi.get_node(self.node['uuid'])
+        self.assertEqual(states.DEPLOYFAIL, node['provision_state'])
+        self.assertEqual('Image checksum mismatch', node['last_error'])
+
+    def test_pass_deploy_info_not_published(self):
+        with task_manager.acquire(self.context, [self.node['uuid']],
+                                  shared=True) as task:
+            self.assertRaises(exception.InvalidParameterValue,
+                              task.resources[0].driver.vendor.validate,
+                              task.node, method='pass_deploy_info',
+                              key='fake-56789')
+
+    def test_pass_deploy_result_needs_root_uuid(self):
+        with task_manager.acquire(self.context, [self.node['uuid']],
+                                  shared=True) as task:
+            self.assertRaises(exception.InvalidParameterValue,
+                              task.resources[0].driver.vendor.validate,
+                              task.node, method='pass_deploy_result',
+                              key='fake-56789')
+
+    def test_tear_down_removes_published_image(self):
+        self._deploy()
+        with mock.patch.object(pxe, '_get_tftp_image_info') as info_mock:
+            info_mock.return_value = {}
+            with mock.patch.object(pxe, '_destroy_images'):
+                with task_manager.acquire(self.context, [self.node['uuid']],
+                                          shared=False) as task:
+                    task.resources[0].driver.deploy.tear_down(task,
+                                                              task.node)
+        self.assertFalse(os.path.exists(os.path.join(
+                self.temp_dir, 'httpboot', 'instance_uuid_123')))
+
+
+class PXEMasterImagePeersTestCase(db_base.DbTestCase):
+
+    def setUp(self):
+        super(PXEMasterImagePeersTestCase, self).setUp()
+        self.dbapi = dbapi.get_instance()
+        self.temp_dir = tempfile.mkdtemp()
+        self.master_path = os.path.join(self.temp_dir, 'instance_master')
+        # the md5 checksum Glance gives the image
+        self.checksum = hashlib.md5('raw image').hexdigest()
+        self.master_image = os.path.join(self.master_path,
+                                         'md5-' + self.checksum)
+        self.config(host='local-host')
+        self.config(instance_master_path=self.master_path,
+                    http_root=os.path.join(self.temp_dir, 'peer'),
+                    share_master_images=True,
+                    master_images_url='http://local-host/master',
+                    group='pxe')
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.drivers.modules.pxe._IMAGE_CHECKSUMS',
+                utils.LRUCache(64)))
+        self.url = _serve_http_root(self)
+
+        # peers serve their master images from http_root
+        fileutils.ensure_tree(os.path.join(self.temp_dir, 'peer'))
+        with open(os.path.join(self.temp_dir, 'peer', 'image'), 'w') as f:
+            f.write('raw image')
+        with open(os.path.join(self.temp_dir, 'peer', 'other'), 'w') as f:
+            f.write('other image')
+        for i, host in enumerate(('local-host', 'peer1', 'peer2')):
+            self.dbapi.register_conductor(
+                    db_utils.get_test_conductor(id=i, hostname=host))
+
+    def _advertise(self, hostname, path='image', content='raw image'):
+        self.dbapi.register_master_image(db_utils.get_test_master_image(
+                hostname=hostname,
+                checksum=self.checksum,
+                content_checksum=hashlib.sha1(content).hexdigest(),
+                url='%s/%s' % (self.url, path)))
+
+    def _fetch(self):
+        fileutils.ensure_tree(self.master_path)
+        path = os.path.join(self.temp_dir, 'download')
+        return path, pxe._fetch_master_image_from_peers(self.master_image,
+                                                        path)
+
+    def test_fetch_from_peer(self):
+        self._advertise('peer1')
+        path, checksum = self._fetch()
+        self.assertEqual(hashlib.sha1('raw image').hexdigest(), checksum)
+        with open(path) as f:
+            self.assertEqual('raw image', f.read())
+
+    def test_fetch_skips_broken_peers(self):
+        self._advertise('peer1', path='missing')
+        # the checksum a peer advertises is not trusted
+        self._advertise('peer2', path='other', content='other image')
+        self.assertIsNone(self._fetch()[1])
+
+        self._advertise('peer1')
+        self.assertIsNotNone(self._fetch()[1])
+
+    def test_fetch_disabled(self):
+        self.config(share_master_images=False, group='pxe')
+        self._advertise('peer1')
+        self.assertIsNone(self._fetch()[1])
+
+    def test_fetch_skips_own_advertisement(self):
+        self._advertise('local-host')
+        self.assertIsNone(self._fetch()[1])
+
+    def test_fetch_only_shared_images(self):
+        self._advertise('peer1')
+        self.assertIsNone(pxe._fetch_master_image_from_peers(
+                os.path.join(self.master_path, 'image_uuid'),
+                os.path.join(self.temp_dir, 'download')))
+
+    @mock.patch.object(images, 'fetch_to_raw')
+    @mock.patch.object(pxe, '_lookup_master_image_path')
+    def test__get_image_from_peer(self, lookup_mock, fetch_mock):
+        lookup_mock.return_value = self.master_image
+        self._advertise('peer1')
+        path = os.path.join(self.temp_dir, 'instance')
+
+        with mock.patch.object(pxe, '_hash_image') as hash_mock:
+            pxe._get_image(None, path, 'glance://image_uuid',
+                           self.master_path)
+            # the checksum computed while downloading is advertised
+            self.assertFalse(hash_mock.called)
+
+        self.assertFalse(fetch_mock.called)
+        with open(path) as f:
+            self.assertEqual('raw image', f.read())
+        # this conductor now serves the image as well
+        peers = self.dbapi.get_master_image_peers(self.checksum, 60)
+        self.assertEqual(['local-host', 'peer1'],
+                         sorted(p['hostname'] for p in peers))
+        local = [p for p in peers if p['hostname'] == 'local-host'][0]
+        self.assertEqual('http://local-host/master/md5-' + self.checksum,
+                         local['url'])
+
+    @mock.patch.object(images, 'fetch_to_raw')
+    @mock.patch.object(pxe, '_lookup_master_image_path')
+    def test__get_image_falls_back_to_glance(self, lookup_mock, fetch_mock):
+        def fake_fetch(ctx, uuid, path, image_service, decompress):
+            with open(path, 'w') as f:
+                f.write('raw image')
+            # stored unchanged
+            return True
+
+        def fake_hash(path):
+            # the image is hashed once deploys waiting for it can go on
+            self.assertFalse(os.path.exists(self.master_image + '.lock'))
+            return hash_image(path)
+
+        lookup_mock.return_value = self.master_image
+        fetch_mock.side_effect = fake_fetch
+        path = os.path.join(self.temp_dir, 'instance')
+
+        hash_image = pxe._hash_image
+        with mock.patch.object(pxe, '_hash_image') as hash_mock:
+            hash_mock.side_effect = fake_hash
+            pxe._get_image(None, path, 'glance://image_uuid',
+                           self.master_path)
+            self.assertEqual(1, hash_mock.call_count)
+
+        self.assertTrue(fetch_mock.called)
+        peers = self.dbapi.get_master_image_peers(self.checksum, 60)
+        self.assertEqual([hashlib.sha1('raw image').hexdigest()],
+                         [p['content_checksum'] for p in peers])
+
+    @mock.patch.object(images, 'fetch_to_raw')
+    @mock.patch.object(pxe, '_lookup_master_image_path')
+    def test__get_image_peer_mismatch(self, lookup_mock, fetch_mock):
+        def fake_fetch(ctx, uuid, path, image_service, decompress):
+            with open(path, 'w') as f:
+                f.write('raw image')
+            return True
+
+        lookup_mock.return_value = self.master_image
+        fetch_mock.side_effect = fake_fetch
+        self._advertise('peer1', path='other', content='other image')
+        path = os.path.join(self.temp_dir, 'instance')
+
+        pxe._get_image(None, path, 'glance://image_uuid', self.master_path)
+
+        # the image is fetched from Glance instead
+        self.assertTrue(fetch_mock.called)
+        with open(path) as f:
+            self.assertEqual('raw image', f.read())
+
+    @mock.patch.object(images, 'fetch_to_raw')
+    @mock.patch.object(pxe, '_lookup_master_image_path')
+    def test__get_image_converted_not_advertised(self, lookup_mock,
+                                                 fetch_mock):
+        def fake_fetch(ctx, uuid, path, image_service, decompress):
+            with open(path, 'w') as f:
+                f.write('converted image')
+            return False
+
+        lookup_mock.return_value = self.master_image
+        fetch_mock.side_effect = fake_fetch
+        path = os.path.join(self.temp_dir, 'instance')
+
+        pxe._get_image(None, path, 'glance://image_uuid', self.master_path)
+
+        # its peers could not check it against the Glance checksum
+        self.assertEqual([], self.dbapi.get_master_image_peers(self.checksum,
+                                                               60))
+
+        # deleting the last user of the master image withdraws it
+        os.unlink(path)
+        pxe._unlink_master_image(self.master_image)
+        self.assertEqual([], self.dbapi.get_master_image_peers(
+                                                        self.checksum, 60))
+
+    @mock.patch.object(images, 'fetch_to_raw')
+    @mock.patch.object(pxe, '_lookup_master_image_path')
+    def test__get_image_keeps_glance_checksum(self, lookup_mock, fetch_mock):
+        def fake_fetch(ctx, uuid, path, image_service, decompress):
+            with open(path, 'w') as f:
+                f.write('glance image')
+            return unchanged
+
+        lookup_mock.return_value = self.master_image
+        fetch_mock.side_effect = fake_fetch
+        self.config(master_images_url=None, group='pxe')
+
+        # the image was stored as glance gave it
+        unchanged = True
+        path = os.path.join(self.temp_dir, 'instance')
+        pxe._get_image(None, path, 'glance://image_uuid', self.master_path)
+        with mock.patch.object(pxe, '_hash_image') as hash_mock:
+            self.assertEqual(('md5', self.checksum),
+                             pxe._get_image_checksum(path))
+            self.assertFalse(hash_mock.called)
+
+        # the image was converted
+        os.unlink(path)
+        pxe._unlink_master_image(self.master_image)
+        unchanged = False
+        pxe._get_image(None, path, 'glance://image_uuid', self.master_path)
+        self.assertEqual(('sha1', hashlib.sha1('glance image').hexdigest()),
+                         pxe._get_image_checksum(path))
@@ -56,7 +56,7 @@ class TestChassisObject(base.DbTestCase):
 
                 mock_get_chassis.assert_called_once_with(uuid)
                 mock_update_chassis.assert_called_once_with(
-                        uuid, {'extra': {"test": 123}})
+                        uuid, {'extra': {"test": 123}}, expected=None)
 
     def test_refresh(self):
         uuid = self.fake_chassis['uuid']
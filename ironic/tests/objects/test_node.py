@@ -54,7 +54,8 @@ class TestNodeObject(base.DbTestCase):
 
                 mock_get_node.assert_called_once_with(uuid)
                 mock_update_node.assert_called_once_with(
-                        uuid, {'properties': {"fake": "property"}})
+                        uuid, {'properties': {"fake": "property"}},
+                        expected=None)
 
     def test_refresh(self):
         uuid = self.fake_node['uuid']
@@ -18,12 +18,16 @@
 
 import datetime
 import filecmp
+import fixtures
 import os
 import tempfile
 import testtools
 
+import mock
+
 from ironic.common import exception
 from ironic.common.glance_service import base_image_service
+from ironic.common.glance_service import client_pool
 from ironic.common.glance_service import service_utils
 from ironic.common import image_service as service
 from ironic.openstack.common import context
@@ -98,6 +102,8 @@ class TestGlanceImageService(base.TestCase):
         self.context.user_id = 'fake'
         self.context.project_id = 'fake'
         self.service = service.Service(client, 1, self.context)
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.common.glance_service.client_pool._POOL', None))
 
         CONF.set_default('glance_host', 'localhost', group='glance')
         try:
@@ -602,6 +608,46 @@ class TestGlanceImageService(base.TestCase):
         self.assertEqual(('https://123.123.123.123:9292', (), params),
                          wrapped_func(self.service, **params))
 
+    def test_check_image_service_reuses_pooled_client(self):
+        def func(service, *args, **kwargs):
+            return service.client
+
+        params = {'image_href': 'http://123.123.123.123:9292/image_uuid'}
+        self.config(auth_strategy='keystone', group='glance')
+        wrapped_func = base_image_service.check_image_service(func)
+        self.service.client = None
+        first = wrapped_func(self.service, **params)
+        other = service.Service(None, 1, self.context)
+        self.assertIs(first, wrapped_func(other, **params))
+
+    def test_unauthorized_evicts_pooled_client(self):
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client that raises an Unauthorized exception."""
+            def get(self, image_id):
+                raise exception.Unauthorized(image_id)
+
+        stub_client = MyGlanceStubClient()
+        pool = client_pool.get_pool()
+        with mock.patch.object(client_pool.client, 'Client',
+                               return_value=stub_client):
+            pool.get(1, 'http://127.0.0.1:9292', token='t')
+        self.assertEqual(1, len(pool))
+        stub_service = service.Service(stub_client, 1, self.context)
+        self.assertRaises(exception.NotAuthorized,
+                          stub_service.show, 'image_uuid')
+        self.assertEqual(0, len(pool))
+
+    @mock.patch('random.uniform')
+    def test_retry_interval_backoff(self, mock_uniform):
+        mock_uniform.side_effect = lambda a, b: b
+        self.assertEqual(1, base_image_service._retry_interval(1))
+        self.assertEqual(4, base_image_service._retry_interval(3))
+        self.assertEqual(base_image_service._MAX_RETRY_INTERVAL,
+                         base_image_service._retry_interval(20))
+        mock_uniform.assert_called_with(
+                base_image_service._MAX_RETRY_INTERVAL / 2.0,
+                base_image_service._MAX_RETRY_INTERVAL)
+
 
 def _create_failing_glance_client(info):
     class MyGlanceStubClient(stubs.StubGlanceClient):
@@ -615,6 +661,73 @@ def _create_failing_glance_client(info):
     return MyGlanceStubClient()
 
 
+@mock.patch.object(client_pool.client, 'Client')
+class TestGlanceClientPool(base.TestCase):
+
+    def setUp(self):
+        super(TestGlanceClientPool, self).setUp()
+        self.pool = client_pool.GlanceClientPool(2, 60)
+
+    def test_get_reuses_client(self, mock_client):
+        mock_client.side_effect = lambda *a, **k: object()
+        c1 = self.pool.get(1, 'http://a:9292', token='t')
+        self.assertIs(c1, self.pool.get(1, 'http://a:9292', token='t'))
+        mock_client.assert_called_once_with(1, 'http://a:9292',
+                                            insecure=False, token='t')
+
+    def test_get_keys_on_all_params(self, mock_client):
+        mock_client.side_effect = lambda *a, **k: object()
+        self.pool = client_pool.GlanceClientPool(10, 60)
+        c1 = self.pool.get(1, 'http://a:9292', token='t')
+        self.assertIsNot(c1, self.pool.get(2, 'http://a:9292', token='t'))
+        self.assertIsNot(c1, self.pool.get(1, 'http://b:9292', token='t'))
+        self.assertIsNot(c1, self.pool.get(1, 'http://a:9292', token='u'))
+        self.assertIsNot(c1, self.pool.get(1, 'http://a:9292', token='t',
+                                           insecure=True))
+        self.assertEqual(5, len(self.pool))
+
+    def test_get_no_token(self, mock_client):
+        self.pool.get(1, 'http://a:9292')
+        mock_client.assert_called_once_with(1, 'http://a:9292',
+                                            insecure=False)
+
+    def test_size_cap_evicts_least_recently_used(self, mock_client):
+        mock_client.side_effect = lambda *a, **k: object()
+        c1 = self.pool.get(1, 'http://a:9292')
+        c2 = self.pool.get(1, 'http://b:9292')
+        self.pool.get(1, 'http://a:9292')
+        self.pool.get(1, 'http://c:9292')
+        self.assertEqual(2, len(self.pool))
+        self.assertIs(c1, self.pool.get(1, 'http://a:9292'))
+        self.assertIsNot(c2, self.pool.get(1, 'http://b:9292'))
+
+    @mock.patch('time.time')
+    def test_ttl_expiry_rebuilds_client(self, mock_time, mock_client):
+        mock_client.side_effect = lambda *a, **k: object()
+        mock_time.return_value = 1000
+        c1 = self.pool.get(1, 'http://a:9292', token='t')
+        mock_time.return_value = 1059
+        self.assertIs(c1, self.pool.get(1, 'http://a:9292', token='t'))
+        mock_time.return_value = 1060
+        self.assertIsNot(c1, self.pool.get(1, 'http://a:9292', token='t'))
+
+    def test_evict(self, mock_client):
+        mock_client.side_effect = lambda *a, **k: object()
+        c1 = self.pool.get(1, 'http://a:9292')
+        self.pool.get(1, 'http://b:9292')
+        self.pool.evict(c1)
+        self.assertEqual(1, len(self.pool))
+        self.assertIsNot(c1, self.pool.get(1, 'http://a:9292'))
+
+    def test_get_pool_is_shared(self, mock_client):
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.common.glance_service.client_pool._POOL', None))
+        self.config(glance_client_pool_size=5, group='glance')
+        pool = client_pool.get_pool()
+        self.assertIs(pool, client_pool.get_pool())
+        self.assertEqual(5, pool.max_size)
+
+
 class TestGlanceUrl(base.TestCase):
 
     def test_generate_glance_http_url(self):
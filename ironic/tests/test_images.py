@@ -18,9 +18,16 @@
 
 import contextlib
 import fixtures
+import gzip
+import mock
+import os
+import StringIO
+import subprocess
+import tempfile
 
 from ironic.common import exception
 from ironic.common import images
+from ironic.common import utils
 from ironic.openstack.common import excutils
 from ironic.tests import base
 
@@ -73,7 +80,7 @@ class IronicImagesTestCase(base.TestCase):
         self.useFixture(fixtures.MonkeyPatch('os.rename', fake_rename))
         self.useFixture(fixtures.MonkeyPatch('os.unlink', fake_unlink))
         self.useFixture(fixtures.MonkeyPatch(
-                'ironic.common.images.fetch', lambda *_: None))
+                'ironic.common.images.fetch', lambda *_: True))
         self.useFixture(fixtures.MonkeyPatch(
                 'ironic.common.images.qemu_img_info', fake_qemu_img_info))
         self.useFixture(fixtures.MonkeyPatch(
@@ -92,13 +99,13 @@ class IronicImagesTestCase(base.TestCase):
                               't.qcow2.part', 't.qcow2.converted'),
                              ('rm', 't.qcow2.part'),
                              ('mv', 't.qcow2.converted', 't.qcow2')]
-        images.fetch_to_raw(context, image_id, target)
+        self.assertFalse(images.fetch_to_raw(context, image_id, target))
         self.assertEqual(self.executes, expected_commands)
 
         target = 't.raw'
         self.executes = []
         expected_commands = [('mv', 't.raw.part', 't.raw')]
-        images.fetch_to_raw(context, image_id, target)
+        self.assertTrue(images.fetch_to_raw(context, image_id, target))
         self.assertEqual(self.executes, expected_commands)
 
         target = 'backing.qcow2'
@@ -110,3 +117,168 @@ class IronicImagesTestCase(base.TestCase):
         self.assertEqual(self.executes, expected_commands)
 
         del self.executes
+
+
+class FakeImageService(object):
+    """Image service sending data in chunks of chunk_size bytes."""
+
+    def __init__(self, data, chunk_size=7):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def download(self, image_href, image_file):
+        for i in range(0, len(self.data), self.chunk_size):
+            image_file.write(self.data[i:i + self.chunk_size])
+
+
+class FetchDecompressTestCase(base.TestCase):
+
+    IMAGE = ''.join(chr(i % 251) for i in range(100000))
+
+    def _gzip(self, data):
+        out = StringIO.StringIO()
+        f = gzip.GzipFile(fileobj=out, mode='wb')
+        f.write(data)
+        f.close()
+        return out.getvalue()
+
+    def _fetch(self, data, chunk_size=7, **kwargs):
+        path = os.path.join(tempfile.mkdtemp(), 'image')
+        images.fetch(None, 'image_uuid', path,
+                     FakeImageService(data, chunk_size), **kwargs)
+        with open(path) as f:
+            return f.read()
+
+    def test_fetch_not_compressed(self):
+        self.assertEqual(self.IMAGE, self._fetch(self.IMAGE))
+        self.assertEqual('tiny', self._fetch('tiny'))
+        self.assertEqual('', self._fetch(''))
+
+    def test_fetch_gzip(self):
+        self.assertEqual(self.IMAGE, self._fetch(self._gzip(self.IMAGE)))
+
+    def test_fetch_gzip_several_members(self):
+        data = self._gzip(self.IMAGE[:500]) + self._gzip(self.IMAGE[500:])
+        self.assertEqual(self.IMAGE, self._fetch(data))
+
+    def test_fetch_unchanged(self):
+        path = os.path.join(tempfile.mkdtemp(), 'image')
+        self.assertTrue(images.fetch(None, 'image_uuid', path,
+                                     FakeImageService(self.IMAGE)))
+        self.assertFalse(images.fetch(None, 'image_uuid', path,
+                                      FakeImageService(
+                                            self._gzip(self.IMAGE))))
+        self.assertTrue(images.fetch(None, 'image_uuid', path,
+                                     FakeImageService(self._gzip(self.IMAGE)),
+                                     decompress=False))
+
+    def test_fetch_gzip_no_decompress(self):
+        data = self._gzip(self.IMAGE)
+        self.assertEqual(data, self._fetch(data, decompress=False))
+
+    def test_fetch_gzip_corrupted(self):
+        data = self._gzip(self.IMAGE)
+        data = data[:100] + 'garbage' + data[107:]
+        self.assertRaises(exception.ImageUnacceptable, self._fetch, data)
+
+    def test_fetch_xz(self):
+        xz = subprocess.Popen(['xz', '--compress', '--stdout'],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        data = xz.communicate(self.IMAGE)[0]
+        self.assertEqual(self.IMAGE, self._fetch(data, chunk_size=4096))
+
+    def test_fetch_xz_corrupted(self):
+        data = images._XZ_MAGIC + 'garbage' * 100
+        self.assertRaises(exception.ImageUnacceptable, self._fetch, data)
+
+
+class QemuImgInfoTestCase(base.TestCase):
+
+    JSON_OUTPUT = """{
+        "virtual-size": 10737418240,
+        "filename": "/fake/image",
+        "cluster-size": 65536,
+        "format": "qcow2",
+        "actual-size": 200704,
+        "dirty-flag": false
+    }"""
+
+    HUMAN_OUTPUT = """image: /fake/image
+file format: qcow2
+virtual size: 10G (10737418240 bytes)
+disk size: 196K
+cluster_size: 65536
+"""
+
+    def setUp(self):
+        super(QemuImgInfoTestCase, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.common.images._INFO_CACHE', utils.LRUCache(128)))
+        self.stat = mock.Mock(st_ino=1, st_size=200704, st_mtime=1.5)
+        self.useFixture(fixtures.MonkeyPatch('os.stat',
+                                             lambda path: self.stat))
+
+    def test_parse_json(self):
+        info = images.QemuImgInfo(self.JSON_OUTPUT, format='json')
+        self.assertEqual('/fake/image', info.image)
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual(10737418240, info.virtual_size)
+        self.assertEqual(65536, info.cluster_size)
+        self.assertEqual(200704, info.disk_size)
+        self.assertIsNone(info.backing_file)
+        self.assertEqual([], info.snapshots)
+
+    def test_parse_json_backing_file(self):
+        info = images.QemuImgInfo('{"format": "qcow2", '
+                                  '"backing-filename": "base", '
+                                  '"full-backing-filename": "/path/base"}',
+                                  format='json')
+        self.assertEqual('/path/base', info.backing_file)
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_img_info_json(self, execute_mock):
+        execute_mock.return_value = (self.JSON_OUTPUT, '')
+        info = images.qemu_img_info('/fake/image')
+        self.assertEqual('qcow2', info.file_format)
+        execute_mock.assert_called_once_with('env', 'LC_ALL=C', 'LANG=C',
+                                             'qemu-img', 'info',
+                                             '--output=json', '/fake/image')
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_img_info_human_fallback(self, execute_mock):
+        execute_mock.side_effect = [exception.ProcessExecutionError(),
+                                    (self.HUMAN_OUTPUT, '')]
+        info = images.qemu_img_info('/fake/image')
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual(10737418240, info.virtual_size)
+        self.assertEqual(mock.call('env', 'LC_ALL=C', 'LANG=C',
+                                   'qemu-img', 'info', '/fake/image'),
+                         execute_mock.call_args)
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_img_info_cached(self, execute_mock):
+        execute_mock.return_value = (self.JSON_OUTPUT, '')
+        info = images.qemu_img_info('/fake/image')
+        self.assertIs(info, images.qemu_img_info('/fake/image'))
+        self.assertEqual(1, execute_mock.call_count)
+
+        # a modified file is inspected again
+        self.stat.st_mtime = 2.5
+        images.qemu_img_info('/fake/image')
+        self.assertEqual(2, execute_mock.call_count)
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_img_info_cache_size(self, execute_mock):
+        self.useFixture(fixtures.MonkeyPatch(
+                'ironic.common.images._INFO_CACHE', utils.LRUCache(2)))
+        execute_mock.return_value = (self.JSON_OUTPUT, '')
+        for path in ('a', 'b', 'a', 'c'):
+            images.qemu_img_info(path)
+        self.assertEqual(3, execute_mock.call_count)
+        self.assertEqual(['a', 'c'],
+                         [key[0] for key in images._INFO_CACHE])
+
+    def test_qemu_img_info_missing_file(self):
+        self.useFixture(fixtures.MonkeyPatch('os.stat', os.lstat))
+        info = images.qemu_img_info('/this/path/does/not/exist')
+        self.assertIsNone(info.file_format)
@@ -13,8 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
 import fixtures
 from keystoneclient import exceptions as ksexception
+import mock
 
 from ironic.common import exception
 from ironic.common import keystone
@@ -29,6 +31,9 @@ class KeystoneTestCase(base.TestCase):
                     auth_uri='http://127.0.0.1:9898/',
                     admin_user='fake', admin_password='fake',
                     admin_tenant_name='fake')
+        self.useFixture(fixtures.MonkeyPatch(
+                        'ironic.common.keystone._SESSION',
+                        keystone.KeystoneSession()))
 
     def test_failure_authorization(self):
         self.assertRaises(exception.CatalogFailure, keystone.get_service_url)
@@ -100,3 +105,58 @@ class KeystoneTestCase(base.TestCase):
 
         self.assertRaises(exception.CatalogUnauthorized,
                           keystone.get_service_url)
+
+
+class KeystoneSessionTestCase(base.TestCase):
+
+    def setUp(self):
+        super(KeystoneSessionTestCase, self).setUp()
+        self.config(catalog_ttl=600, token_stale_duration=120,
+                    group='keystone')
+        self.session = keystone.KeystoneSession()
+        self.clients = []
+        test = self
+
+        class _fake_client:
+            def __init__(self, **kwargs):
+                # let other green threads run while "authenticating"
+                eventlet.sleep(0)
+                self.auth_ref = mock.Mock()
+                self.auth_ref.will_expire_soon.return_value = False
+                test.clients.append(self)
+
+            def has_service_catalog(self):
+                return True
+
+        self.useFixture(fixtures.MonkeyPatch(
+                        'keystoneclient.v2_0.client.Client',
+                        _fake_client))
+        p = mock.patch('time.time')
+        self.time_mock = p.start()
+        self.time_mock.return_value = 1000
+        self.addCleanup(p.stop)
+
+    def test_client_reused(self):
+        client = self.session.get_client()
+        self.time_mock.return_value = 1599
+        self.assertIs(client, self.session.get_client())
+        self.assertEqual(1, len(self.clients))
+
+    def test_catalog_ttl(self):
+        client = self.session.get_client()
+        self.time_mock.return_value = 1600
+        self.assertIsNot(client, self.session.get_client())
+        self.assertEqual(2, len(self.clients))
+
+    def test_token_expires_soon(self):
+        client = self.session.get_client()
+        client.auth_ref.will_expire_soon.return_value = True
+        self.assertIsNot(client, self.session.get_client())
+        client.auth_ref.will_expire_soon.assert_called_with(120)
+
+    def test_concurrent_refresh_coalesced(self):
+        pool = eventlet.GreenPool()
+        clients = list(pool.imap(lambda i: self.session.get_client(),
+                                 range(10)))
+        self.assertEqual(1, len(self.clients))
+        self.assertEqual([self.clients[0]] * 10, clients)
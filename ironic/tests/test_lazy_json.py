@@ -0,0 +1,46 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# coding=utf-8
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from ironic.common import lazy_json
+from ironic.tests import base
+
+
+class LazyJSONDictTestCase(base.TestCase):
+
+    def test_decoded_on_access(self):
+        d = lazy_json.LazyJSONDict('{"a": 1, "b": {"c": 2}}')
+        self.assertFalse(d.loaded)
+        self.assertEqual(1, d['a'])
+        self.assertTrue(d.loaded)
+        self.assertEqual({'a': 1, 'b': {'c': 2}}, d)
+        self.assertEqual(['a', 'b'], sorted(d))
+        self.assertEqual(2, len(d))
+        self.assertEqual({'c': 2}, d.get('b'))
+
+    def test_legacy_default(self):
+        d = lazy_json.LazyJSONDict('"{}"')
+        self.assertEqual({}, d.load())
+
+    def test_to_json_not_loaded(self):
+        text = '{"b": 2,   "a": 1}'
+        d = lazy_json.LazyJSONDict(text)
+        self.assertIs(text, d.to_json())
+        self.assertFalse(d.loaded)
+
+    def test_to_json_modified(self):
+        d = lazy_json.LazyJSONDict('{"a": 1}')
+        d['b'] = 2
+        del d['a']
+        self.assertEqual('{"b": 2}', d.to_json())
@@ -321,6 +321,39 @@ class GenericUtilsTestCase(base.TestCase):
         self.assertEqual(utils.safe_rstrip(value), value)
 
 
+class LRUCacheTestCase(base.TestCase):
+
+    def test_forgets_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+
+        self.assertEqual(['a', 'c'], list(cache))
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+
+    def test_set_existing_key(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 3
+
+        self.assertEqual([('b', 2), ('a', 3)], cache.items())
+
+    def test_pop_and_del(self):
+        cache = utils.LRUCache(3)
+        cache['a'] = 1
+        cache['b'] = 2
+
+        self.assertEqual(1, cache.pop('a'))
+        self.assertIsNone(cache.pop('a'))
+        del cache['b']
+        self.assertEqual(0, len(cache))
+        self.assertEqual([], list(cache))
+
+
 class MkfsTestCase(base.TestCase):
 
     def test_mkfs(self):
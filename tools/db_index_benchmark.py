@@ -0,0 +1,152 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the latency of the hot path queries against a synthetic inventory,
+before and after the indexes added by migration 015.
+
+Usage: python tools/db_index_benchmark.py [--nodes N] [--connection URL]
+
+The database at URL is dropped and recreated; it defaults to a temporary
+sqlite file.
+"""
+
+import __builtin__
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from migrate.versioning import api as versioning_api
+import sqlalchemy
+
+__builtin__.__dict__.setdefault('_', lambda msg: msg)
+
+REPOSITORY = os.path.join(os.path.dirname(__file__), os.pardir, 'ironic',
+                          'db', 'sqlalchemy', 'migrate_repo')
+
+PROVISION_STATES = [None, 'deploying', 'deploy complete', 'deploy failed']
+POWER_STATES = ['power on', 'power off', None]
+
+
+def populate(engine, meta, nodes, conductors):
+    now = datetime.datetime.utcnow()
+    chassis_count = max(1, nodes // 40)
+    engine.execute(meta.tables['chassis'].insert(),
+                   [{'id': i + 1, 'uuid': str(uuid.uuid4())}
+                    for i in range(chassis_count)])
+    engine.execute(meta.tables['conductors'].insert(),
+                   [{'id': i + 1, 'hostname': 'conductor-%d' % i,
+                     'drivers': '[]',
+                     'updated_at': now - datetime.timedelta(
+                                          seconds=random.randint(0, 3600))}
+                    for i in range(conductors)])
+    rows = []
+    for i in range(nodes):
+        rows.append({'id': i + 1,
+                     'uuid': str(uuid.uuid4()),
+                     'chassis_id': random.randint(1, chassis_count),
+                     'provision_state': random.choice(PROVISION_STATES),
+                     'power_state': random.choice(POWER_STATES),
+                     'reservation': (random.random() < 0.01 and
+                                     'conductor-%d' % (i % conductors)
+                                     or None),
+                     'driver': 'pxe_ipmitool'})
+    engine.execute(meta.tables['nodes'].insert(), rows)
+    engine.execute(meta.tables['ports'].insert(),
+                   [{'id': i + 1, 'uuid': str(uuid.uuid4()),
+                     'address': '52:54:%02x:%02x:%02x:%02x' % (
+                                    (i >> 24) & 0xff, (i >> 16) & 0xff,
+                                    (i >> 8) & 0xff, i & 0xff),
+                     'node_id': i // 2 + 1}
+                    for i in range(nodes * 2)])
+
+
+def queries(meta, nodes):
+    n = meta.tables['nodes']
+    p = meta.tables['ports']
+    c = meta.tables['conductors']
+    limit = datetime.datetime.utcnow() - datetime.timedelta(seconds=60)
+    return [
+        ('nodes by reservation',
+         lambda: n.select().where(n.c.reservation == 'conductor-1')),
+        ('nodes by chassis',
+         lambda: n.select().where(n.c.chassis_id ==
+                                  random.randint(1, max(1, nodes // 40))).
+                 order_by(n.c.id).limit(100)),
+        ('nodes by provision/power state',
+         lambda: n.select().where(n.c.provision_state == 'deploy failed').
+                 where(n.c.power_state == 'power on').
+                 order_by(n.c.id).limit(100)),
+        ('ports by node',
+         lambda: p.select().where(p.c.node_id == random.randint(1, nodes)).
+                 order_by(p.c.id).limit(100)),
+        ('active conductors',
+         lambda: sqlalchemy.select([c.c.hostname]).
+                 where(c.c.updated_at >= limit)),
+    ]
+
+
+def measure(engine, meta, nodes, repeat):
+    results = {}
+    for name, query in queries(meta, nodes):
+        start = time.time()
+        for i in range(repeat):
+            engine.execute(query()).fetchall()
+        results[name] = (time.time() - start) * 1000.0 / repeat
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--nodes', type=int, default=20000)
+    parser.add_argument('--conductors', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--connection')
+    args = parser.parse_args()
+
+    url = args.connection
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        url = 'sqlite:///%s' % path
+    engine = sqlalchemy.create_engine(url)
+    meta = sqlalchemy.MetaData()
+    meta.reflect(bind=engine)
+    meta.drop_all(bind=engine)
+
+    versioning_api.version_control(engine, REPOSITORY, 0)
+    versioning_api.upgrade(engine, REPOSITORY, 14)
+    meta = sqlalchemy.MetaData()
+    meta.reflect(bind=engine)
+    populate(engine, meta, args.nodes, args.conductors)
+    before = measure(engine, meta, args.nodes, args.repeat)
+
+    versioning_api.upgrade(engine, REPOSITORY, 15)
+    after = measure(engine, meta, args.nodes, args.repeat)
+
+    print('%d nodes, %d ports, %d conductors on %s' %
+          (args.nodes, args.nodes * 2, args.conductors,
+           engine.url.drivername))
+    print('%-32s %12s %12s' % ('query', 'before (ms)', 'after (ms)'))
+    for name, query in queries(meta, args.nodes):
+        print('%-32s %12.3f %12.3f' % (name, before[name], after[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# -*- encoding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the cost of turning node rows into Node objects, with the JSON
+columns decoded eagerly (JSONEncodedDict) or lazily (LazyJSONEncodedDict).
+
+Usage: python tools/node_hydration_benchmark.py [--nodes N] [--repeat R]
+"""
+
+import __builtin__
+import argparse
+import json
+import time
+import uuid
+
+__builtin__.__dict__.setdefault('_', lambda msg: msg)
+
+from ironic.db.sqlalchemy import models
+from ironic import objects
+
+DRIVER_INFO = {'ipmi_address': '10.1.2.3', 'ipmi_username': 'admin',
+               'ipmi_password': 'secret', 'ipmi_terminal_port': 8023,
+               'pxe_deploy_kernel': str(uuid.uuid4()),
+               'pxe_deploy_ramdisk': str(uuid.uuid4()),
+               'pxe_image_source': str(uuid.uuid4()),
+               'pxe_root_gb': 10, 'pxe_swap_mb': 1024,
+               'pxe_deploy_key': 'A' * 32}
+PROPERTIES = {'cpu_arch': 'x86_64', 'cpu_num': 24, 'memory_mb': 131072,
+              'local_gb': 1200, 'disks': ['sda', 'sdb', 'sdc', 'sdd'],
+              'nics': {'eth0': '52:54:00:cf:2d:31',
+                       'eth1': '52:54:00:cf:2d:32'}}
+EXTRA = {'rack': 'r12', 'row': 'b', 'owner': 'batch', 'tags': ['a', 'b']}
+
+
+def rows(count):
+    columns = {'properties': json.dumps(PROPERTIES),
+               'driver_info': json.dumps(DRIVER_INFO),
+               'extra': json.dumps(EXTRA)}
+    result = []
+    for i in range(count):
+        row = dict((k, None) for k in objects.Node.fields)
+        row.update(columns, id=i, uuid=str(uuid.uuid4()),
+                   driver='pxe_ipmitool', power_state='power on')
+        result.append(row)
+    return result
+
+
+def hydrate(column_type, rows, read):
+    nodes = []
+    for row in rows:
+        db_node = dict(row)
+        for column in ('properties', 'driver_info', 'extra'):
+            db_node[column] = column_type.process_result_value(db_node[column],
+                                                               None)
+        node = objects.Node._from_db_object(objects.Node(), db_node)
+        if read:
+            for column in read:
+                getattr(node, column)
+        nodes.append(node)
+    return nodes
+
+
+def measure(column_type, rows, read, repeat):
+    start = time.time()
+    for i in range(repeat):
+        hydrate(column_type, rows, read)
+    return (time.time() - start) * 1000.0 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--nodes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    data = rows(args.nodes)
+    cases = [('no JSON field read', ()),
+             ('driver_info read', ('driver_info',)),
+             ('every JSON field read', ('properties', 'driver_info',
+                                        'extra'))]
+    print('%d nodes, milliseconds per batch' % args.nodes)
+    print('%-24s %10s %10s' % ('access', 'eager', 'lazy'))
+    for name, read in cases:
+        eager = measure(models.JSONEncodedDict(), data, read, args.repeat)
+        lazy = measure(models.LazyJSONEncodedDict(), data, read, args.repeat)
+        print('%-24s %10.1f %10.1f' % (name, eager, lazy))
+
+
+if __name__ == '__main__':
+    main()